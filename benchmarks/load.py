@@ -0,0 +1,304 @@
+'''
+Websocket load generator for the Bokeh apps.
+
+    python benchmarks/load.py                                  # start the apps, 1 5 10 25 sessions
+    python benchmarks/load.py --sessions 10 50 --actions 30 -o load.json
+    python benchmarks/load.py --url http://host:5006 --apps DP_METER_SOLVER
+
+Opens N headless sessions per app over raw websockets speaking the Bokeh
+protocol (PULL-DOC to find the widgets, PATCH-DOC to edit them), so the
+server sees exactly what a browser sends.  Every session replays a random
+sequence of engineer actions (density and pressure edits, dP range slider
+drags, meter type changes) with a think time in between, and times each
+action from its last websocket message to the first update of the plotted
+ColumnDataSource coming back.  The DP meter solver debounces edits, its
+latencies include the debounce window.
+
+Without --url a bokeh serve process with all three apps is started on
+--port and stopped at the end.  Results are printed per app and concurrency
+level as p50/p95/p99 and written as JSON with --output.
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+import numpy as np
+
+from tornado.websocket import websocket_connect
+
+from bokeh.protocol import Protocol
+from bokeh.protocol.receiver import Receiver
+from bokeh.util.token import generate_jwt_token, generate_session_id
+
+
+APPS = ['GASFLOW', 'LIQUIDFLOW', 'DP_METER_SOLVER']
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'openet')
+
+DATA_EVENTS = ('ColumnDataChanged', 'ColumnsPatched', 'ColumnsStreamed')
+
+METERS = ['ISO 5167 orifice', 'long radius nozzle', 'machined convergent venturi tube', 'cone meter',
+          'Miller orifice', 'wedge meter']
+
+
+# Engineer actions
+# ---------------------------------
+# Each returns the (widget title, attribute, value) edits of one action
+
+def edit_density(rng):
+    return [(('Density [Kg/M3]',), 'value', '%.1f' % rng.uniform(600, 900))]
+
+
+def edit_pressure(rng):
+    return [(('Pressure [PSIG]', 'Upstream Pressure [PSIG]'), 'value', '%.1f' % rng.uniform(50, 500))]
+
+
+def drag_range(rng):
+    # A few intermediate values while dragging, value_throttled on release
+    title = ('dP Range [Inch H2O]',)
+    ends = np.linspace(rng.uniform(100, 400), rng.uniform(400, 1000), 4).round()
+    edits = [(title, 'value', [1, int(end)]) for end in ends]
+    return edits + [(title, 'value_throttled', [1, int(ends[-1])])]
+
+
+def change_meter(rng):
+    return [(('Meter Type:',), 'value', rng.choice(METERS))]
+
+
+ACTIONS = {
+    'GASFLOW': [edit_density, edit_pressure, drag_range],
+    'LIQUIDFLOW': [edit_density, edit_pressure, drag_range],
+    'DP_METER_SOLVER': [edit_density, edit_pressure, drag_range, change_meter],
+}
+
+
+# Headless session
+# ---------------------------------
+
+class LoadSession():
+    """One websocket session on an app, tracking the ids of its widgets and plotted sources"""
+
+    def __init__(self, url, app):
+        self.url = url.replace('http', 'ws', 1).rstrip('/') + '/%s/ws' % app
+        self.protocol = Protocol()
+        self.receiver = Receiver(self.protocol)
+        self.socket = None
+        self.widgets = {}
+        self.values = {}
+        self.sources = set()
+        self._msgid = 0
+
+    async def connect(self):
+        token = generate_jwt_token(generate_session_id())
+        self.socket = await websocket_connect(self.url, subprotocols=['bokeh', token])
+        # As browsers do, otherwise multi frame messages wait on delayed ACKs
+        self.socket.stream.set_nodelay(True)
+
+        await self._expect('ACK')
+        await self._send('PULL-DOC-REQ', {})
+        reply = await self._expect('PULL-DOC-REPLY')
+
+        for model in reply.content['doc']['roots']['references']:
+            attributes = model['attributes']
+            if model['type'] == 'ColumnDataSource' and {'x', 'y'} <= set(attributes.get('data', {})):
+                self.sources.add(model['id'])
+            elif 'title' in attributes and isinstance(attributes['title'], str):
+                self.widgets[attributes['title']] = model['id']
+
+                # Current values, an edit to one of them changes nothing and gets no update.
+                # A slider's throttled value starts out unset, the same as its value
+                if 'value' in attributes:
+                    self.values[model['id'], 'value'] = attributes['value']
+                    self.values[model['id'], 'value_throttled'] = (attributes.get('value_throttled')
+                                                                   or attributes['value'])
+
+    async def _read(self):
+        while True:
+            fragment = await self.socket.read_message()
+            if fragment is None:
+                raise ConnectionError("server closed the session")
+            message = await self.receiver.consume(fragment)
+            if message is not None:
+                return message
+
+    async def _expect(self, msgtype):
+        while True:
+            message = await self._read()
+            if message.msgtype == msgtype:
+                return message
+
+    async def _send(self, msgtype, content):
+        self._msgid += 1
+        header = dict(msgid=str(self._msgid), msgtype=msgtype)
+        for frame in (header, {}, content):
+            await self.socket.write_message(json.dumps(frame))
+
+    def has_widget(self, titles):
+        return any(title in self.widgets for title in titles)
+
+    def changes(self, titles, attr, value):
+        """Whether the edit changes the widget, an unchanged value triggers no update"""
+
+        model = next(self.widgets[title] for title in titles if title in self.widgets)
+        return self.values.get((model, attr)) != value
+
+    async def edit(self, titles, attr, value):
+        model = next(self.widgets[title] for title in titles if title in self.widgets)
+        self.values[model, attr] = value
+        event = dict(kind='ModelChanged', model=dict(id=model), attr=attr, new=value, hint=None)
+        await self._send('PATCH-DOC', dict(events=[event], references=[]))
+
+    def _updates_source(self, message):
+        if message.msgtype != 'PATCH-DOC':
+            return False
+        for event in message.content['events']:
+            if event['kind'] in DATA_EVENTS and event['column_source']['id'] in self.sources:
+                return True
+            if event['kind'] == 'ModelChanged' and event['model']['id'] in self.sources:
+                return True
+        return False
+
+    async def wait_for_data(self):
+        while not self._updates_source(await self._read()):
+            pass
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+
+
+async def run_session(url, app, actions, think, timeout, seed):
+    """Latencies [s] of the actions one session performs, None for a timed out action"""
+
+    rng = random.Random(seed)
+    session = LoadSession(url, app)
+    await session.connect()
+
+    choices = [action for action in ACTIONS[app]]
+    latencies = []
+    try:
+        for _ in range(actions):
+            await asyncio.sleep(rng.uniform(0.5, 1.5)*think)
+
+            edits = rng.choice(choices)(rng)
+            if not all(session.has_widget(titles) for titles, _, _ in edits) or not session.changes(*edits[-1]):
+                continue
+
+            for titles, attr, value in edits[:-1]:
+                await session.edit(titles, attr, value)
+                await asyncio.sleep(0.05)
+
+            start = time.perf_counter()
+            await session.edit(*edits[-1])
+            try:
+                await asyncio.wait_for(session.wait_for_data(), timeout)
+                latencies.append(time.perf_counter() - start)
+            except asyncio.TimeoutError:
+                latencies.append(None)
+    finally:
+        session.close()
+
+    return latencies
+
+
+async def run_level(url, app, sessions, actions, think, timeout):
+    results = await asyncio.gather(*[run_session(url, app, actions, think, timeout, seed)
+                                     for seed in range(sessions)], return_exceptions=True)
+
+    latencies, timeouts, errors = [], 0, []
+    for result in results:
+        if isinstance(result, Exception):
+            errors.append(repr(result))
+            continue
+        latencies += [t for t in result if t is not None]
+        timeouts += sum(t is None for t in result)
+
+    record = dict(app=app, sessions=sessions, actions=len(latencies), timeouts=timeouts, errors=errors)
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        record.update(p50=p50, p95=p95, p99=p99, max=max(latencies))
+    return record
+
+
+# Server
+# ---------------------------------
+
+def start_apps(port):
+    """bokeh serve the three apps on port, returns the process once they answer"""
+
+    process = subprocess.Popen(['bokeh', 'serve'] + APPS + ['--port', str(port), '--allow-websocket-origin', '*'],
+                               cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urlopen('http://localhost:%d/%s' % (port, APPS[0]), timeout=5).read()
+            return process
+        except OSError:
+            time.sleep(0.5)
+
+    process.terminate()
+    raise RuntimeError("bokeh serve did not come up on port %d" % port)
+
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(description="Concurrent session load test of the Bokeh apps")
+    parser.add_argument('--url', help="running server, e.g. http://localhost:5006, default starts one")
+    parser.add_argument('--port', type=int, default=5106, help="port for the started server")
+    parser.add_argument('--apps', nargs='+', default=APPS, choices=APPS)
+    parser.add_argument('--sessions', nargs='+', type=int, default=[1, 5, 10, 25], help="concurrency levels")
+    parser.add_argument('--actions', type=int, default=20, help="actions per session")
+    parser.add_argument('--think', type=float, default=1.0, help="mean seconds between actions")
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds to wait for an update")
+    parser.add_argument('-o', '--output', help="JSON results file")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+
+    process = None
+    url = args.url
+    if url is None:
+        process = start_apps(args.port)
+        url = 'http://localhost:%d' % args.port
+
+    records = []
+    try:
+        print("%-16s %8s %8s %8s %10s %10s %10s" % ('app', 'sessions', 'actions', 'timeouts', 'p50 ms', 'p95 ms',
+                                                    'p99 ms'))
+        for app in args.apps:
+            for sessions in args.sessions:
+                record = asyncio.run(run_level(url, app, sessions, args.actions, args.think, args.timeout))
+                records.append(record)
+
+                if 'p50' in record:
+                    print("%-16s %8d %8d %8d %10.1f %10.1f %10.1f" % (
+                        app, sessions, record['actions'], record['timeouts'],
+                        record['p50']*1000, record['p95']*1000, record['p99']*1000))
+                else:
+                    print("%-16s %8d no completed actions %s" % (app, sessions, record['errors'][:1]))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(url=url, actions=args.actions, think=args.think, results=records), f, indent=1)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
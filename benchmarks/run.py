@@ -0,0 +1,222 @@
+'''
+Benchmarks for the DP meter solver hot path.
+
+    python benchmarks/run.py                       # everything, results.json
+    python benchmarks/run.py --quick               # 25 and 100 points only
+    python benchmarks/run.py --meters "ISO 5167 orifice" --points 25 10000
+    python benchmarks/run.py -o new.json --compare baseline.json --tolerance 1.5
+
+Cases, all against a headless Bokeh Document with the same serializer the
+server uses for its websocket messages:
+
+    construct     dPMeterSolver() with plotsetup, tablesetup and setupwidgets
+    update_data   widget read, curve solve and ColumnDataSource update,
+                  including the PATCH-DOC serialization, curve cache cleared
+    solve         the raw curve computation (solve_curve) on its own
+    serialize     PATCH-DOC serialization of one curve update on its own
+
+for every constants.Meter_Type and every point count.  Results are written as
+JSON, one record per case with the median and best time in seconds.  With
+--compare the run exits with status 1 when any median is more than
+--tolerance times slower than the same case in the baseline file.
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Runnable from a checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('OPENET_POOL', 'none')
+
+import numpy as np
+
+import bokeh
+from bokeh.document import Document
+from bokeh.io.doc import set_curdoc
+from bokeh.layouts import column
+from bokeh.protocol import Protocol
+
+import fluids
+
+from openet.constants import Meter_Type
+from openet.dpmeter import dPMeterSolver
+from openet.engine import curve_cache, solve_curve
+from openet.payload import message_bytes
+
+
+POINTS = [25, 100, 1000, 10000]
+QUICK_POINTS = [25, 100]
+
+# Keep repeating a case until it has run this long, at least once
+MIN_TIME = 0.5
+MAX_REPEAT = 50
+
+
+def measure(func, setup=None):
+    """Median and best wall time of func() in seconds, setup() runs untimed before each call"""
+
+    times = []
+    total = 0.0
+    while not times or (total < MIN_TIME and len(times) < MAX_REPEAT):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+
+    return dict(seconds=statistics.median(times), best=min(times), repeat=len(times))
+
+
+class Session():
+    """A dPMeterSolver on its own headless Document, changes serialized as the server would"""
+
+    def __init__(self):
+        self.doc = Document()
+        set_curdoc(self.doc)
+
+        # Fixed grids, so that every point count is timed as asked
+        self.dpm = dPMeterSolver(debounce=0, tolerance=None)
+        self.doc.add_root(column(self.dpm.plot, self.dpm.table_row))
+
+        self.protocol = Protocol()
+        self.bytes = 0
+        self.doc.on_change(self._serialize)
+
+    def _serialize(self, event):
+        try:
+            self.bytes += message_bytes(self.protocol.create('PATCH-DOC', [event]))
+        except Exception:
+            pass
+
+    def configure(self, meter_type, points):
+        self.dpm.meter_select.value = meter_type
+        self.dpm._plotpoint = points
+
+
+def bench_construct():
+    def construct():
+        set_curdoc(Document())
+        dPMeterSolver()
+
+    return [dict(name='construct', meter_type=None, points=None, **measure(construct))]
+
+
+def bench_meter(meter_type, points):
+    """update_data, solve and serialize records for one meter type and point count"""
+
+    session = Session()
+    session.configure(meter_type, points)
+    curve, rhos, MW = session.dpm.read_inputs()
+
+    records = []
+    key = dict(meter_type=meter_type, points=points)
+
+    try:
+        solve_curve(**curve)
+    except Exception as e:
+        return [dict(name=name, error=str(e), **key) for name in ('update_data', 'solve', 'serialize')]
+
+    def update():
+        session.dpm.update_data(None, None, None)
+
+    def reset():
+        # Solve every time, and make every column differ from what was sent
+        curve_cache.clear()
+        session.dpm.push_columns({name: np.zeros(points + 1) for name in session.dpm.source.data})
+
+    reset()
+    session.bytes = 0
+    update()
+    records.append(dict(name='update_data', payload_bytes=session.bytes, **key, **measure(update, reset)))
+
+    records.append(dict(name='solve', **key, **measure(lambda: solve_curve(**curve))))
+
+    DP, M = solve_curve(**curve)
+    # Alternate between two curves, an assignment equal to the current data is not sent
+    curves = [dict(x=DP, y=M, v=M, z=M, kg=M), dict(x=DP, y=2*M, v=2*M, z=2*M, kg=2*M)]
+
+    def serialize():
+        curves.reverse()
+        session.dpm.source.data = curves[0]
+
+    records.append(dict(name='serialize', **key, **measure(serialize)))
+
+    return records
+
+
+def environment():
+    return dict(python=platform.python_version(), machine=platform.machine(), processor=platform.processor(),
+                system=platform.platform(), numpy=np.__version__, bokeh=bokeh.__version__,
+                fluids=fluids.__version__, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+def compare(results, baseline, tolerance):
+    """Cases in results slower than tolerance times the baseline"""
+
+    def case(record):
+        return record['name'], record['meter_type'], record['points']
+
+    reference = {case(r): r for r in baseline['results'] if 'seconds' in r}
+
+    regressions = []
+    for record in results['results']:
+        old = reference.get(case(record))
+        if old is not None and 'seconds' in record and record['seconds'] > tolerance*old['seconds']:
+            regressions.append((case(record), old['seconds'], record['seconds']))
+    return regressions
+
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(description="Time the DP meter solver hot path")
+    parser.add_argument('-o', '--output', default='results.json', help="JSON results file")
+    parser.add_argument('--meters', nargs='+', default=Meter_Type, help="meter types, default all of Meter_Type")
+    parser.add_argument('--points', nargs='+', type=int, default=None, help="point counts, default %s" % POINTS)
+    parser.add_argument('--quick', action='store_true', help="only %s points" % QUICK_POINTS)
+    parser.add_argument('--compare', help="baseline JSON results to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="allowed slowdown against the baseline")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    points = args.points or (QUICK_POINTS if args.quick else POINTS)
+
+    records = bench_construct()
+    print("%-40s %8s %12s" % ('construct', '', '%.3f ms' % (records[0]['seconds']*1000)))
+
+    for meter_type in args.meters:
+        for n in points:
+            for record in bench_meter(meter_type, n):
+                records.append(record)
+                timing = record['error'] if 'error' in record else '%.3f ms' % (record['seconds']*1000)
+                print("%-40s %6d %-12s %s" % (meter_type, n, record['name'], timing))
+
+    results = dict(environment=environment(), results=records)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for (name, meter_type, n), old, new in regressions:
+            print("REGRESSION %s %s %s: %.3f ms -> %.3f ms" % (name, meter_type, n, old*1000, new*1000))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
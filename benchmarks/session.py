@@ -0,0 +1,109 @@
+'''
+Session construction time of the DP_METER_SOLVER app.
+
+    python benchmarks/session.py
+    python benchmarks/session.py --sessions 20 --app /path/to/DP_METER_SOLVER
+
+Every new browser session runs the app's main.py on a fresh document.  This
+times that (Application.create_document, what the server does before the
+first paint) in a fresh Python process per mode:
+
+    cold    the app_hooks.py hooks are not run, the first session
+            pays for the imports, theme and curve solves
+    warm    on_server_loaded runs first, as under bokeh serve
+
+and reports the server load time, the first session and the median of the
+sessions after it, plus the resident memory every session after the first
+adds (all of them are kept open, as connected users would be).  The compute
+pool is off (OPENET_POOL=none) so that only the session itself is measured.
+'''
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'openet', 'DP_METER_SOLVER')
+
+MODES = ('cold', 'warm')
+
+
+def measure(app_dir, mode, sessions):
+    """Times [s] of one mode, in this process"""
+
+    from bokeh.application import Application
+    from bokeh.application.handlers import DirectoryHandler
+
+    start = time.perf_counter()
+    app = Application(DirectoryHandler(filename=app_dir))
+    if mode == 'warm':
+        app.on_server_loaded(None)
+    loaded = time.perf_counter() - start
+
+    from openet.metrics import resident_memory
+
+    start = time.perf_counter()
+    docs = [app.create_document()]
+    first = time.perf_counter() - start
+
+    gc.collect()
+    rss = resident_memory()
+
+    times = []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        docs.append(app.create_document())
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    per_session = (resident_memory() - rss)/sessions
+
+    return dict(mode=mode, server_loaded=loaded, first=first, median=statistics.median(times),
+                per_session_bytes=per_session)
+
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(description="Time DP_METER_SOLVER session construction")
+    parser.add_argument('--app', default=APP_DIR, help="app directory")
+    parser.add_argument('--sessions', type=int, default=10, help="sessions per mode")
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('-o', '--output', help="JSON results file")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+
+    if args.mode:
+        # Child process, one mode
+        print(json.dumps(measure(args.app, args.mode, args.sessions)))
+        return 0
+
+    env = dict(os.environ, OPENET_POOL='none', OPENET_METRICS_PORT='0', OPENET_API_PORT='0')
+
+    records = []
+    print("%-6s %14s %14s %14s %16s" % ('mode', 'server ms', 'first ms', 'median ms', 'MB per session'))
+    for mode in MODES:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--app', args.app, '--mode', mode,
+                              '--sessions', str(args.sessions)], env=env, check=True, capture_output=True, text=True)
+        record = json.loads(out.stdout.strip().splitlines()[-1])
+        records.append(record)
+        print("%-6s %14.1f %14.1f %14.1f %16.2f" % (mode, record['server_loaded']*1000, record['first']*1000,
+                                                   record['median']*1000, record['per_session_bytes']/2**20))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+'''
+Accuracy of the fast solver paths against fluids.differential_pressure_meter_solver.
+
+    python benchmarks/verify.py                     # every meter, tap and position
+    python benchmarks/verify.py --quick             # fewer samples
+    python benchmarks/verify.py --meters "cone meter" --samples 2000 --seed 7
+    python benchmarks/verify.py --budget surrogate=1e-2 -o verify.json
+
+For every constants.Meter_Type, tap type (Tap_Type) and, for the eccentric
+orifices, tap position (Tap_Position) a seeded random grid of inputs is
+solved point by point with the fluids reference and with each fast path:
+
+    batch       solve_mass_flow, the vectorized secant solver (batched meter
+                types only, the others already are the reference)
+    kernel      openet.engine.kernels, when numba is installed
+    surrogate   solve_mass_flow_surrogate, the interpolated C/epsilon tables
+                (the meter types fluids solves point by point)
+    cache       a mass_flow_curve read back from the shared curve cache
+
+Inputs are drawn uniformly over D2/D and k, log uniformly over dP/P1, P1,
+density and the Reynolds number (the viscosity is set from an estimate of the
+flow to give the drawn Re), for one schedule 40 pipe per combination.  Points
+the reference itself cannot solve are left out and counted.
+
+The maximum, P50 and P99 relative flow error of each path are reported with
+its speedup over the reference (reference time / path time for the same
+points).  The run exits with status 1 when the maximum error of any path is
+above its budget, see BUDGETS and --budget.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Runnable from a checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import fluids
+from fluids import differential_pressure_meter_solver
+
+from openet.constants import Meter_Type, Tap_Type, Tap_Position
+from openet.engine.batch import METER_ALIASES, BATCH_METER_TYPES, solve_mass_flow
+from openet.engine.cache import curve_cache, mass_flow_curve
+from openet.engine.surrogate import get_surrogate, solve_mass_flow_surrogate
+from openet.engine.units import inch, INWC
+from openet.engine import kernels
+
+
+PATHS = ('batch', 'kernel', 'surrogate', 'cache')
+
+# Largest relative flow error allowed per path.  The surrogate bound is the
+# one documented in openet.engine.surrogate, wedge meters are out of range
+# of their correlation at large D2/D and dP/P1 and have their own budget
+BUDGETS = {'batch': 1e-9, 'kernel': 1e-9, 'surrogate': 5e-3, 'cache': 1e-9}
+METER_BUDGETS = {('surrogate', 'wedge meter'): 0.4, ('surrogate', 'Hollingshead wedge'): 0.4}
+
+ECCENTRIC_METERS = ['Miller eccentric orifice', 'eccentric orifice', 'ISO 15377 eccentric orifice']
+
+# Schedule 40 inside diameters [inch]
+PIPES = [2.067, 3.068, 4.026, 6.065, 7.981, 10.02, 11.938]
+
+# Sampled ranges
+RATIO = (0.25, 0.75)            # D2/D
+LOG_RE = (4.0, 7.0)
+LOG_DP_RATIO = (-4.0, np.log10(0.2))
+K = (1.1, 1.67)
+LOG_P1 = (5.0, 7.0)             # Pa
+LOG_RHO = (0.0, 3.0)            # kg/m3
+
+CURVE_POINTS = 25
+
+SAMPLES = 400
+QUICK_SAMPLES = 50
+
+
+def combinations(meters):
+    """(meter_type, taps, tap_position) of every case"""
+
+    for meter_type in meters:
+        if meter_type == 'unspecified meter':
+            # Needs C and epsilon from the caller, there is nothing to compare
+            continue
+        positions = Tap_Position if meter_type in ECCENTRIC_METERS else [None]
+        for taps in Tap_Type:
+            for tap_position in positions:
+                yield meter_type, taps, tap_position
+
+
+def sample_inputs(rng, samples):
+    """Seeded grid of solve_mass_flow inputs for one pipe"""
+
+    D = rng.choice(PIPES)*inch
+    D2 = D*rng.uniform(*RATIO, samples)
+    P1 = 10**rng.uniform(*LOG_P1, samples)
+    P2 = P1*(1.0 - 10**rng.uniform(*LOG_DP_RATIO, samples))
+    rho = 10**rng.uniform(*LOG_RHO, samples)
+    k = rng.uniform(*K, samples)
+
+    # Viscosity giving the drawn Reynolds number at a rough estimate of the flow
+    beta = D2/D
+    m = 0.6*0.25*np.pi*D2*D2*np.sqrt(2.0*rho*(P1 - P2)/(1.0 - beta**4))
+    mu = 4.0*m/(np.pi*D*10**rng.uniform(*LOG_RE, samples))
+
+    return dict(D=D, D2=D2, P1=P1, P2=P2, rho=rho, mu=mu, k=k)
+
+
+def reference(inputs, meter_type, taps, tap_position):
+    """fluids solution of every point, NaN where it fails, and the seconds taken"""
+
+    m = np.full(inputs['P1'].shape, np.nan)
+    start = time.perf_counter()
+    for i in range(m.size):
+        try:
+            m[i] = differential_pressure_meter_solver(
+                D=inputs['D'], D2=inputs['D2'][i], P1=inputs['P1'][i], P2=inputs['P2'][i], rho=inputs['rho'][i],
+                mu=inputs['mu'][i], k=inputs['k'][i], meter_type=meter_type, taps=taps, tap_position=tap_position)
+        except Exception:
+            pass
+    return m, time.perf_counter() - start
+
+
+def timed(func, size):
+    """Mass flow of func() and the seconds it took, NaN (no answer) when it raises"""
+
+    start = time.perf_counter()
+    try:
+        value = np.asarray(func(), dtype=float)
+    except Exception:
+        value = np.full(size, np.nan)
+    return value, time.perf_counter() - start
+
+
+def fast_paths(inputs, meter_type, taps, tap_position):
+    """{path: (mass flow, seconds)} of every fast path that applies to the meter"""
+
+    correlation = METER_ALIASES.get(meter_type, meter_type)
+    args = dict(meter_type=meter_type, taps=taps, tap_position=tap_position)
+    size = inputs['P1'].size
+    results = {}
+
+    if correlation in BATCH_METER_TYPES:
+        results['batch'] = timed(lambda: solve_mass_flow(**inputs, **args), size)
+
+        if kernels.ENABLED:
+            D = np.full(size, inputs['D'])
+            results['kernel'] = timed(lambda: kernels.solve(correlation, D, inputs['D2'], inputs['P1'], inputs['P2'],
+                                                            inputs['rho'], inputs['mu'], inputs['k'], taps)[0], size)
+
+    else:
+        # Tables are built (or loaded) once per pipe, outside the timing
+        try:
+            get_surrogate(meter_type, taps, tap_position, inputs['D'])
+        except Exception:
+            pass
+        results['surrogate'] = timed(lambda: solve_mass_flow_surrogate(**inputs, **args), size)
+
+    return results
+
+
+def cache_path(inputs, meter_type, taps, tap_position):
+    """Cached curve of the first sample's inputs, its dP points and the seconds of the cached call"""
+
+    P1 = inputs['P1'][0]
+    dp_max = (P1 - inputs['P2'][0])/INWC
+    curve = dict(P1=P1, rho=inputs['rho'][0], mu=inputs['mu'][0], k=inputs['k'][0], D=inputs['D'],
+                 D2=inputs['D2'][0], meter_type=meter_type, taps=taps, tap_position=tap_position,
+                 dp_min=dp_max/100.0, dp_max=dp_max, points=CURVE_POINTS)
+
+    # Solved into the cache, then timed as read back from it
+    timed(lambda: mass_flow_curve(**curve)[1], 0)
+    M, seconds = timed(lambda: mass_flow_curve(**curve)[1], CURVE_POINTS + 1)
+
+    n = CURVE_POINTS + 1
+    DP = np.logspace(np.log10(curve['dp_min']), np.log10(dp_max), n)
+    points = dict(D=inputs['D'], D2=np.full(n, curve['D2']), P1=np.full(n, P1), P2=P1 - DP*INWC,
+                  rho=np.full(n, curve['rho']), mu=np.full(n, curve['mu']), k=np.full(n, curve['k']))
+    return points, M, seconds
+
+
+def errors(value, exact):
+    """Relative errors of the points the reference solved, inf where the fast path has no answer"""
+
+    solved = np.isfinite(exact) & (exact != 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.abs(value[solved]/exact[solved] - 1.0)
+    return np.where(np.isfinite(error), error, np.inf)
+
+
+def verify(meter_type, taps, tap_position, samples, rng, budgets):
+    """Records of every fast path of one combination"""
+
+    inputs = sample_inputs(rng, samples)
+    exact, exact_seconds = reference(inputs, meter_type, taps, tap_position)
+
+    case = dict(meter_type=meter_type, taps=taps, tap_position=tap_position, pipe=inputs['D']/inch,
+                samples=samples, reference_failures=int(np.count_nonzero(~np.isfinite(exact))))
+
+    if not np.isfinite(exact).any():
+        # fluids does not accept this combination (e.g. taps the meter does not have)
+        return [dict(case, path=None, points=0, passed=True)]
+
+    runs = {path: (value, seconds, exact, exact_seconds)
+            for path, (value, seconds) in fast_paths(inputs, meter_type, taps, tap_position).items()}
+
+    points, M, seconds = cache_path(inputs, meter_type, taps, tap_position)
+    curve_exact, curve_seconds = reference(points, meter_type, taps, tap_position)
+    runs['cache'] = M, seconds, curve_exact, curve_seconds
+
+    records = []
+    for path, (value, seconds, exact, exact_seconds) in runs.items():
+        error = errors(np.asarray(value, dtype=float), exact)
+        budget = budgets.get((path, meter_type), budgets[path])
+
+        record = dict(case, path=path, points=int(error.size), budget=budget,
+                      speedup=exact_seconds/seconds if seconds > 0.0 else None)
+        if error.size:
+            record.update(max_error=float(error.max()), p50_error=float(np.percentile(error, 50)),
+                          p99_error=float(np.percentile(error, 99)))
+            record['passed'] = record['max_error'] <= budget
+        else:
+            record['passed'] = True
+        records.append(record)
+
+    return records
+
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(description="Check the fast solver paths against the fluids reference")
+    parser.add_argument('-o', '--output', help="JSON results file")
+    parser.add_argument('--meters', nargs='+', default=Meter_Type, help="meter types, default all of Meter_Type")
+    parser.add_argument('--samples', type=int, default=None, help="points per combination, default %d" % SAMPLES)
+    parser.add_argument('--quick', action='store_true', help="%d points per combination" % QUICK_SAMPLES)
+    parser.add_argument('--seed', type=int, default=0, help="random grid seed")
+    parser.add_argument('--budget', action='append', default=[], metavar='PATH=ERROR',
+                        help="maximum relative error of a path, default %s" % BUDGETS)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    samples = args.samples or (QUICK_SAMPLES if args.quick else SAMPLES)
+
+    budgets = dict(BUDGETS)
+    budgets.update(METER_BUDGETS)
+    for budget in args.budget:
+        path, value = budget.split('=')
+        if path not in PATHS:
+            raise SystemExit("Unknown path %s, one of %s" % (path, PATHS))
+        budgets[path] = float(value)
+        for key in METER_BUDGETS:
+            if key[0] == path:
+                budgets[key] = max(budgets[key], float(value))
+
+    if not kernels.ENABLED:
+        print("numba is not available, the kernel path is not checked")
+
+    rng = np.random.default_rng(args.seed)
+    curve_cache.clear()
+
+    records = []
+    print("%-36s %-6s %-10s %-9s %6s %10s %10s %10s %9s" % ('meter', 'taps', 'position', 'path', 'points',
+                                                            'max', 'p50', 'p99', 'speedup'))
+    for meter_type, taps, tap_position in combinations(args.meters):
+        for record in verify(meter_type, taps, tap_position, samples, rng, budgets):
+            records.append(record)
+            if record['path'] is None:
+                print("%-36s %-6s %-10s %-9s" % (meter_type[:36], taps, tap_position or '', 'unsupported'))
+                continue
+            print("%-36s %-6s %-10s %-9s %6d %10.2e %10.2e %10.2e %8.1fx %s" % (
+                meter_type[:36], taps, tap_position or '', record['path'], record['points'],
+                record.get('max_error', 0.0), record.get('p50_error', 0.0), record.get('p99_error', 0.0),
+                record['speedup'] or 0.0, '' if record['passed'] else 'OVER BUDGET %.0e' % record['budget']))
+
+    print()
+    print("%-9s %8s %10s %10s %10s %9s" % ('path', 'points', 'max', 'p50', 'p99', 'speedup'))
+    for path in PATHS:
+        path_records = [r for r in records if r['path'] == path and r['points']]
+        if not path_records:
+            continue
+        points = sum(r['points'] for r in path_records)
+        speedups = [r['speedup'] for r in path_records if r['speedup']]
+        print("%-9s %8d %10.2e %10.2e %10.2e %8.1fx" % (
+            path, points, max(r['max_error'] for r in path_records),
+            np.median([r['p50_error'] for r in path_records]), max(r['p99_error'] for r in path_records),
+            float(np.median(speedups)) if speedups else 0.0))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(fluids=fluids.__version__, numpy=np.__version__, seed=args.seed, samples=samples,
+                           kernels=kernels.ENABLED, results=records), f, indent=1)
+
+    failures = [r for r in records if not r['passed']]
+    for r in failures:
+        print("OVER BUDGET %s %s %s %s: %.2e > %.0e" % (r['path'], r['meter_type'], r['taps'], r['tap_position'],
+                                                       r['max_error'], r['budget']))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+'''
+Server hooks for the DP meter solver app, run once per bokeh serve process.
+
+New sessions are refused with a 503 once OPENET_MAX_SESSIONS sessions are
+open (default 0, no limit).  That needs process_request, so these are
+app_hooks.py rather than server_lifecycle.py hooks: an error raised in
+on_session_created is logged and the session is created anyway.
+
+Sessions that are never connected, or whose browser went away, are
+discarded by bokeh serve itself, see its --unused-session-lifetime and
+--check-unused-sessions options.
+'''
+
+import os
+import sys
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+from tornado.web import HTTPError
+
+from openet import api
+from openet.engine import configure_from_args
+from openet.metrics import start_server, resident_memory, ACTIVE_SESSIONS
+from openet.warmup import warm_up
+
+
+APP = 'DP_METER_SOLVER'
+
+MAX_SESSIONS = int(os.environ.get('OPENET_MAX_SESSIONS', 0))
+
+# Runs with the same --args as main.py, the pool is configured here
+# so it can be started before the first session
+pool = configure_from_args(sys.argv[1:])
+
+
+def on_server_loaded(server_context):
+    # Prometheus metrics on their own port, see openet.metrics
+    start_server()
+
+    # JSON flow API on its own port, see openet.api
+    api.start_server()
+
+    # Theme, solver code paths, default curves and pool workers, see openet.warmup
+    warm_up(pool)
+
+
+def _log_sessions():
+    sessions = ACTIVE_SESSIONS.labels(APP).value
+    lg.info("%s sessions: %d, resident memory %.1f MB", APP, sessions, resident_memory()/2**20)
+
+
+def process_request(request):
+    if MAX_SESSIONS and ACTIVE_SESSIONS.labels(APP).value >= MAX_SESSIONS:
+        raise HTTPError(503, "%s is at its limit of %d sessions" % (APP, MAX_SESSIONS))
+    return {}
+
+
+def on_session_created(session_context):
+    ACTIVE_SESSIONS.labels(APP).inc()
+    _log_sessions()
+
+
+def on_session_destroyed(session_context):
+    ACTIVE_SESSIONS.labels(APP).dec()
+    _log_sessions()
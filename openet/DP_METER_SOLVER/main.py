@@ -1,26 +1,78 @@
+import sys
+
 from bokeh.io import curdoc
 from bokeh.layouts import row, column
 
 
-from bokeh.themes import Theme
-curdoc().theme = Theme(filename='/app/openet/theme.yaml')
+# Parsed once per process, see openet.warmup
+from openet.warmup import load_theme
+curdoc().theme = load_theme()
 
 from openet.conversions import mass_to_molar, mass_to_volume
 from openet.dpmeter import dPMeterSolver
+from openet.sizing import dPMeterSizing
+from openet.live import dPMeterLive
+from openet.compare import dPMeterCompare
+from openet.uncertainty import dPMeterUncertainty
+from openet.historian import dPMeterHistorian
+from openet.engine import configure_from_args
 
+# Shared compute pool, e.g. bokeh serve DP_METER_SOLVER --args --pool process --workers 4,
+# already configured by app_hooks.py when served as a directory
+configure_from_args(sys.argv[1:])
 
 # Initialize a new dP meter solver class
 dpm = dPMeterSolver()
 
+# Sizing view on the same inputs, updated together with the curve
+sizing = dPMeterSizing(dpm)
+
+# Live flow from streamed dP readings, see openet.sources
+live = dPMeterLive(dpm)
+curdoc().on_session_destroyed(live.session_destroyed)
+
+# Overlay of the same inputs for many meter types
+compare = dPMeterCompare(dpm)
+
+# Monte Carlo bands on the flow curve
+uncertainty = dPMeterUncertainty(dpm)
+
+# Long historian records replayed through the same inputs
+historian = dPMeterHistorian(dpm)
+curdoc().on_session_destroyed(historian.session_destroyed)
+
+# Default inputs, solved once by app_hooks.py and read from the curve cache
 dpm.update_data(None,None,None)
     
-for w in [dpm.meter_select,dpm.tap_select,dpm.tap_position, dpm.text,dpm.density, dpm.Pi, dpm.viscosity, dpm.isentropic, dpm.DP_range,dpm.densitybase,dpm.molecular,dpm.orifice,dpm.pipe]:
-    w.on_change('value', dpm.update_data)
+# Widget changes are coalesced by the solver, the slider only
+# reports once the user lets go of it
+for w in [dpm.meter_select,dpm.tap_select,dpm.tap_position, dpm.text,dpm.density, dpm.Pi, dpm.viscosity, dpm.isentropic,dpm.densitybase,dpm.molecular,dpm.orifice,dpm.pipe]:
+    w.on_change('value', dpm.request_update)
+
+dpm.DP_range.on_change('value_throttled', dpm.request_update)
+
+# Saved tags, see openet.store
+dpm.text.on_change('value', dpm.load_tag)
+dpm.save_button.on_click(dpm.save_tag)
 
 
 for w in [dpm.radio_button_group]:
     w.on_change('active',dpm.update_selection)
 
+dpm.solver_select.on_change('active', dpm.request_update)
+
+dpm.view_select.on_change('active', dpm.update_view)
+live.live_toggle.on_change('active', live.update_live)
+for w in [sizing.grid_select, sizing.target, compare.meter_choice, uncertainty.samples]:
+    w.on_change('value', dpm.request_update)
+
+for w in list(uncertainty.distributions.values()) + list(uncertainty.spreads.values()):
+    w.on_change('value', dpm.request_update)
+uncertainty.toggle.on_change('active', dpm.request_update)
+
+historian.replay_button.on_click(historian.start_replay)
+historian.period_select.on_change('active', historian.update_totals)
+
 
 # Set up layouts and add to document
 # -----------------------------------
@@ -36,9 +88,19 @@ row4 = row(dpm.orifice,dpm.pipe)
 row5 = row(dpm.meter_select)
 row6 = row(dpm.tap_select, dpm.tap_position)
 
-inputs = column(dpm.text,dpm.radio_button_group, row5,row6, dpm.DP_range, row1, row2, row3, row4)
-upper = row(inputs, dpm.plot)
-lower = row(dpm.gas_data_table,dpm.liquid_data_table)
+row7 = row(sizing.target)
+
+inputs = column(dpm.text,row(dpm.save_button, dpm.tag_status),dpm.radio_button_group, dpm.solver_select, row5,row6, dpm.DP_range, row1, row2, row3, row4)
+sizing_inputs = column(dpm.view_select, sizing.grid_select, row7, sizing.result,
+                       live.source_url, live.live_toggle, live.status, compare.meter_choice, compare.status,
+                       historian.path, historian.replay_button, historian.status)
+upper = row(inputs, dpm.plot_column, sizing_inputs)
+uncertainty_inputs = column([uncertainty.toggle, uncertainty.samples]
+                            + [row(uncertainty.distributions[name], uncertainty.spreads[name])
+                               for name, _, _, _ in uncertainty.INPUTS]
+                            + [uncertainty.status])
+
+lower = row(dpm.table_row, uncertainty_inputs, historian.totals_column)
 
 
 layouts = column(upper,lower)
@@ -0,0 +1,12 @@
+'''
+Server hooks for the GASFLOW app, run once per bokeh serve process.
+
+Loads the compiled solver kernels (when numba is installed) before the first
+session, see openet.engine.kernels.
+'''
+
+from openet.engine.kernels import warm_up
+
+
+def on_server_loaded(server_context):
+    warm_up()
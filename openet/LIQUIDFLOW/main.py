@@ -6,18 +6,14 @@ from bokeh.layouts import row, column
 from bokeh.models.widgets import Slider, TextInput, RangeSlider, Spinner,CheckboxGroup,DataTable, TableColumn, NumberFormatter
 from bokeh.models import Range1d
 from bokeh.plotting import figure
-from bokeh.server.server import Server
-from bokeh.application import Application
-from bokeh.application.handlers.function import FunctionHandler
 from bokeh.plotting import figure, ColumnDataSource
 
 
-import fluids
-from fluids import nearest_pipe, differential_pressure_meter_solver
-from scipy.constants import psi, atm, inch,convert_temperature
+from openet.engine.units import psi, atm, inch
 
 
 from openet.conversions import mass_to_volume
+from openet.engine import mass_flow_curve
 
 
 # Set up data
@@ -112,25 +108,10 @@ def update_data(attrname, old, new):
 
     steps = 30
     
-    Log_steps = 10**np.linspace(math.log10(dp_min),math.log10(dp_max),steps+1)
-
-    DP = []
-    MF = []
-    SMF = []
-    M = []
-
-    for i,dP in enumerate(Log_steps):
-        #   print(i,dP)
-        DP.append(dP)
-
-        #dP = i # differential in inches of water ("H2O) 
-        P2 = P1 - (dP*248.84)
-        #print(Di,Do,P1,dP,P2,rho,mu,k)
-        m = differential_pressure_meter_solver(D=Di, D2=Do, P1=P1, P2=P2, rho=rho, mu=mu, k=k, meter_type='ISO 5167 orifice', taps='flange')
-        mf = mass_to_volume(m, rho)
-        M.append(m)
-        MF.append(mf)
-        SMF.append(mf*rho/rhos)
+    DP, M = mass_flow_curve(P1=P1, rho=rho, mu=mu, k=k, D=Di, D2=Do, meter_type='ISO 5167 orifice', taps='flange',
+                            tap_position=None, dp_min=dp_min, dp_max=dp_max, points=steps)
+    MF = mass_to_volume(M, rho)
+    SMF = MF*rho/rhos
 
     
     source.data = dict(x=DP, y=MF, z=SMF, kg=M)
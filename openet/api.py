@@ -0,0 +1,456 @@
+'''
+JSON HTTP API for programmatic flow calculations.
+
+    POST /api/flow
+
+The body is one meter configuration, a list of them, or {"meters": [...],
+"units": {...}}.  A configuration has the inputs of the batch CLI in the
+same app units (see openet.cli) and either the dP points to solve or a
+curve:
+
+    {"tag": "FT-101", "density": 10, "pressure": 100, "viscosity": 0.01,
+     "orifice": 2, "pipe": 4, "dp": [10, 50, 100]}
+    {..., "dp_min": 1, "dp_max": 250, "points": 25}
+
+units picks the volume units of the result: gas_unit (MSCFH), liquid_unit
+(MBPD) and standard (15C).  Each configuration comes back with its dp and
+mass_flow [kg/s], gas_flow, liquid_flow and standard_liquid_flow arrays, or
+an error; the response also reports the request's latency_ms (also in the
+Server-Timing header) and how many requests shared its solve.
+
+Requests that arrive within OPENET_API_WINDOW seconds of each other
+(default 0.005) are micro-batched: their points are grouped by meter type,
+taps and tap position and each group is one vectorized solve_mass_flow call,
+on the compute pool when it is enabled.  Bodies over OPENET_API_MAX_BYTES
+(default 1 MB), or with more than MAX_METERS configurations or
+OPENET_API_MAX_POINTS points, are refused with a 413.  When the compute
+pool's queue is full the batch is refused with a 503 and a Retry-After
+header rather than solved on the event loop the Bokeh sessions share.
+
+start_server() serves the API on the Bokeh server's own event loop on a
+separate port (OPENET_API_PORT, default 5010, 0 disables it), the
+DP_METER_SOLVER app hooks call it.  Standalone, or behind a load balancer
+with several processes:
+
+    python -m openet.api --port 5010
+    curl -d '{"density": 10, "pressure": 100, "viscosity": 0.01, "orifice": 2, "pipe": 4, "dp": 50}' \\
+        http://localhost:5010/api/flow
+
+Reference:
+https://www.tornadoweb.org/en/stable/web.html
+'''
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from openet.cli import tag_inputs, base_inputs
+from openet.conversions import GAS_UNITS, LIQUID_UNITS, STANDARD_CONDITIONS
+from openet.metrics import REGISTRY, Histogram, Counter, LATENCY_BUCKETS, POINT_BUCKETS
+
+
+# Not 5006 (bokeh serve) or 5007 (the udp:// live source default)
+DEFAULT_PORT = 5010
+
+WINDOW = float(os.environ.get('OPENET_API_WINDOW', 0.005))
+MAX_BYTES = int(os.environ.get('OPENET_API_MAX_BYTES', 2**20))
+MAX_POINTS = int(os.environ.get('OPENET_API_MAX_POINTS', 100000))
+MAX_METERS = 1000
+
+# Bodies up to this size still get a 413 response, larger ones are cut off by Tornado
+BODY_LIMIT = 16*MAX_BYTES
+
+# A batch is solved straight away once it holds this many points
+BATCH_POINTS = 4*MAX_POINTS
+
+# Seconds a client is asked to wait when the compute pool is busy
+RETRY_AFTER = 1
+
+DEFAULT_UNITS = dict(gas_unit='MSCFH', liquid_unit='MBPD', standard='15C')
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'openet_api_request_seconds', "Flow API request time, batching wait included", ['status']))
+
+BATCH_REQUESTS = REGISTRY.register(Histogram(
+    'openet_api_batch_requests', "Requests solved together in one micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+
+BATCH_POINT_COUNT = REGISTRY.register(Histogram(
+    'openet_api_batch_points', "dP points solved in one micro-batch", buckets=POINT_BUCKETS))
+
+BATCH_SECONDS = REGISTRY.register(Histogram(
+    'openet_api_batch_seconds', "Micro-batch solve time, inline or on the compute pool", buckets=LATENCY_BUCKETS))
+
+REJECTED = REGISTRY.register(Counter(
+    'openet_api_rejected_total', "Flow API requests refused", ['reason']))
+
+
+class RequestError(ValueError):
+    """A request that cannot be solved, with its HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# Parsing
+# ---------------------------------
+
+def _dp_points(meter):
+    """dP points [inWC] of one configuration, a list or number under dp, or a curve"""
+
+    if meter.get('dp') is not None:
+        dp = np.atleast_1d(np.asarray(meter['dp'], dtype=np.float64))
+        if dp.ndim != 1:
+            raise ValueError("dp must be a number or a list of numbers")
+    elif meter.get('dp_min') is not None or meter.get('dp_max') is not None:
+        dp_min, dp_max = float(meter.get('dp_min', 1.0)), float(meter.get('dp_max', 250.0))
+        points = int(meter.get('points', 25))
+        if not 0 < dp_min < dp_max or points < 1:
+            raise ValueError("need 0 < dp_min < dp_max and points >= 1")
+        if points + 1 > MAX_POINTS:
+            raise RequestError("more than %d points" % MAX_POINTS, 413)
+        dp = np.logspace(np.log10(dp_min), np.log10(dp_max), points + 1)
+    else:
+        raise ValueError("missing dp, or dp_min and dp_max")
+
+    if not np.all(np.isfinite(dp)) or np.any(dp < 0.0):
+        raise ValueError("dp must be finite and not negative")
+    return dp
+
+
+def parse_request(payload):
+    """
+    (meters, units) of a decoded request body.  meters is a list of
+    (tag, base, inputs, DP) with inputs in SI units (openet.cli.tag_inputs)
+    and base the molecular weight and base density (openet.cli.base_inputs),
+    or (tag, error) for a configuration that cannot be solved.  Raises
+    RequestError for a malformed or oversized request.
+    """
+
+    units = dict(DEFAULT_UNITS)
+    if isinstance(payload, dict) and 'meters' in payload:
+        requested = payload.get('units') or {}
+        if not isinstance(requested, dict):
+            raise RequestError("units must be an object")
+        units.update(requested)
+        payload = payload['meters']
+
+    meters = payload if isinstance(payload, list) else [payload]
+    if not meters:
+        raise RequestError("no meters")
+    if len(meters) > MAX_METERS:
+        raise RequestError("more than %d meters" % MAX_METERS, 413)
+
+    if not all(isinstance(value, str) for value in units.values()) or units['gas_unit'] not in GAS_UNITS \
+            or units['liquid_unit'] not in LIQUID_UNITS or units['standard'] not in STANDARD_CONDITIONS:
+        raise RequestError("unknown units %s" % units)
+
+    parsed = []
+    points = 0
+    for i, meter in enumerate(meters):
+        if not isinstance(meter, dict):
+            raise RequestError("meter %d is not an object" % i)
+
+        tag = str(meter.get('tag') or i)
+        row = dict(meter, tag=tag)
+        try:
+            inputs = tag_inputs(row)
+            base = base_inputs(row)
+            DP = _dp_points(meter)
+            if not all(isinstance(inputs[name], str) or inputs[name] is None
+                       for name in ('meter_type', 'taps', 'tap_position')):
+                raise ValueError("meter_type, taps and tap_position must be strings")
+        except RequestError:
+            raise
+        except (TypeError, ValueError) as e:
+            parsed.append((tag, str(e)))
+            continue
+
+        points += DP.size
+        if points > MAX_POINTS:
+            raise RequestError("more than %d points" % MAX_POINTS, 413)
+        parsed.append((tag, base, inputs, DP))
+
+    return parsed, units
+
+
+# Solving
+# ---------------------------------
+
+def solve_batch(items):
+    """
+    Mass flow [kg/s] of every (inputs, DP) item, runs on the compute pool.
+    Items sharing a meter type, taps and tap position are concatenated into
+    one 1-d solve_mass_flow call; a failing group is retried item by item
+    so a bad configuration only costs its own result, which is then the
+    error message.
+    """
+
+    from openet.engine.batch import solve_mass_flow
+    from openet.engine.units import INWC
+
+    groups = {}
+    for i, (inputs, DP) in enumerate(items):
+        groups.setdefault((inputs['meter_type'], inputs['taps'], inputs['tap_position']), []).append(i)
+
+    results = [None]*len(items)
+
+    def solve(members):
+        sizes = [items[i][1].size for i in members]
+        args = {name: np.repeat([items[i][0][name] for i in members], sizes)
+                for name in ('P1', 'rho', 'mu', 'k', 'D', 'D2')}
+        DP = np.concatenate([items[i][1] for i in members])
+
+        # No differential is no flow, the solvers are only given the rest
+        M = np.zeros(DP.shape)
+        flowing = DP > 0.0
+        if flowing.any():
+            args = {name: value[flowing] for name, value in args.items()}
+            with np.errstate(invalid='ignore', divide='ignore'):
+                M[flowing] = solve_mass_flow(P2=args['P1'] - DP[flowing]*INWC, meter_type=meter_type, taps=taps,
+                                             tap_position=tap_position, **args)
+        return np.split(M, np.cumsum(sizes)[:-1])
+
+    for (meter_type, taps, tap_position), members in groups.items():
+        try:
+            for i, M in zip(members, solve(members)):
+                results[i] = M
+        except Exception:
+            for i in members:
+                try:
+                    results[i] = solve([i])[0]
+                except Exception as e:
+                    results[i] = str(e)
+
+    return results
+
+
+def _floats(values):
+    # JSON has no NaN, points without a solution are null
+    return [v if math.isfinite(v) else None for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def flow_result(tag, base, inputs, DP, M, units):
+    """Response entry of one solved configuration"""
+
+    from openet.conversions import mass_to_gas, mass_to_liquid
+
+    MW, rhos = base
+
+    return dict(tag=tag, dp=_floats(DP), mass_flow=_floats(M),
+                gas_flow=_floats(mass_to_gas(M, MW, units['gas_unit'], units['standard'])),
+                liquid_flow=_floats(mass_to_liquid(M, inputs['rho'], units['liquid_unit'])),
+                standard_liquid_flow=_floats(mass_to_liquid(M, rhos, units['liquid_unit'])),
+                error=None)
+
+
+class MicroBatcher():
+    """Collects the solves of concurrent requests on the event loop and runs
+    them as one solve_batch call, window seconds after the first arrives"""
+
+    def __init__(self, window=None, pool=None, max_points=BATCH_POINTS):
+        """window -- seconds to wait for more requests, default WINDOW
+        pool -- compute pool to solve on, default the shared one
+        max_points -- solve without waiting once this many points are pending
+        """
+
+        self.window = WINDOW if window is None else window
+        self.max_points = max_points
+        self._pool = pool
+
+        self._pending = []
+        self._points = 0
+        self._timer = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from openet.engine import get_pool
+            self._pool = get_pool()
+        return self._pool
+
+    async def solve(self, items):
+        """Mass flow of the (inputs, DP) items and the number of requests batched with them"""
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        self._pending.append((items, future))
+        self._points += sum(DP.size for _, DP in items)
+
+        if self._points >= self.max_points:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending, self._points = self._pending, [], 0
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        items = [item for request, _ in pending for item in request]
+        BATCH_REQUESTS.observe(len(pending))
+        BATCH_POINT_COUNT.observe(sum(DP.size for _, DP in items))
+
+        start = time.perf_counter()
+        try:
+            pool = self.pool
+            if pool.enabled:
+                from openet.engine import PoolBusy
+                try:
+                    future = pool.submit(solve_batch, items)
+                except PoolBusy:
+                    # Overloaded, solving here would stall every session on the loop
+                    raise RequestError("compute pool busy, retry in %d s" % RETRY_AFTER, 503)
+                results = await asyncio.wrap_future(future)
+            else:
+                results = solve_batch(items)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            BATCH_SECONDS.observe(time.perf_counter() - start)
+
+        at = 0
+        for request, future in pending:
+            if not future.done():
+                future.set_result((results[at:at + len(request)], len(pending)))
+            at += len(request)
+
+
+# Serving
+# ---------------------------------
+
+_server = None
+
+
+def make_handler(batcher):
+    """Tornado RequestHandler class of POST /api/flow, solving through batcher"""
+
+    from tornado.web import RequestHandler
+
+    class FlowHandler(RequestHandler):
+
+        def prepare(self):
+            self._start = time.perf_counter()
+
+        async def post(self):
+            if len(self.request.body) > MAX_BYTES:
+                return self.fail(413, "body over %d bytes" % MAX_BYTES, 'size')
+
+            try:
+                meters, units = parse_request(json.loads(self.request.body or b'null'))
+            except RequestError as e:
+                return self.fail(e.status, str(e), 'size' if e.status == 413 else 'invalid')
+            except ValueError as e:
+                return self.fail(400, "invalid JSON: %s" % e, 'invalid')
+
+            solvable = [m for m in meters if len(m) == 4]
+            batched = 0
+            if solvable:
+                try:
+                    solved, batched = await batcher.solve([(inputs, DP) for _, _, inputs, DP in solvable])
+                except RequestError as e:
+                    if e.status == 503:
+                        self.set_header('Retry-After', str(RETRY_AFTER))
+                    return self.fail(e.status, str(e), 'busy')
+                solved = iter(solved)
+
+            results = []
+            for meter in meters:
+                if len(meter) == 2:
+                    results.append(dict(tag=meter[0], error=meter[1]))
+                    continue
+
+                M = next(solved)
+                if isinstance(M, str):
+                    results.append(dict(tag=meter[0], error=M))
+                else:
+                    results.append(flow_result(*meter, M, units))
+
+            self.finish_json(200, dict(results=results, batch_requests=batched))
+
+        def fail(self, status, message, reason):
+            REJECTED.labels(reason).inc()
+            self.finish_json(status, dict(error=message))
+
+        def finish_json(self, status, body):
+            elapsed = time.perf_counter() - self._start
+            REQUEST_SECONDS.labels(status).observe(elapsed)
+
+            body['latency_ms'] = round(elapsed*1000, 3)
+            self.set_status(status)
+            self.set_header('Content-Type', 'application/json')
+            self.set_header('Server-Timing', 'total;dur=%.3f' % (elapsed*1000))
+            self.finish(json.dumps(body))
+
+    return FlowHandler
+
+
+def routes(batcher=None):
+    """URL patterns of the API, for a Tornado Application or bokeh Server(extra_patterns=...)"""
+
+    return [(r'/api/flow', make_handler(batcher or MicroBatcher()))]
+
+
+def start_server(port=None, address=''):
+    """Serve the API on the current event loop, once per process. Returns the port or None"""
+
+    global _server
+
+    if port is None:
+        port = int(os.environ.get('OPENET_API_PORT', DEFAULT_PORT))
+
+    if _server is not None or not port:
+        return None
+
+    from tornado.web import Application
+
+    _server = Application(routes()).listen(port, address=address, max_body_size=BODY_LIMIT)
+    return port
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m openet.api', description="JSON flow calculation API")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--address', default='')
+    parser.add_argument('--window', type=float, default=None, help="micro-batching window [s]")
+    args, pool_args = parser.parse_known_args(argv)
+
+    from tornado.ioloop import IOLoop
+    from openet.engine import configure_from_args
+    from openet.metrics import start_server as start_metrics
+
+    configure_from_args(pool_args)
+
+    global _server
+    from tornado.web import Application
+
+    _server = Application(routes(MicroBatcher(window=args.window))).listen(
+        args.port, address=args.address, max_body_size=BODY_LIMIT)
+    start_metrics()
+
+    print("Flow API on port %d, POST /api/flow" % args.port, file=sys.stderr)
+    IOLoop.current().start()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+'''
+Command line batch evaluation of meter tags.
+
+    openet tags.csv results.csv
+    openet tags.parquet results.parquet --mode point --workers 8
+
+Each input row is one tag with the same inputs as the DP meter app, in the
+same units:
+
+    tag, density [kg/m3], pressure [psig], viscosity [cP], orifice [inch],
+    pipe [inch], isentropic (1.1), molecular (2), densitybase (1000),
+    meter_type ('ISO 5167 orifice'), taps ('flange'), tap_position,
+    dp [inWC] (point mode only)
+
+Columns in brackets are optional with the app defaults.  Flows are written
+in kg/s and in the --gas-unit / --liquid-unit volume units.  The input is
+read and the output written in chunks, chunks are solved on a process pool
+and at most a few of them are held in memory at once.  Parquet needs pyarrow.
+'''
+
+import argparse
+import csv
+import math
+import sys
+import time
+from collections import deque
+
+from openet.engine.units import psi, inch
+from openet.conversions import GAS_UNITS, LIQUID_UNITS, STANDARD_CONDITIONS
+
+
+CHUNK_SIZE = 1000
+
+DEFAULTS = dict(isentropic=1.1, molecular=2.0, densitybase=1000.0, meter_type='ISO 5167 orifice',
+                taps='flange', tap_position=None, dp=None)
+
+REQUIRED = ('tag', 'density', 'pressure', 'viscosity', 'orifice', 'pipe')
+
+OUTPUT_COLUMNS = ['tag', 'dp', 'mass_flow', 'gas_flow', 'liquid_flow', 'standard_liquid_flow', 'error']
+
+
+# Reading and writing
+# ---------------------------------
+
+def read_chunks(path, chunksize=CHUNK_SIZE):
+    """Yield lists of row dicts from a CSV or Parquet file"""
+
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pylist()
+        return
+
+    with open(path, newline='') as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class CSVWriter():
+
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_COLUMNS)
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter():
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([('tag', pa.string()), ('dp', pa.float64()), ('mass_flow', pa.float64()),
+                                  ('gas_flow', pa.float64()), ('liquid_flow', pa.float64()),
+                                  ('standard_liquid_flow', pa.float64()), ('error', pa.string())])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(path):
+    return ParquetWriter(path) if path.endswith('.parquet') else CSVWriter(path)
+
+
+# Solving
+# ---------------------------------
+
+def _value(row, name):
+    value = row.get(name)
+    if value is None or value == '':
+        if name in REQUIRED:
+            raise ValueError("missing %s" % name)
+        return DEFAULTS[name]
+    return value
+
+
+def tag_inputs(row):
+    """Solver inputs in SI units from one row in app units"""
+
+    tap_position = _value(row, 'tap_position')
+    return dict(
+        P1=(float(_value(row, 'pressure')) + 14.7)*psi,
+        rho=_positive(row, 'density'),
+        mu=float(_value(row, 'viscosity'))/1000,
+        k=float(_value(row, 'isentropic')),
+        D=float(_value(row, 'pipe'))*inch,
+        D2=float(_value(row, 'orifice'))*inch,
+        meter_type=_value(row, 'meter_type'),
+        taps=_value(row, 'taps'),
+        tap_position=tap_position,
+    )
+
+
+def _positive(row, name):
+    value = _value(row, name)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("%s must be a positive number" % name)
+    if not (math.isfinite(value) and value > 0.0):
+        raise ValueError("%s must be a positive number" % name)
+    return value
+
+
+def base_inputs(row):
+    """(molecular weight, base density) of one row, for the volume flows"""
+
+    return _positive(row, 'molecular'), _positive(row, 'densitybase')
+
+
+def _result_rows(tag, inputs, base, DP, M, units):
+    from openet.conversions import mass_to_gas, mass_to_liquid
+
+    gas_unit, liquid_unit, standard = units
+    MW, rhos = base
+
+    MF = mass_to_gas(M, MW, gas_unit, standard)
+    VF = mass_to_liquid(M, inputs['rho'], liquid_unit)
+    SVF = mass_to_liquid(M, rhos, liquid_unit)
+
+    return [dict(tag=tag, dp=float(dp), mass_flow=float(m), gas_flow=float(mf), liquid_flow=float(vf),
+                 standard_liquid_flow=float(svf), error=None)
+            for dp, m, mf, vf, svf in zip(DP, M, MF, VF, SVF)]
+
+
+def _error_row(tag, error):
+    return dict(tag=tag, dp=None, mass_flow=None, gas_flow=None, liquid_flow=None,
+                standard_liquid_flow=None, error=str(error))
+
+
+def evaluate_chunk(rows, mode, dp_min, dp_max, points, units=('MSCFH', 'MBPD', '15C')):
+    """Solve one chunk of tags, runs in a worker process.
+
+    Tags sharing a meter type, taps and tap position are solved in a
+    single batched call; a failing batch is retried tag by tag so one bad
+    row only costs its own result."""
+
+    import numpy as np
+    from openet.engine.batch import solve_mass_flow
+    from openet.engine.units import INWC
+
+    out = {}
+    groups = {}
+
+    for i, row in enumerate(rows):
+        tag = row.get('tag') or str(i)
+        try:
+            inputs = tag_inputs(row)
+            base = base_inputs(row)
+            dp = _value(row, 'dp') if mode == 'point' else None
+            if mode == 'point' and dp is None:
+                raise ValueError("missing dp")
+        except (TypeError, ValueError) as e:
+            out[i] = [_error_row(tag, e)]
+            continue
+
+        group = (inputs['meter_type'], inputs['taps'], inputs['tap_position'])
+        groups.setdefault(group, []).append((i, tag, base, inputs, dp))
+
+    if mode == 'curve':
+        curve_dp = np.logspace(np.log10(dp_min), np.log10(dp_max), points + 1)
+
+    for (meter_type, taps, tap_position), members in groups.items():
+
+        def solve(members):
+            # Tags along the first axis, dP points along the second
+            args = {name: np.array([m[3][name] for m in members])[:, None]
+                    for name in ('P1', 'rho', 'mu', 'k', 'D', 'D2')}
+            if mode == 'point':
+                DP = np.array([float(m[4]) for m in members])[:, None]
+            else:
+                DP = np.broadcast_to(curve_dp, (len(members), curve_dp.size))
+
+            M = solve_mass_flow(P2=args['P1'] - DP*INWC, meter_type=meter_type, taps=taps,
+                                tap_position=tap_position, **args)
+            return DP, M
+
+        try:
+            results = [solve(members)]
+            batches = [members]
+        except Exception:
+            results, batches = [], []
+            for member in members:
+                try:
+                    results.append(solve([member]))
+                    batches.append([member])
+                except Exception as e:
+                    out[member[0]] = [_error_row(member[1], e)]
+
+        for (DP, M), batch in zip(results, batches):
+            for j, (i, tag, base, inputs, dp) in enumerate(batch):
+                out[i] = _result_rows(tag, inputs, base, DP[j], M[j], units)
+
+    return [r for i in sorted(out) for r in out[i]]
+
+
+# Entry point
+# ---------------------------------
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(prog='openet', description="Evaluate dP meter flow curves for a file of tags")
+    parser.add_argument('input', help="CSV or Parquet file of tag configurations")
+    parser.add_argument('output', help="CSV or Parquet file for the results")
+    parser.add_argument('--mode', choices=('curve', 'point'), default='curve',
+                        help="full flow curve per tag, or one operating point from the dp column")
+    parser.add_argument('--dp-min', type=float, default=1.0, help="curve start [inWC]")
+    parser.add_argument('--dp-max', type=float, default=250.0, help="curve end [inWC]")
+    parser.add_argument('--points', type=int, default=25, help="curve intervals, points + 1 values per tag")
+    parser.add_argument('--gas-unit', choices=sorted(GAS_UNITS), default='MSCFH')
+    parser.add_argument('--liquid-unit', choices=sorted(LIQUID_UNITS), default='MBPD')
+    parser.add_argument('--standard', choices=sorted(STANDARD_CONDITIONS), default='15C',
+                        help="standard conditions for the gas flow")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the number of cores")
+
+    return parser.parse_args(argv)
+
+
+def run(args, log=sys.stderr):
+    """Stream args.input through the pool into args.output, returns (tags, seconds)"""
+
+    from openet.engine.pool import ComputePool
+
+    pool = ComputePool(kind='process', workers=args.workers)
+    units = (args.gas_unit, args.liquid_unit, args.standard)
+    writer = open_writer(args.output)
+
+    # Submitted chunks in input order, bounded so memory stays flat
+    pending = deque()
+    max_pending = 2*pool.workers
+    tags = 0
+
+    start = time.perf_counter()
+    try:
+        for chunk in read_chunks(args.input, args.chunk_size):
+            tags += len(chunk)
+            pending.append(pool.submit(evaluate_chunk, chunk, args.mode, args.dp_min, args.dp_max, args.points, units))
+
+            while len(pending) >= max_pending:
+                writer.write(pending.popleft().result())
+
+        while pending:
+            writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    log.write("%d tags in %.2f s (%.0f tags/s)\n" % (tags, elapsed, tags/elapsed if elapsed else 0.0))
+
+    return tags, elapsed
+
+
+def main(argv=None):
+    run(parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import time
+import asyncio
+from functools import partial
+
+import numpy as np
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+from bokeh.document import without_document_lock
+from bokeh.models.widgets import MultiChoice, Div
+from bokeh.models import Legend
+from bokeh.palettes import turbo
+from bokeh.plotting import figure, ColumnDataSource
+
+from openet.constants import Meter_Type
+from openet.engine import curve_cache, curve_key, cache_curve, solve_curves, PoolBusy, BUSY_RETRIES
+
+
+# Meter types that need a tap position, see dPMeterSolver.read_inputs
+ECCENTRIC_METERS = ['Miller eccentric orifice', 'eccentric orifice', 'ISO 15377 eccentric orifice']
+
+
+# Class Definition
+# ---------------------------------
+# Comparison view for the dP meter solver, the same
+# inputs solved for several meter types at once
+
+
+class dPMeterCompare():
+    """Flow curves of the current inputs for a set of meter types, overlaid
+    with a legend.  Misses of the shared curve cache are solved in one pass,
+    split over the compute pool workers when there is a pool"""
+
+    def __init__(self, dpm):
+        """dpm -- the dPMeterSolver whose inputs are compared"""
+
+        lg.info("Initializing the dPMeterCompare")
+
+        self.dpm = dpm
+
+        # One color per meter type, the same whatever the selection
+        self._colors = dict(zip(Meter_Type, turbo(len(Meter_Type))))
+        self._generation = 0
+
+        self.source = ColumnDataSource(data=dict(xs=[], ys=[], meter=[], color=[], width=[]))
+
+        # Built when first shown, see dPMeterSolver.add_view
+        self.plot = None
+
+        self.setupwidgets()
+
+        dpm.add_view(self, "Compare")
+
+    def plotsetup(self):
+        """Setup the overlaid flow curves"""
+
+        self.plot = figure(plot_height=self.dpm._plotheight, plot_width=self.dpm._plotwidth, title="Meter Comparison",
+                           tools="crosshair,box_zoom,pan,reset,save,wheel_zoom")
+
+        self.plot.xaxis.axis_label = "Differential Pressure [inWC]"
+
+        # Outside the plot, there is one entry per meter type
+        self.plot.add_layout(Legend(click_policy='hide', label_text_font_size='8pt', glyph_height=10, spacing=0),
+                             'right')
+        self.plot.multi_line(xs='xs', ys='ys', line_color='color', line_width='width', legend_field='meter',
+                             source=self.source)
+
+    def setupwidgets(self):
+
+        options = [meter for meter in Meter_Type if meter != 'unspecified meter']
+        self.meter_choice = MultiChoice(title="Compare Meters:", value=options, options=options)
+        self.status = Div(text="")
+
+    def _curve(self, curve, meter_type):
+        """The dPMeterSolver curve arguments for another meter type"""
+
+        tap_position = self.dpm.tap_position.value if meter_type in ECCENTRIC_METERS else None
+        return dict(curve, meter_type=meter_type, tap_position=tap_position)
+
+    def update_data(self, attr, old, new):
+
+        if not self.dpm.showing(self):
+            return
+
+        self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self.dpm.display_unit()
+
+        self._generation += 1
+        generation = self._generation
+        start = time.perf_counter()
+
+        curve, rhos, MW = self.dpm.read_inputs()
+
+        curves = {}
+        todo = []
+        for meter_type in self.meter_choice.value:
+            args = self._curve(curve, meter_type)
+            key = curve_key(**args)
+            value = curve_cache.get(key)
+            if value is not None:
+                curves[meter_type] = value
+            else:
+                todo.append((meter_type, key, args))
+
+        pool = self.dpm._pool
+        if not todo or not pool.enabled:
+            results = solve_curves([args for _, _, args in todo])
+            self.apply_curves(generation, start, rhos, MW, curves, todo, results)
+            return
+
+        # One task per worker, slow scalar meters spread over all of them
+        chunks = [todo[i::pool.workers] for i in range(min(pool.workers, len(todo)))]
+        futures = []
+        for chunk in chunks:
+            try:
+                futures.append(pool.submit(solve_curves, [args for _, _, args in chunk]))
+            except PoolBusy:
+                futures.append(None)
+
+        self.dpm._doc.add_next_tick_callback(without_document_lock(partial(
+            self._await_curves, generation, start, rhos, MW, curves, chunks, futures)))
+
+    async def _await_curves(self, generation, start, rhos, MW, curves, chunks, futures):
+        """Collect the pool results without holding the document lock"""
+
+        todo, results = [], []
+        for chunk, future in zip(chunks, futures):
+            if future is None:
+                # Queue full, never solved here on the event loop every session shares
+                future = await self._submit_later(generation, chunk)
+
+            if future is None:
+                chunk_results = ["compute pool busy"]*len(chunk)
+            else:
+                try:
+                    chunk_results = await asyncio.wrap_future(future)
+                except Exception as e:
+                    lg.exception("Comparison solve failed")
+                    chunk_results = [str(e)]*len(chunk)
+            todo += chunk
+            results += chunk_results
+
+        self.dpm._doc.add_next_tick_callback(partial(self.apply_curves, generation, start, rhos, MW, curves,
+                                                     todo, results))
+
+    async def _submit_later(self, generation, chunk):
+        """Submit a chunk the pool refused again after BUSY_RETRIES waits,
+        None when it stays busy or the inputs change meanwhile"""
+
+        for delay in BUSY_RETRIES:
+            await asyncio.sleep(delay)
+            if generation != self._generation:
+                return None
+            try:
+                return self.dpm._pool.submit(solve_curves, [args for _, _, args in chunk])
+            except PoolBusy:
+                lg.debug("Compute pool busy, comparison chunk waits %.1f s", delay)
+        return None
+
+    def apply_curves(self, generation, start, rhos, MW, curves, todo, results):
+        """Cache the new curves and draw all of them, skipped meter types are listed in the status"""
+
+        skipped = {}
+        for (meter_type, key, _), result in zip(todo, results):
+            if isinstance(result, str):
+                skipped[meter_type] = result
+            else:
+                curves[meter_type] = cache_curve(key, *result)
+
+        if generation != self._generation:
+            return
+
+        current = self.dpm.meter_select.value
+        meters = [meter for meter in self.meter_choice.value if meter in curves]
+
+        self.source.data = dict(
+            xs=[curves[meter][0] for meter in meters],
+            ys=[self.dpm.display_flow(curves[meter][1], rhos, MW) for meter in meters],
+            meter=meters,
+            color=[self._colors[meter] for meter in meters],
+            width=[3 if meter == current else 1.5 for meter in meters])
+
+        text = "%d curves in %.0f ms" % (len(meters), (time.perf_counter() - start)*1000)
+        if skipped:
+            text += "<br>Skipped: " + "; ".join("%s (%s)" % (meter, reason) for meter, reason in skipped.items())
+        self.status.text = text
@@ -1,37 +1,98 @@
-import math
+'''
+Mass flow to volumetric flow conversions.
+
+Every conversion is one multiplication by a fused factor, so the helpers work
+the same on floats and on whole NumPy columns.  The factors are computed once
+per (unit, standard conditions) pair from exact unit definitions and cached.
+'''
+
+from functools import lru_cache
+
+
+# Exact unit definitions
+# ---------------------------------
+
+FT3 = 0.3048**3                 # m3 per cubic foot
+BBL = 42*3.785411784e-3         # m3 per US oil barrel
+R = 8.314462618                 # J/(mol K), gas constant
+ATM = 101325.0                  # Pa
+
+HOUR = 3600.0
+DAY = 86400.0
+
+# Standard (reference) conditions: temperature [K], pressure [Pa]
+STANDARD_CONDITIONS = {
+    '15C': (288.15, ATM),
+    '60F': ((60.0 - 32.0)*5.0/9.0 + 273.15, ATM),
+    '0C': (273.15, ATM),
+}
+
+# Standard gas volume units: m3 per unit, seconds per rate interval
+GAS_UNITS = {
+    'SCFH': (FT3, HOUR),
+    'MSCFH': (1e3*FT3, HOUR),
+    'MMSCFD': (1e6*FT3, DAY),
+    'm3/h': (1.0, HOUR),
+}
+
+# Liquid volume units: m3 per unit, seconds per rate interval
+LIQUID_UNITS = {
+    'BPD': (BBL, DAY),
+    'MBPD': (1e3*BBL, DAY),
+    'm3/h': (1.0, HOUR),
+}
+
+
+@lru_cache(maxsize=None)
+def molar_volume(standard='15C'):
+    """Ideal gas molar volume at the standard conditions [m3/kmol]"""
+
+    T, P = STANDARD_CONDITIONS[standard]
+    return R*1000.0*T/P
+
+
+@lru_cache(maxsize=None)
+def gas_factor(unit='MSCFH', standard='15C'):
+    """Factor f so that standard gas flow [unit] = f*m/MW, m in kg/s and MW in kg/kmol"""
+
+    volume, interval = GAS_UNITS[unit]
+    return interval*molar_volume(standard)/volume
+
+
+@lru_cache(maxsize=None)
+def liquid_factor(unit='MBPD'):
+    """Factor f so that liquid flow [unit] = f*m/den, m in kg/s and den in kg/m3"""
+
+    volume, interval = LIQUID_UNITS[unit]
+    return interval/volume
+
+
+def mass_to_gas(m, MW, unit='MSCFH', standard='15C'):
+    """Convert a mass flow [Kg/s] (float or array) to a standard gas volume flow"""
+
+    return m*(gas_factor(unit, standard)/MW)
+
+
+def mass_to_liquid(m, den, unit='MBPD'):
+    """Convert a mass flow [Kg/s] (float or array) to a liquid volume flow at density den"""
+
+    return m*(liquid_factor(unit)/den)
 
 
 def mass_to_volume(m,den):
     """
     Convert a mass flow from 'Kg/s' to MBPD (thousand barrels per day)
     """
-    
-    mf = m*60*60*24 # Kg/s -> Kg/day
-    mf = mf/den #Kg/day -> m3/day
-    mf = mf*6.289811 #CMD -> BPD
-    mf = mf/1000 #BPD -> MBPD
-    
-    #print(m,'Kg/s', MW,'g/mol', mf,'MMSCFD')
-    
-    return (mf)
+
+    return mass_to_liquid(m, den, 'MBPD')
 
 def mass_to_molar(m,MW):
     """
-    Convert a mass flow from 'Kg/s' to MMSCFD (thousand thousand standard cubic feet per day)
+    Convert a mass flow from 'Kg/s' to MSCFH (thousand standard cubic feet per hour)
     given the following assumptions for standard conditions:
 
     Temperature - 15 C
     Pressure - 1 ATM
     """
-    
-    mf = m*60*60 # Kg/s -> Kg/hr
-    mf = mf/MW #Kg/hr -> Kgmole/hr
-    mf = mf*22.414 #22.414 Nm3 per kmole Normal Volume occupies 22.414 [L/mol] [m3/kmol] [m3/kgmol]
-    mf = mf*((273+15)/273) #STP = 15oC, NTP 0oC: conversion from normal (0 C) to standard (15 C)
-    mf = mf*(3.282**3) # meters cubic to feet cubic
-    #mf = mf*24 # Scf/hr -> cf/day
-    mf = mf/1e3 #SCFH -> MSCFH
-    
-    #print(m,'Kg/s', MW,'g/mol', mf,'MMSCFD')
-    
-    return (mf)
\ No newline at end of file
+
+    return mass_to_gas(m, MW, 'MSCFH', '15C')
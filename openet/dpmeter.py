@@ -1,28 +1,102 @@
 import math
+import time
+import asyncio
+from functools import partial
+
 import numpy as np
 
 from bokeh.util.logconfig import bokeh_logger as lg
 
 from bokeh.io import curdoc
+from bokeh.document import without_document_lock
 from bokeh.layouts import row, column
-from bokeh.models.widgets import Slider, TextInput, RangeSlider, Spinner,CheckboxGroup,DataTable, TableColumn, NumberFormatter, Select
-from bokeh.models import Range1d, RadioButtonGroup
+from bokeh.models.widgets import Slider, TextInput, RangeSlider, Spinner,CheckboxGroup,DataTable, TableColumn, NumberFormatter, Select, Button, Div
+from bokeh.models import Range1d, RadioButtonGroup, CustomJS
 from bokeh.plotting import figure
-from bokeh.server.server import Server
-from bokeh.application import Application
-from bokeh.application.handlers.function import FunctionHandler
 from bokeh.plotting import figure, ColumnDataSource
 
 #from bokeh.themes import Theme
 #curdoc().theme = Theme(filename='/app/openet/theme.yaml')
 
-import fluids
-from fluids import nearest_pipe, differential_pressure_meter_solver
-from scipy.constants import psi, atm, inch,convert_temperature
+from openet.engine.units import psi, atm, inch
 
 
-from openet.conversions import mass_to_molar, mass_to_volume
+from openet.conversions import mass_to_gas, mass_to_liquid
+from openet.payload import PayloadMeter, measure_payload_default
 from openet.constants import Meter_Type, Tap_Position, Tap_Type
+from openet.engine import curve_cache, curve_key, cache_curve, solve_curve, get_pool, PoolBusy, BUSY_RETRIES
+from openet.engine.preview import curve_preview
+from openet.store import get_store
+from openet.metrics import (timed, CALLBACK_SECONDS, SOLVE_SECONDS, SOLVER_CALLS, SOLVER_FAILURES, CURVE_POINTS,
+                            PAYLOAD_BYTES)
+
+# Data table columns, (field, title, number format), the same for
+# every session. Bokeh models belong to a single document, so the
+# TableColumns and formatters themselves are built per session
+# (one formatter per format) and only for the table on show
+
+GAS_COLUMNS = [
+    ("x", "dP [inWC]", "0.0"),
+    ("kg", "Mass Flow [Kg/s]", "0.000"),
+    ("y", "Flow Rate [%(gas)s]", "0.00"),
+]
+
+LIQUID_COLUMNS = [
+    ("x", "dP [inWC]", "0.00"),
+    ("kg", "Mass Flow [Kg/s]", "0.000"),
+    ("v", "Flow Rate [%(liquid)s]", "0.000"),
+    ("y", "Standard Flow Rate [%(liquid)s]", "0.000"),
+]
+
+# Widgets whose value is saved with a tag, see tag_inputs
+TAG_WIDGETS = ['density', 'Pi', 'viscosity', 'isentropic', 'densitybase', 'orifice', 'pipe', 'molecular',
+               'meter_select', 'tap_select', 'tap_position']
+
+# Approximate curve drawn in the browser as soon as the density, pressure or
+# dP range changes, from the surrogate of the last solved curve (see
+# openet.engine.preview). Cleared by the server when the exact curve arrives
+PREVIEW_POINTS = 50
+
+PREVIEW_JS = '''
+const s = surrogate
+const rho = parseFloat(density.value)
+const psig = parseFloat(Pi.value)
+const [lo, hi] = DP_range.value
+
+function interp(v, xs, ys) {
+    // np.interp, held at the end values
+    const n = xs.length
+    if (!(v > xs[0])) return ys[0]
+    if (v >= xs[n - 1]) return ys[n - 1]
+    let i = 1
+    while (xs[i] < v) i++
+    return ys[i - 1] + (v - xs[i - 1])/(xs[i] - xs[i - 1])*(ys[i] - ys[i - 1])
+}
+
+const x = [], y = []
+if (s != null && rho > 0 && isFinite(psig) && lo > 0 && hi >= lo) {
+    const P1 = (psig + 14.7)*s.psi
+    const xmax = s.x[s.x.length - 1]
+
+    for (let j = 0; j < points; j++) {
+        const dp = lo*Math.pow(hi/lo, j/(points - 1))
+        if (dp*s.inwc/P1 > xmax) break
+
+        // m = K(Re)*epsilon*sqrt(rho dP), a few fixed point steps on Re
+        const m0 = interp(dp*s.inwc/P1, s.x, s.epsilon)*Math.sqrt(rho*dp*s.inwc)
+        let m = m0*s.K[s.K.length >> 1]
+        for (let i = 0; i < 4; i++)
+            m = m0*interp(Math.log10(m*s.re_factor), s.log_re, s.K)
+
+        x.push(dp)
+        y.push(m*s.scale)
+    }
+}
+
+if (x.length || source.data.x.length)
+    source.data = {x: x, y: y}
+'''
+
 
 # Class Definition
 # ---------------------------------
@@ -34,28 +108,94 @@ class dPMeterSolver():
     """Class to control the dP meter solver results for
     the diplay on the Bokeh server"""
 
-    def __init__(self):
-        """Initialize the opcua nodeid sensor."""
+    # One instance per session, no per instance __dict__
+    __slots__ = (
+        'ga', '_name', '_plotpoint', '_tolerance', '_maxpoints', '_plotx', '_ploty', '_dataz', '_datakg', '_datav',
+        '_plotheight', '_plotwidth', '_widgetwidth', '_tableheight', '_gas_unit', '_liquid_unit', '_standard',
+        '_columns_gas', '_columns_liquid', '_formatters', 'gas_data_table', 'liquid_data_table', 'table_row',
+        'source', 'plot', '_doc', '_debounce', '_pending', '_generation', '_pool', '_inflight', '_rerun',
+        '_sent', '_patchfraction', '_payload', '_views', '_plotviews', 'plot_column',
+        'text', 'density', 'Pi', 'viscosity', 'isentropic', 'densitybase', 'orifice', 'pipe', 'molecular',
+        'DP_range', 'radio_button_group', 'solver_select', 'view_select', 'meter_select', 'tap_select',
+        'tap_position', 'save_button', 'tag_status', 'preview', 'preview_js', '_preview_sent',
+        '_pending_tag',
+    )
+
+    def __init__(self, debounce=0.25, gas_unit='MSCFH', liquid_unit='MBPD', standard='15C', measure_payload=None,
+                 tolerance=None, max_points=200):
+        """Initialize the opcua nodeid sensor.
+
+        debounce -- seconds to wait for further widget changes before
+        recomputing the curve, 0 recomputes on the next tick
+        gas_unit, liquid_unit, standard -- display units and standard
+        conditions, see openet.conversions
+        measure_payload -- log the websocket bytes of every curve update,
+        defaults to the OPENET_MEASURE_PAYLOAD environment variable
+        tolerance, max_points -- adaptive curve sampling, see set_sampling,
+        off by default (the fixed grid of _plotpoint + 1 log spaced points)
+        """
 
         lg.info("Initializing the dPMeterSolver")
 
         self.ga = True
         self._name = "Name"
         self._plotpoint = 25
+        self._tolerance = tolerance
+        self._maxpoints = max_points
         self._plotx = None
         self._ploty = None
         self._plotheight = 600
         self._plotwidth = 800
         self._widgetwidth = 150
+        self._tableheight = 800
+
+        self._gas_unit = gas_unit
+        self._liquid_unit = liquid_unit
+        self._standard = standard
 
         self._columns_gas = None
         self._columns_liquid = None
+        self._formatters = {}
         self.gas_data_table = None
         self.liquid_data_table = None
+        self.table_row = None
 
         self.source = None
         self.plot = None
 
+        # (tag, inputs, curve key) saved without its curve, see save_tag
+        self._pending_tag = None
+
+        # Browser side preview, see PREVIEW_JS and ship_preview
+        self.preview = None
+        self.preview_js = None
+        self._preview_sent = None
+
+        # Update scheduling, see request_update
+        self._doc = curdoc()
+        self._debounce = debounce
+        self._pending = None
+        self._generation = 0
+
+        # Off event loop solves, see _flush_update
+        self._pool = get_pool()
+        self._inflight = False
+        self._rerun = False
+
+        # Columns last sent to the browser, see push_columns
+        self._sent = {}
+        self._patchfraction = 0.25
+
+        # Websocket bytes per update, see openet.payload
+        if measure_payload is None:
+            measure_payload = measure_payload_default()
+        self._payload = PayloadMeter(self._doc) if measure_payload else None
+
+        # Extra views sharing the input widgets, see add_view
+        self._views = []
+        self._plotviews = [self]
+        self.plot_column = None
+
         self.data_init()
 
         self.plotsetup()
@@ -91,43 +231,55 @@ class dPMeterSolver():
                     tools="crosshair,box_zoom,pan,reset,save,wheel_zoom")
 
         self.plot.xaxis.axis_label = "Differential Pressure [inWC]"
-        self.plot.yaxis.axis_label = "Flow at Base conditions [MSCFH]"
+        self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self._gas_unit
         self.plot.line('x', 'y', source=self.source)
 
+        self.preview = ColumnDataSource(data=dict(x=[], y=[]))
+        self.plot.line('x', 'y', source=self.preview, line_dash='dashed', line_color='orange', line_width=2)
+
+        # Holds the plot picked in view_select, see update_view
+        self.plot_column = column(self.plot)
+
     
     def tablesetup(
         self,
     ):
-        """Setup the main TableColumns for the liquid and gas data tables"""
-        # Setup Gas Table Space
-        # ------------------------
-
-        self._columns_gas = [
-            TableColumn(field="x", title="dP [inWC]", formatter=NumberFormatter(format="0.0")),
-            TableColumn(field="kg", title="Mass Flow [Kg/s]", formatter=NumberFormatter(format="0.000")),
-            TableColumn(field="y", title="Flow Rate [MSCFH]",formatter=NumberFormatter(format="0.00"))
-            ]
-
-        tablewidth=450
+        """Setup the data table row, only the table of the current
+        gas/liquid mode is built, the other one on first use"""
 
-        self.gas_data_table = DataTable(source=self.source, columns=self._columns_gas, width=tablewidth, height=800)
+        self.table_row = row()
+        self.show_table()
 
+    def _table_columns(self, columns):
+        units = dict(gas=self._gas_unit, liquid=self._liquid_unit)
 
-        # Setup Liquid Table Space
-        # ------------------------
-        # source.data = dict(x=DP, y=SVF, v=VF, z=MF, kg=M)
+        table_columns = []
+        for field, title, number_format in columns:
+            formatter = self._formatters.get(number_format)
+            if formatter is None:
+                formatter = self._formatters[number_format] = NumberFormatter(format=number_format)
+            table_columns.append(TableColumn(field=field, title=title % units, formatter=formatter))
+        return table_columns
 
-        self._columns_liquid = [
-            TableColumn(field="x", title="dP [inWC]", formatter=NumberFormatter(format="0.00")),
-            TableColumn(field="kg", title="Mass Flow [Kg/s]", formatter=NumberFormatter(format="0.000")),
-            TableColumn(field="v", title="Flow Rate [MBPD]",formatter=NumberFormatter(format="0.000")),
-            TableColumn(field="y", title="Standard Flow Rate [MSBPD]",formatter=NumberFormatter(format="0.000"))
-            ]
+    def show_table(self):
+        """Put the table of the current mode in table_row, building it if needed"""
 
-        tablewidth=600
+        if self.ga:
+            if self.gas_data_table is None:
+                self._columns_gas = self._table_columns(GAS_COLUMNS)
+                self.gas_data_table = DataTable(source=self.source, columns=self._columns_gas, width=450,
+                                                height=self._tableheight)
+            table = self.gas_data_table
 
-        self.liquid_data_table = DataTable(source=self.source, columns=self._columns_liquid, width=tablewidth, height=800)
+        else:
+            # source.data = dict(x=DP, y=SVF, v=VF, z=MF, kg=M)
+            if self.liquid_data_table is None:
+                self._columns_liquid = self._table_columns(LIQUID_COLUMNS)
+                self.liquid_data_table = DataTable(source=self.source, columns=self._columns_liquid, width=600,
+                                                   height=self._tableheight)
+            table = self.liquid_data_table
 
+        self.table_row.children = [table]
 
     def setupwidgets(self):
         # Set up widgets
@@ -145,8 +297,6 @@ class dPMeterSolver():
         # Disable test widgets for current gas/liquid mode. (self.ga)
         self.molecular.disabled         = not(self.ga)
         self.densitybase.disabled       = self.ga
-        self.gas_data_table.visible     = self.ga
-        self.liquid_data_table.visible  = not(self.ga)
 
 
         ## RangeSliders
@@ -157,13 +307,338 @@ class dPMeterSolver():
         self.radio_button_group = RadioButtonGroup(labels=labels, active=0) 
         #self.ga inits to true. "gas active", which is the first index, or 0, which is active
 
+        # Exact correlations, or the interpolated tables of openet.engine.surrogate
+        self.solver_select = RadioButtonGroup(labels=["Exact", "Surrogate"], active=0)
+
+        # One label per plot, see add_view
+        self.view_select = RadioButtonGroup(labels=["Flow Curve"], active=0)
+
         # Selection Options
         self.meter_select = Select(title="Meter Type:", value="ISO 5167 orifice", options=Meter_Type)
         self.tap_select = Select(title="Tap Location:", value="flange", options=Tap_Type, width=self._widgetwidth)
         self.tap_position = Select(title="Tap Position:", value="180 degree", options=Tap_Position, width=self._widgetwidth)
 
-    def update_data(self, attr, old, new):
+        # Saved tags, see save_tag and load_tag
+        self.save_button = Button(label="Save Tag", width=self._widgetwidth)
+        self.tag_status = Div(text="")
+
+        # Redrawn in the browser right away, the slider while it is dragged
+        self.preview_js = CustomJS(args=dict(source=self.preview, density=self.density, Pi=self.Pi,
+                                             DP_range=self.DP_range, points=PREVIEW_POINTS, surrogate=None),
+                                   code=PREVIEW_JS)
+        for w in [self.density, self.Pi, self.DP_range]:
+            w.js_on_change('value', self.preview_js)
+
+    def tag_inputs(self):
+        """JSON-able widget state saved with a tag"""
+
+        inputs = {name: getattr(self, name).value for name in TAG_WIDGETS}
+        inputs.update(DP_range=list(self.DP_range.value), gas=self.radio_button_group.active,
+                      solver=self.solver_select.active)
+        return inputs
+
+    def apply_tag_inputs(self, inputs):
+        """Set the widgets to saved tag_inputs, the changes go through request_update"""
+
+        for name in TAG_WIDGETS:
+            if name in inputs:
+                getattr(self, name).value = inputs[name]
+        if 'DP_range' in inputs:
+            self.DP_range.value = tuple(inputs['DP_range'])
+        if 'gas' in inputs:
+            self.radio_button_group.active = inputs['gas']
+        if 'solver' in inputs:
+            self.solver_select.active = inputs['solver']
+
+        # The slider only reports value_throttled from the browser
+        self.request_update(None, None, None)
+
+    def save_tag(self):
+        """Button callback, store the inputs and curve under the tag name, see openet.store"""
+
+        tag = self.text.value.strip()
+        if not tag or tag.startswith('#'):
+            self.tag_status.text = "Enter a tag name to save"
+            return
+
+        try:
+            curve, _, _ = self._read_inputs_counted()
+        except ValueError as e:
+            self.tag_status.text = "Not saved: %s" % e
+            return
+
+        key = curve_key(**curve)
+        value = curve_cache.get(key)
+        inputs = self.tag_inputs()
+
+        if value is None:
+            # Not solved yet, the inputs now and the curve once the update applies it
+            self._pending_tag = tag, inputs, key
+            value = None, None
+
+        if self._store_tag(tag, inputs, key, *value) and value[0] is None:
+            self.tag_status.text = "Saved %s inputs, solving its curve" % tag
+            self.request_update(None, None, None)
+
+    def _store_tag(self, tag, inputs, key, DP, M):
+        try:
+            get_store().save(tag, inputs, key, DP, M)
+        except Exception as e:
+            lg.exception("Saving tag %s failed", tag)
+            self.tag_status.text = "Not saved: %s" % e
+            return False
+
+        self.tag_status.text = "Saved %s" % tag
+        return True
+
+    def load_tag(self, attr, old, new):
+        """Tag name callback, restore a saved tag.  When its inputs still solve to
+        the stored curve key the stored curve goes into the curve cache, so the
+        update that follows draws it without solving"""
+
+        tag = new.strip()
+        if not tag or tag.startswith('#'):
+            return
+
+        try:
+            saved = get_store().load(tag)
+        except Exception:
+            lg.exception("Loading tag %s failed", tag)
+            return
+
+        if saved is None:
+            self.tag_status.text = ""
+            return
+
+        self.apply_tag_inputs(saved['inputs'])
+
+        try:
+            curve, _, _ = self.read_inputs()
+        except ValueError:
+            self.tag_status.text = "Loaded %s" % tag
+            return
+
+        key = curve_key(**curve)
+        if saved['DP'] is not None and repr(key) == saved['curve_key']:
+            if curve_cache.get(key) is None:
+                cache_curve(key, saved['DP'], saved['M'])
+            self.tag_status.text = "Loaded %s" % tag
+        else:
+            # Sampling settings changed since it was saved, solved again
+            self.tag_status.text = "Loaded %s inputs" % tag
+
+    def set_sampling(self, tolerance=None, max_points=200):
+        """Sample the curve adaptively, up to tolerance (linear interpolation
+        error relative to the flow) with at most max_points points, see
+        openet.engine.adaptive.  No tolerance goes back to the fixed grid
+        of _plotpoint + 1 log spaced points."""
+
+        self._tolerance = tolerance
+        self._maxpoints = max_points
+        self.request_update(None, None, None)
+
+    def request_update(self, attr, old, new):
+        """Widget callback, coalesces a burst of changes into one update_data
+        of the latest widget state once the debounce window has passed"""
 
+        self._generation += 1
+
+        if self._pending is not None:
+            if self._debounce <= 0:
+                # Already queued for the next tick
+                return
+            self._doc.remove_timeout_callback(self._pending)
+
+        if self._debounce > 0:
+            self._pending = self._doc.add_timeout_callback(self._flush_update, int(self._debounce*1000))
+        else:
+            self._pending = self._doc.add_next_tick_callback(self._flush_update)
+
+    def _flush_update(self):
+        """The debounced callback, its handle is no longer pending"""
+
+        self._pending = None
+        self._flush()
+
+    def _flush(self):
+        """Update the curve, on the compute pool when one is configured, then the views.
+        A failing curve or view is logged and does not stop the others"""
+
+        if not self._pool.enabled:
+            self.update_data(None, None, None)
+            return
+
+        with timed(CALLBACK_SECONDS.labels('flush_update')):
+            try:
+                self._submit_curve()
+            except Exception:
+                lg.exception("Curve update failed")
+
+            self._update_views()
+
+    def _submit_curve(self):
+        if self._inflight:
+            # One solve per session at a time, rerun with the latest state when it is back
+            self._rerun = True
+            return
+
+        generation = self._generation
+        curve, rhos, MW = self._read_inputs_counted()
+
+        key = curve_key(**curve)
+        value = curve_cache.get(key)
+        if value is not None:
+            self.apply_curve(generation, curve, rhos, MW, *value)
+            return
+
+        try:
+            future = self._pool.submit(solve_curve, **curve)
+        except PoolBusy:
+            lg.debug("Compute pool busy, retrying")
+            if self._pending is None:
+                self._pending = self._doc.add_timeout_callback(self._flush_update,
+                                                               int(max(self._debounce, 0.1)*1000))
+            return
+
+        SOLVER_CALLS.labels(curve['meter_type']).inc()
+
+        self._inflight = True
+        self._doc.add_next_tick_callback(without_document_lock(partial(
+            self._await_curve, future, generation, key, curve, rhos, MW,
+            curve['meter_type'], time.perf_counter())))
+
+    async def _await_curve(self, future, generation, key, curve, rhos, MW, meter_type, start):
+        """Wait for a pool solve without holding the document lock,
+        the result is applied on a later locked tick"""
+
+        try:
+            DP, M = await asyncio.wrap_future(future)
+        except Exception:
+            SOLVER_FAILURES.labels('solve').inc()
+            lg.exception("Curve solve failed")
+            self._doc.add_next_tick_callback(self._solve_done)
+            return
+        finally:
+            SOLVE_SECONDS.labels(meter_type, 'pool').observe(time.perf_counter() - start)
+
+        CURVE_POINTS.observe(len(DP))
+        cache_curve(key, DP, M)
+        self._doc.add_next_tick_callback(partial(self._solve_done, generation, curve, rhos, MW, DP, M))
+
+    def _solve_done(self, *result):
+        self._inflight = False
+
+        if result:
+            self.apply_curve(*result)
+        else:
+            self.clear_preview()
+
+        if self._rerun:
+            self._rerun = False
+            # A flush still queued picks up the latest state itself
+            if self._pending is None:
+                self._flush()
+
+    def add_view(self, view, label=None):
+        """Register a view (e.g. dPMeterSizing) whose update_data runs with every curve update.
+        With a label, view.plot takes the place of the flow curve when selected in view_select,
+        view.plotsetup() builds it the first time"""
+
+        self._views.append(view)
+
+        if label is not None:
+            self._plotviews.append(view)
+            self.view_select.labels = self.view_select.labels + [label]
+
+    def submit_view(self, view, done, failed, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) for a view, on the compute pool when there is
+        one, and call done(result) or failed(message) with the document
+        locked.  A busy pool is asked again after each of BUSY_RETRIES,
+        then the work fails with "compute pool busy"; it is never solved on
+        the event loop while a pool is configured.  Retries stop, failing
+        with "superseded", once view._generation moves on.  Without a pool
+        fn runs right away.
+        """
+
+        self._submit_view(view, view._generation, BUSY_RETRIES, done, failed, fn, args, kwargs)
+
+    def _submit_view(self, view, generation, retries, done, failed, fn, args, kwargs):
+        if generation != view._generation:
+            failed("superseded")
+            return
+
+        if not self._pool.enabled:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                lg.exception("%s update failed", type(view).__name__)
+                failed(str(e))
+                return
+            done(result)
+            return
+
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except PoolBusy:
+            if not retries:
+                failed("compute pool busy")
+                return
+            lg.debug("Compute pool busy, %s waits %.2f s", type(view).__name__, retries[0])
+            self._doc.add_timeout_callback(partial(self._submit_view, view, generation, retries[1:], done, failed,
+                                                   fn, args, kwargs), int(retries[0]*1000))
+            return
+
+        self._doc.add_next_tick_callback(without_document_lock(partial(self._await_view, view, future, done,
+                                                                       failed)))
+
+    async def _await_view(self, view, future, done, failed):
+        """Wait for a view's pool work without holding the document lock"""
+
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception as e:
+            lg.exception("%s update failed", type(view).__name__)
+            self._doc.add_next_tick_callback(partial(failed, str(e)))
+            return
+
+        self._doc.add_next_tick_callback(partial(done, result))
+
+    def showing(self, view):
+        """Whether the plot of view is the one on show"""
+
+        return view.plot is not None and self.plot_column.children[0] is view.plot
+
+    def update_view(self, attr, old, new):
+        """Show the plot picked in view_select"""
+
+        view = self._plotviews[self.view_select.active]
+        if view.plot is None:
+            view.plotsetup()
+        self.plot_column.children = [view.plot]
+
+        self.request_update(attr, old, new)
+
+    def display_flow(self, M, rhos, MW):
+        """Mass flow [Kg/s] to the flow on the y axis, standard gas or standard liquid flow"""
+
+        if self.ga:
+            return mass_to_gas(M, MW, self._gas_unit, self._standard)
+        return mass_to_liquid(M, rhos, self._liquid_unit)
+
+    def display_unit(self):
+        return self._gas_unit if self.ga else self._liquid_unit
+
+    def _update_views(self):
+        for view in self._views:
+            try:
+                view.update_data(None, None, None)
+            except Exception:
+                lg.exception("%s update failed", type(view).__name__)
+
+    def read_inputs(self):
+        """Read the input widgets, returns the mass_flow_curve arguments
+        plus the base density and molecular weight used for unit conversion"""
 
         #Get Text Input and update plot title
         self.plot.title.text = self.text.value
@@ -198,49 +673,179 @@ class dPMeterSolver():
         dp_max=slider_value[1]
 
 
-        steps = self._plotpoint        
-        Log_steps = 10**np.linspace(math.log10(dp_min),math.log10(dp_max),steps+1)
+        # Fixed grid, or the point budget of the adaptive sampling
+        if self._tolerance is None:
+            steps = self._plotpoint
+        else:
+            steps = self._maxpoints - 1
 
+        surrogate = self.solver_select.active == 1
 
-        DP = []
-        MF = []
-        VF = []
-        SVF = []
-        M = []
+        curve = dict(P1=P1, rho=rho, mu=mu, k=k, D=Di, D2=Do, meter_type=meter, taps='flange',
+                     tap_position=tap_position, dp_min=dp_min, dp_max=dp_max, points=steps, surrogate=surrogate,
+                     tolerance=self._tolerance)
 
+        return curve, rhos, MW
 
-        for i,dP in enumerate(Log_steps):
-            #   print(i,dP)
-            DP.append(dP)
+    def _read_inputs_counted(self):
+        try:
+            return self.read_inputs()
+        except ValueError:
+            SOLVER_FAILURES.labels('inputs').inc()
+            raise
 
-            P2 = P1 - (dP*248.84)
-            
-            m = differential_pressure_meter_solver(D=Di, D2=Do, P1=P1, P2=P2, rho=rho, mu=mu, k=k, meter_type=meter, taps='flange', tap_position=tap_position)
-            
-            M.append(m)
+    def _solve(self, curve):
+        """solve_curve on the event loop, with its metrics"""
 
-            #Calculate the standard molar gas flow
-            mf = mass_to_molar(m, MW)
-            MF.append(mf)
-            
-            #Calculate Volumetric Flow
-            vf = mass_to_volume(m, rho)
-            VF.append(vf)
-            SVF.append(vf*rho/rhos)
+        SOLVER_CALLS.labels(curve['meter_type']).inc()
+
+        try:
+            with timed(SOLVE_SECONDS.labels(curve['meter_type'], 'inline')):
+                DP, M = solve_curve(**curve)
+        except Exception:
+            SOLVER_FAILURES.labels('solve').inc()
+            raise
+
+        CURVE_POINTS.observe(len(DP))
+        return DP, M
+
+    def update_data(self, attr, old, new):
+
+        with timed(CALLBACK_SECONDS.labels('update_data')):
+            try:
+                self._solve_current()
+            except Exception:
+                lg.exception("Curve update failed")
+
+            self._update_views()
+
+    def _solve_current(self):
+
+        # Widget state this result is computed from, anything newer supersedes it
+        generation = self._generation
+
+        curve, rhos, MW = self._read_inputs_counted()
+
+        # Solve the whole curve in one batch, or reuse it from the shared cache.
+        # Unit conversions are applied after the lookup so gas and liquid views
+        # share the same solved mass flow
+        key = curve_key(**curve)
+        value = curve_cache.get(key)
+        if value is None:
+            value = cache_curve(key, *self._solve(curve))
+        lg.debug("Curve cache %s", curve_cache.stats())
+
+        self.apply_curve(generation, curve, rhos, MW, *value)
+
+    def apply_curve(self, generation, curve, rhos, MW, DP, M):
+        """Convert a solved curve to the display units and push it to the browser,
+        with the surrogate of the next preview"""
+
+        if generation != self._generation:
+            lg.debug("Dropping stale curve, generation %s superseded by %s", generation, self._generation)
+            return
+
+        rho = curve['rho']
+
+        if self._pending_tag is not None:
+            tag, inputs, key = self._pending_tag
+            if curve_key(**curve) == key:
+                self._pending_tag = None
+                self._store_tag(tag, inputs, key, DP, M)
+
+        #Calculate the standard molar gas flow
+        MF = mass_to_gas(M, MW, self._gas_unit, self._standard)
+
+        #Calculate Volumetric Flow, actual and at base density
+        VF = mass_to_liquid(M, rho, self._liquid_unit)
+        SVF = mass_to_liquid(M, rhos, self._liquid_unit)
 
 
         # Update Plotable Data
         # --------------------------------
         if self.ga:
 
-            self.source.data = dict(x=DP, y=MF, v=VF, z=SVF, kg=M)
+            self.push_columns(dict(x=DP, y=MF, v=VF, z=SVF, kg=M))
 
         else:
 
-            self.source.data = dict(x=DP, y=SVF, v=VF, z=MF, kg=M)
+            self.push_columns(dict(x=DP, y=SVF, v=VF, z=MF, kg=M))
+
+        self.ship_preview(curve, rhos, MW, DP, M)
+
+        if self._payload is not None:
+            size = self._payload.take()
+            PAYLOAD_BYTES.inc(size)
+            lg.info("Curve update sent %d bytes", size)
+
+    def ship_preview(self, curve, rhos, MW, DP, M):
+        """Send the preview surrogate of a solved curve, if it changed, and
+        replace the preview with the exact curve"""
+
+        try:
+            surrogate = curve_preview(curve, DP, M)
+        except Exception:
+            lg.exception("Preview surrogate failed")
+            surrogate = None
+
+        if surrogate is not None:
+            # Display flow per kg/s, both conversions are linear in the mass flow
+            surrogate['scale'] = float(self.display_flow(1.0, rhos, MW))
+
+        if surrogate != self._preview_sent:
+            self.preview_js.args = dict(self.preview_js.args, surrogate=surrogate)
+            self._preview_sent = surrogate
+
+        self.clear_preview()
+
+    def clear_preview(self):
+        if len(self.preview.data['x']):
+            self.preview.data = dict(x=[], y=[])
+
+    def push_columns(self, columns):
+        """Send only what changed since the last update: nothing for an
+        identical column, a patch when a few rows changed, and the whole
+        column (as a binary float64 buffer) otherwise"""
+
+        # Private copies, patches change the source's arrays in place and the
+        # solved arrays can be read only views shared through the curve cache
+        columns = {name: np.array(value, dtype=np.float64) for name, value in columns.items()}
+        sent = self._sent
+
+        if any(name not in sent or sent[name].shape != value.shape for name, value in columns.items()):
+            # New length, all columns have to go together
+            self.source.data = columns
+            self._sent = columns
+            return
+
+        replace = {}
+        patches = {}
+        for name, value in columns.items():
+            with np.errstate(invalid='ignore'):
+                changed = np.flatnonzero(~((value == sent[name]) | (np.isnan(value) & np.isnan(sent[name]))))
+
+            if not changed.size:
+                continue
+
+            # Patches are JSON, about three times the bytes of a binary row
+            if changed.size <= self._patchfraction*value.size and np.isfinite(value[changed]).all():
+                patches[name] = [(int(i), float(value[i])) for i in changed]
+            else:
+                replace[name] = value
+
+        if replace:
+            self.source.data.update(replace)
+        if patches:
+            self.source.patch(patches)
+
+        self._sent = columns
 
     
     def update_selection(self, attr, old, new):
+        with timed(CALLBACK_SECONDS.labels('update_selection')):
+            self._update_selection(attr, old, new)
+
+    def _update_selection(self, attr, old, new):
         lg.info("Update Selection Called")
 
         Selector = int(self.radio_button_group.active)
@@ -257,16 +862,15 @@ class dPMeterSolver():
         self.densitybase.disabled = self.ga
 
 
-        self.gas_data_table.visible = self.ga
-        self.liquid_data_table.visible = not(self.ga)
+        self.show_table()
 
 
         if self.ga:
             
-            self.plot.yaxis.axis_label = "Flow at Base conditions [MSCFH]"
+            self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self._gas_unit
 
         else:
 
-            self.plot.yaxis.axis_label = "Flow at Base conditions [MBPD]"
+            self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self._liquid_unit
 
-        self.update_data(attr, old, new)
\ No newline at end of file
+        self.request_update(attr, old, new)
\ No newline at end of file
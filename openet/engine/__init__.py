@@ -0,0 +1,55 @@
+'''
+Headless flow meter curve engine.
+
+Imports no Bokeh, and nothing heavy at import time either: the names below
+are resolved on first access (numpy with the solver, fluids only for the
+scalar fallback, the pool machinery only when a pool is used).  Check with
+
+    python -X importtime -c "import openet.engine"
+'''
+
+import importlib
+
+
+_EXPORTS = {
+    'solve_mass_flow': 'openet.engine.batch',
+    'solve_curve': 'openet.engine.batch',
+    'solve_curves': 'openet.engine.batch',
+    'solve_readings': 'openet.engine.batch',
+    'BATCH_METER_TYPES': 'openet.engine.batch',
+    'adaptive_curve': 'openet.engine.adaptive',
+    'solve_bore': 'openet.engine.sizing',
+    'solve_dp': 'openet.engine.sizing',
+    'sizing_grid': 'openet.engine.sizing',
+    'get_surrogate': 'openet.engine.surrogate',
+    'solve_mass_flow_surrogate': 'openet.engine.surrogate',
+    'flow_percentiles': 'openet.engine.uncertainty',
+    'mass_flow_curve': 'openet.engine.cache',
+    'curve_cache': 'openet.engine.cache',
+    'curve_key': 'openet.engine.cache',
+    'cache_curve': 'openet.engine.cache',
+    'CurveCache': 'openet.engine.cache',
+    'get_pool': 'openet.engine.pool',
+    'configure_pool': ('openet.engine.pool', 'configure'),
+    'configure_from_args': 'openet.engine.pool',
+    'PoolBusy': 'openet.engine.pool',
+    'BUSY_RETRIES': 'openet.engine.pool',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        target = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    module, attr = target if isinstance(target, tuple) else (target, name)
+    value = getattr(importlib.import_module(module), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,120 @@
+'''
+Process wide LRU cache of solved meter curves.
+
+Every Bokeh session served by the same process shares one cache, so a curve
+solved once (by this session or any other) is reused when the same inputs
+come back, e.g. toggling Gas/Liquid or editing only the tag name.  Only the
+mass flow is cached; unit conversions are applied by the caller afterwards.
+'''
+
+import os
+import threading
+from collections import OrderedDict
+
+from openet.engine.batch import solve_curve
+
+
+DEFAULT_CACHE_SIZE = 512
+
+
+def _norm(value):
+    """Round float inputs so that text widget noise ('100' vs '100.0') hits the same key"""
+
+    return float('%.12g' % float(value))
+
+
+def curve_key(P1, rho, mu, k, D, D2, meter_type, taps, tap_position, dp_min, dp_max, points, surrogate=False,
+              tolerance=None):
+    """Normalized, hashable cache key for a flow curve"""
+
+    return (_norm(P1), _norm(rho), _norm(mu), _norm(k), _norm(D), _norm(D2),
+            meter_type, taps, tap_position, _norm(dp_min), _norm(dp_max), int(points), bool(surrogate),
+            None if tolerance is None else _norm(tolerance))
+
+
+class CurveCache():
+    """Size bounded, thread safe LRU mapping of curve keys to (dP, mass flow) arrays"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries"""
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Counters used to size the cache"""
+
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    size=len(self._data), maxsize=self.maxsize)
+
+
+curve_cache = CurveCache(maxsize=int(os.environ.get('OPENET_CURVE_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
+
+
+def cache_curve(key, DP, M):
+    """Store a solved curve under key, the arrays are made read only"""
+
+    DP.setflags(write=False)
+    M.setflags(write=False)
+
+    curve_cache.put(key, (DP, M))
+    return DP, M
+
+
+def mass_flow_curve(P1, rho, mu, k, D, D2, meter_type, taps, tap_position, dp_min, dp_max, points, surrogate=False,
+                    tolerance=None):
+    """
+    Log spaced dP [inWC] and mass flow [kg/s] arrays for a meter,
+    `points` + 1 points between dp_min and dp_max, adaptively
+    sampled with a tolerance, see solve_curve.
+
+    Results come from the shared curve_cache when the same inputs were
+    solved before, exact and surrogate curves are cached apart. The
+    returned arrays are read only.
+    """
+
+    key = curve_key(P1, rho, mu, k, D, D2, meter_type, taps, tap_position, dp_min, dp_max, points, surrogate,
+                    tolerance)
+
+    value = curve_cache.get(key)
+    if value is not None:
+        return value
+
+    return cache_curve(key, *solve_curve(P1, rho, mu, k, D, D2, meter_type, taps, tap_position, dp_min, dp_max, points,
+                                         surrogate, tolerance))
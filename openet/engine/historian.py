@@ -0,0 +1,294 @@
+'''
+Historian replay: flow and totals of a long dP record through one meter.
+
+    replay(path, curve, output)     reads the record chunk by chunk, solves
+                                    the mass flow of every reading, writes
+                                    (t, dp, kg) records to `output` and
+                                    returns the hourly totals
+    ReplaySeries(output)            memory map of those records, downsampled
+                                    to a window and a point count with LTTB
+
+A record is a CSV file of "time,dp" lines (optional header, time in seconds
+since the epoch or an ISO 8601 timestamp, dP in inWC) or a Parquet file with
+time and dp columns (needs pyarrow).  CSV files are memory mapped and parsed
+a block of lines at a time, Parquet files are read a row batch at a time, so
+memory stays bounded by chunk_rows however long the record is.  Readings are
+solved with solve_readings, with the exact correlations unless the curve asks
+for the surrogate tables (openet.engine.surrogate, faster for the meter types
+fluids solves point by point but only within their error bound).  A reading
+at or below zero is no flow.
+
+Totals hold every reading until the next one, as historians interpolate
+stepped values, and are binned by the UTC hour the interval starts in.
+
+Reference:
+Steinarsson, S., 2013, Downsampling Time Series for Visual Representation,
+MSc thesis, University of Iceland (Largest Triangle Three Buckets)
+'''
+
+import mmap
+import os
+
+import numpy as np
+
+from openet.engine.batch import solve_readings, METER_ALIASES, BATCH_METER_TYPES
+
+
+# Readings parsed, solved and written at once
+CHUNK_ROWS = 2**16
+
+HOUR = 3600.0
+DAY = 86400.0
+
+# Column names taken as the time column, the dP column is 'dp' or the other one
+TIME_COLUMNS = ('time', 'timestamp', 't', 'date', 'datetime')
+
+# Solved readings on disk: time [s since epoch], dP [inWC], mass flow [kg/s]
+RECORD = np.dtype([('t', 'f8'), ('dp', 'f8'), ('kg', 'f8')])
+
+
+def _columns(names):
+    """Indices of the time and dP columns"""
+
+    names = [name.strip().lower() for name in names]
+    t = next((i for i, name in enumerate(names) if name in TIME_COLUMNS), 0)
+    dp = names.index('dp') if 'dp' in names else next(i for i in range(len(names)) if i != t)
+    return t, dp
+
+
+def _seconds(values):
+    """Seconds since the epoch of numbers, datetime64 or ISO 8601 strings"""
+
+    values = np.asarray(values)
+    if values.dtype.kind in 'US':
+        try:
+            return values.astype(np.float64)
+        except ValueError:
+            values = values.astype('datetime64[ms]')
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ms]').astype(np.int64)/1000.0
+    return values.astype(np.float64)
+
+
+def _csv_chunks(path, chunk_rows):
+
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+
+            end = data.find(b'\n')
+            first = data[:size if end < 0 else end].decode().split(',')
+            if len(first) < 2:
+                raise ValueError("%s: expected time,dp columns" % path)
+
+            try:
+                float(first[-1])
+                columns, pos = (0, 1), 0
+            except ValueError:
+                # Header line
+                columns, pos = _columns(first), size if end < 0 else end + 1
+
+            # Epoch seconds parse straight to floats, timestamps as strings first
+            line_end = data.find(b'\n', pos)
+            sample = data[pos:size if line_end < 0 else line_end].decode().split(',')
+            try:
+                float(sample[columns[0]])
+                dtype = np.float64
+            except (ValueError, IndexError):
+                dtype = str
+
+            # Blocks of about chunk_rows lines, split at a line end
+            block = max(len(first[0]) + 16, 1)*chunk_rows
+            page = mmap.ALLOCATIONGRANULARITY
+            while pos < size:
+                end = data.find(b'\n', min(pos + block, size - 1))
+                end = size if end < 0 else end + 1
+
+                lines = data[pos:end].decode().splitlines()
+
+                # Parsed pages are not needed again, keeps the mapping's resident size bounded
+                done = end // page * page
+                if hasattr(data, 'madvise') and done > pos // page * page:
+                    data.madvise(mmap.MADV_DONTNEED, pos // page * page, done - pos // page * page)
+                pos = end
+
+                values = np.loadtxt(lines, delimiter=',', usecols=columns, dtype=dtype, ndmin=2)
+                if len(values):
+                    yield _seconds(values[:, 0]), values[:, 1].astype(np.float64)
+
+
+def _parquet_chunks(path, chunk_rows):
+
+    import pyarrow.parquet as pq
+
+    table = pq.ParquetFile(path, memory_map=True)
+    names = table.schema_arrow.names
+    t, dp = _columns(names)
+
+    for batch in table.iter_batches(batch_size=chunk_rows, columns=[names[t], names[dp]]):
+        yield (_seconds(batch.column(0).to_numpy(zero_copy_only=False)),
+               batch.column(1).to_numpy(zero_copy_only=False).astype(np.float64))
+
+
+def read_historian(path, chunk_rows=CHUNK_ROWS):
+    """Yield (time [s since epoch], dP [inWC]) arrays of at most about chunk_rows readings"""
+
+    if path.endswith('.parquet'):
+        return _parquet_chunks(path, chunk_rows)
+    return _csv_chunks(path, chunk_rows)
+
+
+def replay(path, curve, output, chunk_rows=CHUNK_ROWS):
+    """
+    Solve every reading of the record at path with the mass_flow_curve
+    arguments `curve` (only the meter and fluid inputs and surrogate are
+    used) and write the RECORD rows to the file output.
+
+    Returns dict(rows, failed, start, end, hourly, solver, max_error) with
+    hourly a list of (hour start [s since epoch], mass [kg], seconds covered)
+    in time order.  failed counts readings with no solution, left out of the
+    totals.  solver is 'exact' or 'surrogate', max_error the surrogate's
+    bound on the relative mass flow error (0 for exact solves).
+    """
+
+    meter = dict(P1=curve['P1'], rho=curve['rho'], mu=curve['mu'], k=curve['k'], D=curve['D'], D2=curve['D2'],
+                 meter_type=curve['meter_type'], taps=curve['taps'], tap_position=curve['tap_position'])
+
+    # The batched meter types and the unspecified meter are always solved exactly
+    surrogate = bool(curve.get('surrogate')) and curve['meter_type'] != 'unspecified meter' \
+        and METER_ALIASES.get(curve['meter_type'], curve['meter_type']) not in BATCH_METER_TYPES
+    max_error = 0.0
+    if surrogate:
+        from openet.engine.surrogate import get_surrogate
+        max_error = get_surrogate(curve['meter_type'], curve['taps'], curve['tap_position'], curve['D']).max_error
+
+    hourly = {}
+    rows = failed = 0
+    start = end = None
+    previous = None
+
+    with open(output, 'wb') as out:
+        for t, dp in read_historian(path, chunk_rows):
+
+            with np.errstate(invalid='ignore'):
+                M = solve_readings(dp, surrogate=surrogate, **meter)
+
+            records = np.empty(t.size, dtype=RECORD)
+            records['t'], records['dp'], records['kg'] = t, dp, M
+            records.tofile(out)
+
+            finite = np.isfinite(M)
+            failed += int(t.size - np.count_nonzero(finite))
+            M = np.where(finite, M, 0.0)
+
+            # Each reading holds until the next, across chunk boundaries too
+            if previous is not None:
+                t = np.concatenate(([previous[0]], t))
+                M = np.concatenate(([previous[1]], M))
+            previous = t[-1], M[-1]
+
+            seconds = np.maximum(np.diff(t), 0.0)
+            hours, index = np.unique(np.floor(t[:-1]/HOUR), return_inverse=True)
+            mass = np.bincount(index, weights=M[:-1]*seconds, minlength=hours.size)
+            covered = np.bincount(index, weights=seconds, minlength=hours.size)
+
+            for hour, kg, s in zip(hours.tolist(), mass.tolist(), covered.tolist()):
+                total = hourly.setdefault(hour, [0.0, 0.0])
+                total[0] += kg
+                total[1] += s
+
+            rows += records.size
+            start = records['t'][0] if start is None else start
+            end = records['t'][-1]
+
+    return dict(rows=rows, failed=failed, start=start, end=end,
+                hourly=[(hour*HOUR, kg, s) for hour, (kg, s) in sorted(hourly.items())],
+                solver='surrogate' if surrogate else 'exact', max_error=max_error)
+
+
+def daily_totals(hourly):
+    """(day start, mass [kg], seconds covered) of hourly totals, UTC days"""
+
+    days = {}
+    for start, kg, seconds in hourly:
+        total = days.setdefault(start//DAY*DAY, [0.0, 0.0])
+        total[0] += kg
+        total[1] += seconds
+
+    return [(start, kg, seconds) for start, (kg, seconds) in sorted(days.items())]
+
+
+def lttb(t, y, points):
+    """
+    Indices of the `points` samples of (t, y) that Largest Triangle Three
+    Buckets keeps, t increasing.  Reads one bucket at a time, so t and y can
+    be memory mapped columns of any length.
+    """
+
+    n = len(t)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1])[:max(points, 0)]
+
+    # First and last samples are kept, points - 2 buckets in between
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    at, ay = float(t[0]), float(np.nan_to_num(y[0]))
+    nt, ny = np.asarray(t[edges[0]:edges[1]]), np.nan_to_num(y[edges[0]:edges[1]])
+
+    for b in range(points - 2):
+        bt, by = nt, ny
+
+        if b + 2 < len(edges):
+            nt, ny = np.asarray(t[edges[b + 1]:edges[b + 2]]), np.nan_to_num(y[edges[b + 1]:edges[b + 2]])
+            ct, cy = nt.mean(), ny.mean()
+        else:
+            ct, cy = float(t[n - 1]), float(np.nan_to_num(y[n - 1]))
+
+        # Twice the triangle area with the last kept point and the next bucket's average
+        i = int(np.argmax(np.abs((at - ct)*(by - ay) - (at - bt)*(cy - ay))))
+
+        selected[b + 1] = edges[b] + i
+        at, ay = bt[i], by[i]
+
+    return selected
+
+
+class ReplaySeries():
+    """Read only view of the records written by replay"""
+
+    def __init__(self, path):
+
+        self.path = path
+        if os.path.getsize(path):
+            self._data = np.memmap(path, dtype=RECORD, mode='r')
+        else:
+            self._data = np.empty(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self._data)
+
+    def window(self, start, end, points):
+        """Records between times start and end, downsampled to about `points`
+        with LTTB on the mass flow.  One reading past each end is kept so the
+        line runs to the edges of the window."""
+
+        t = self._data['t']
+        first = max(int(np.searchsorted(t, start)) - 1, 0)
+        last = min(int(np.searchsorted(t, end, side='right')) + 1, len(t))
+
+        if last <= first:
+            return self._data[:0].copy()
+
+        index = first + lttb(t[first:last], self._data['kg'][first:last], points)
+        return np.asarray(self._data[index])
+
+    def close(self):
+        self._data = None
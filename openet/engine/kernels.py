@@ -0,0 +1,257 @@
+'''
+Compiled point by point kernels of the batched meter solver.
+
+When numba is importable, solve_mass_flow (openet.engine.batch) solves the
+BATCH_METER_TYPES with the kernel below instead of NumPy array expressions:
+one loop over the points, each running the expansibility, the discharge
+coefficient and its own secant iteration in registers, stopping as soon as
+that point has converged.  Results match the NumPy solver to the secant
+tolerance.  Without numba (or with OPENET_NUMBA=0) the NumPy solver is used,
+the functions below then run as plain Python and are only useful to check
+the kernel against it.
+
+Compiled code is cached on disk (numba cache=True, under __pycache__ or
+NUMBA_CACHE_DIR), so only the first process after an install compiles.
+warm_up() loads or compiles every specialization up front, it is called by
+openet.warmup and the GASFLOW/LIQUIDFLOW app hooks so that no user request
+waits for it.  To fill the cache ahead of time, e.g. in a Docker build:
+
+    python -m openet.engine.kernels
+
+Reference:
+https://numba.readthedocs.io/en/stable/user/caching.html
+'''
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from openet.engine.batch import (ORIFICE_METERS, NOZZLE_METERS, VENTURI_METERS, BATCH_METER_TYPES,
+                                 MAXITER, RTOL, discharge_coefficient)
+from openet.engine.units import inch
+
+try:
+    if os.environ.get('OPENET_NUMBA', '1') == '0':
+        raise ImportError("disabled by OPENET_NUMBA")
+    import numba
+except ImportError:
+    numba = None
+
+ENABLED = numba is not None
+
+
+def jit(function):
+    """numba.njit with an on-disk cache, or the function itself without numba"""
+
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True, error_model='numpy')(function)
+
+
+# Discharge coefficient kinds
+C_CONSTANT = 0                  # C depends on beta only, passed in per point
+C_READER_HARRIS_GALLAGHER = 1   # ISO 5167-2 orifice
+C_LONG_RADIUS_NOZZLE = 2
+C_ISA_1932_NOZZLE = 3
+
+# Expansibility kinds
+EPS_ORIFICE = 0
+EPS_NOZZLE = 1
+EPS_MEAN = 2                    # conical orifice, average of the two
+
+# Tap locations of the Reader-Harris/Gallagher correlation
+TAPS = {None: 0, 'corner': 0, 'flange': 1, 'D': 2, 'D/2': 2, 'D and D/2': 2}
+
+
+@jit
+def orifice_expansibility(beta, P1, P2, k):
+
+    beta4 = beta**4
+    return 1.0 - (0.351 + beta4*(0.93*beta4 + 0.256))*(1.0 - (P2/P1)**(1.0/k))
+
+
+@jit
+def nozzle_expansibility(beta, P1, P2, k):
+
+    tau = P2/P1
+    if tau == 1.0:
+        return 1.0
+
+    beta4 = beta**4
+    if k == 1.0:
+        return math.sqrt(tau*tau*(beta4 - 1.0)*math.log(tau)/((1.0 - tau)*(1.0 - beta4*tau*tau)))
+
+    term1 = k*tau**(2.0/k)/(k - 1.0)
+    term2 = (1.0 - beta4)/(1.0 - beta4*tau**(2.0/k))
+    term3 = (P1 - P2*tau**(-1.0/k))/(P1 - P2)
+    value = term1*term2*term3
+    return math.sqrt(value) if value >= 0.0 else math.nan
+
+
+@jit
+def reader_harris_gallagher(D, beta, Re_D, taps):
+
+    if taps == 0:
+        L1, L2_prime = 0.0, 0.0
+    elif taps == 1:
+        L1 = L2_prime = inch/D
+    else:
+        L1, L2_prime = 1.0, 0.47
+
+    Re_D_inv = 1.0/Re_D
+    beta2 = beta*beta
+    beta4 = beta2*beta2
+    beta8 = beta4*beta4
+
+    A = 2648.5177066967326*(beta*Re_D_inv)**0.8
+    M2_prime = 2.0*L2_prime/(1.0 - beta)
+
+    expnL1 = math.exp(-L1)
+    expnL2 = expnL1*expnL1
+    expnL3 = expnL1*expnL2
+    delta_C_upstream = ((0.043 + expnL3*expnL2*expnL2*(0.080*expnL3 - 0.123))
+                        *(1.0 - 0.11*A)*beta4/(1.0 - beta4))
+
+    t1 = max(math.log10(3700.0*Re_D_inv), 0.0)
+    delta_C_downstream = -0.031*(M2_prime - 0.8*M2_prime**1.1)*beta**1.3*(1.0 + 8.0*t1)
+
+    t2 = max(22.7 - 0.0047*Re_D, 63.095734448019314*Re_D_inv**0.3)
+    C = (0.5961 + 0.0261*beta2 - 0.216*beta8 + 0.000521*(1E6*beta*Re_D_inv)**0.7
+         + (0.0188 + 0.0063*A)*beta2*beta*math.sqrt(beta)*t2
+         + delta_C_upstream + delta_C_downstream)
+
+    # Small pipe correction below 2.8 inches
+    if D < 0.07112:
+        C += 0.011*(0.75 - beta)*(2.8 - D/inch)
+    return C
+
+
+@jit
+def discharge(kind, C, D, beta, Re_D, taps):
+
+    if kind == 1:
+        return reader_harris_gallagher(D, beta, Re_D, taps)
+    elif kind == 2:
+        return 0.9965 - 0.00653*math.sqrt(beta)*math.sqrt(1E6/Re_D)
+    elif kind == 3:
+        return 0.9900 - 0.2262*beta**4.1 - (0.00175*beta*beta - 0.0033*beta**4.15)*(1E6/Re_D)**1.15
+    return C
+
+
+@jit
+def secant_solve(D, D2, P1, P2, rho, mu, k, C, c_kind, eps_kind, taps, maxiter, rtol, m, active):
+    """Mass flow of every point into m, active marks the points that did not converge"""
+
+    for i in range(m.size):
+        beta = D2[i]/D[i]
+
+        if eps_kind == 0:
+            epsilon = orifice_expansibility(beta, P1[i], P2[i], k[i])
+        elif eps_kind == 1:
+            epsilon = nozzle_expansibility(beta, P1[i], P2[i], k[i])
+        else:
+            epsilon = 0.5*(orifice_expansibility(beta, P1[i], P2[i], k[i])
+                           + nozzle_expansibility(beta, P1[i], P2[i], k[i]))
+
+        head = 2.0*rho[i]*(P1[i] - P2[i])/(1.0 - beta**4)
+        if not head > 0.0:
+            # No differential is no flow, a negative one is left to the reference solver
+            m[i] = 0.0 if head == 0.0 else math.nan
+            active[i] = head != 0.0
+            continue
+
+        # m = C*flow_factor, with everything but C independent of the flow
+        flow_factor = 0.25*math.pi*D2[i]*D2[i]*epsilon*math.sqrt(head)
+        Re_factor = 4.0/(math.pi*D[i]*mu[i])
+
+        m0 = 0.6*flow_factor
+        f0 = m0 - discharge(c_kind, C[i], D[i], beta, m0*Re_factor, taps)*flow_factor
+        m1 = m0 - f0
+        converged = False
+
+        for _ in range(maxiter):
+            f1 = m1 - discharge(c_kind, C[i], D[i], beta, m1*Re_factor, taps)*flow_factor
+            df = f1 - f0
+            m2 = m1 - f1*(m1 - m0)/df if df != 0.0 else m1
+
+            converged = abs(m2 - m1) <= rtol*abs(m2)
+            m0, f0, m1 = m1, f1, m2
+            if converged:
+                break
+
+        m[i] = m1
+        active[i] = not converged
+
+
+def kinds(meter_type):
+    """(discharge coefficient kind, expansibility kind) of a batched meter type"""
+
+    if meter_type == 'ISO 5167 orifice':
+        return C_READER_HARRIS_GALLAGHER, EPS_ORIFICE
+    elif meter_type in ORIFICE_METERS:
+        return C_CONSTANT, EPS_ORIFICE
+    elif meter_type == 'ISO 15377 conical orifice':
+        return C_CONSTANT, EPS_MEAN
+    elif meter_type == 'long radius nozzle':
+        return C_LONG_RADIUS_NOZZLE, EPS_NOZZLE
+    elif meter_type == 'ISA 1932 nozzle':
+        return C_ISA_1932_NOZZLE, EPS_NOZZLE
+    elif meter_type in NOZZLE_METERS or meter_type in VENTURI_METERS:
+        return C_CONSTANT, EPS_NOZZLE
+
+    raise ValueError("Meter type %s is not supported by the batch solver" % meter_type)
+
+
+def solve(meter_type, D, D2, P1, P2, rho, mu, k, taps):
+    """
+    Mass flow [kg/s] and not-converged mask of 1-d float arrays of equal
+    length, meter_type already translated through METER_ALIASES.  The
+    kernel counterpart of the secant iteration in solve_mass_flow.
+    """
+
+    c_kind, eps_kind = kinds(meter_type)
+
+    if c_kind == C_CONSTANT:
+        # Only depends on beta, once per point outside the iteration
+        C = np.ascontiguousarray(discharge_coefficient(meter_type, D, D2/D, np.ones(D.shape), taps), dtype=float)
+    else:
+        C = np.zeros(D.shape)
+
+    if c_kind == C_READER_HARRIS_GALLAGHER and taps not in TAPS:
+        raise ValueError("Unsupported tap location")
+
+    m = np.empty(D.shape)
+    active = np.empty(D.shape, dtype=np.bool_)
+    secant_solve(*[np.ascontiguousarray(a) for a in (D, D2, P1, P2, rho, mu, k)], C, c_kind, eps_kind,
+                 TAPS.get(taps, 0), MAXITER, RTOL, m, active)
+    return m, active
+
+
+def warm_up():
+    """Load (or compile) the kernel for every meter family, returns the seconds it took"""
+
+    start = time.perf_counter()
+
+    if ENABLED:
+        D, D2, P1, P2, rho, mu, k = (np.array([value]) for value in (0.05, 0.02, 8e5, 7.9e5, 10.0, 1e-5, 1.3))
+        for meter_type in sorted(BATCH_METER_TYPES):
+            solve(meter_type, D, D2, P1, P2, rho, mu, k, 'flange')
+
+    return time.perf_counter() - start
+
+
+def main():
+
+    if not ENABLED:
+        print("numba is not available, the NumPy solver is used", file=sys.stderr)
+        return 1
+
+    print("Kernels ready in %.1f s" % warm_up(), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
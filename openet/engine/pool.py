@@ -0,0 +1,145 @@
+'''
+Process wide compute pool for curve solves.
+
+The Bokeh server runs every session on one Tornado event loop, so curves are
+solved on a pool instead of inside the widget callbacks.  The pool is shared
+by all sessions and apps of the server process and is configured from the
+environment or from the app arguments, e.g.
+
+    bokeh serve DP_METER_SOLVER --args --pool process --workers 4 --queue-depth 64
+
+    OPENET_POOL         'process', 'thread' or 'none' (solve on the event loop)
+    OPENET_POOL_WORKERS number of workers, defaults to the number of cores
+    OPENET_POOL_QUEUE   maximum number of solves queued or running at once
+'''
+
+import argparse
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+POOL_KINDS = ('process', 'thread', 'none')
+
+# Seconds between submits of work the pool was too busy to take, it is given
+# up on after the last one rather than solved on the event loop
+BUSY_RETRIES = (0.1, 0.25, 0.5, 1.0)
+
+
+class PoolBusy(RuntimeError):
+    """Raised by submit when the queue depth limit is reached"""
+
+
+class ComputePool():
+    """Lazily started executor with a limit on outstanding work"""
+
+    def __init__(self, kind='process', workers=None, queue_depth=None):
+
+        if kind not in POOL_KINDS:
+            raise ValueError("Pool kind must be one of %s" % (POOL_KINDS,))
+
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth or 4*self.workers
+
+        self._executor = None
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.kind != 'none'
+
+    @property
+    def outstanding(self):
+        return self._outstanding
+
+    def executor(self):
+        """Create the executor on first use"""
+
+        with self._lock:
+            if self._executor is None:
+                if self.kind == 'process':
+                    # spawn, forking the multithreaded server process is not safe
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                elif self.kind == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='openet')
+                else:
+                    raise RuntimeError("Compute pool is disabled")
+
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit fn to the pool, raises PoolBusy when queue_depth solves are already outstanding"""
+
+        executor = self.executor()
+
+        with self._lock:
+            if self._outstanding >= self.queue_depth:
+                raise PoolBusy("%s solves outstanding" % self._outstanding)
+            self._outstanding += 1
+
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._outstanding -= 1
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_pool = None
+
+
+def parse_args(argv):
+    """Pool options from an argument list, unknown arguments are ignored"""
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--pool', choices=POOL_KINDS, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--queue-depth', type=int, default=None)
+
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
+def configure(kind=None, workers=None, queue_depth=None):
+    """Set up the shared pool, anything not given is read from the environment.
+    Only the first call has an effect, the pool is shared by every session"""
+
+    global _pool
+
+    if _pool is None:
+        env = os.environ
+        kind = kind or env.get('OPENET_POOL', 'process')
+        workers = workers or int(env.get('OPENET_POOL_WORKERS', 0)) or None
+        queue_depth = queue_depth or int(env.get('OPENET_POOL_QUEUE', 0)) or None
+
+        _pool = ComputePool(kind=kind, workers=workers, queue_depth=queue_depth)
+
+    return _pool
+
+
+def configure_from_args(argv):
+    args = parse_args(argv)
+    return configure(kind=args.pool, workers=args.workers, queue_depth=args.queue_depth)
+
+
+def get_pool():
+    """The shared pool, configured from the environment if nobody did so yet"""
+
+    return configure()
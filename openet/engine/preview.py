@@ -0,0 +1,112 @@
+'''
+Compact per-curve surrogate for an approximate curve in the browser.
+
+A solved curve is reduced to the square root law
+
+    m = K(Re)*epsilon(dP/P1)*sqrt(rho*dP)
+
+with K the flow coefficient (discharge coefficient and geometry) backed out
+of the exact mass flows, tabulated against log10 Re, and epsilon the meter's
+expansibility tabulated against dP/P1 for the curve's bore, pipe and k.
+Both tables are a few dozen numbers, small enough to ship with every curve
+update.  With them a new density, pressure or dP range is redrawn by a short
+fixed point iteration on Re (see PREVIEW_JS in openet.dpmeter), without a
+round trip to the server.  K is held at its end values outside the solved
+Re range, so the preview is exact at the solved state and drifts by the
+change of C over the Reynolds numbers it extrapolates to.
+
+Reference:
+ISO 5167-1:2003, 5.1 (mass flow equation)
+'''
+
+from functools import lru_cache
+
+import numpy as np
+
+from openet.engine.units import psi, INWC
+
+
+# Table sizes, K against log10 Re and epsilon against dP/P1
+RE_POINTS = 24
+EPSILON_AXIS = np.linspace(0.0, 0.5, 11)
+
+
+@lru_cache(maxsize=256)
+def _epsilon_table(meter_type, D, D2, k, taps, tap_position):
+    """Expansibility over EPSILON_AXIS, NaN where the correlation fails"""
+
+    from openet.engine.batch import METER_ALIASES, BATCH_METER_TYPES, expansibility
+
+    P1 = 1e6
+    P2 = P1*(1.0 - EPSILON_AXIS)
+
+    batch_type = METER_ALIASES.get(meter_type, meter_type)
+    if batch_type in BATCH_METER_TYPES:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            epsilon = expansibility(batch_type, D2/D, P1, P2, k)
+        epsilon[0] = 1.0
+        return tuple(epsilon.tolist())
+
+    from fluids.flow_meter import differential_pressure_meter_C_epsilon
+
+    # Expansibility does not depend on the flow, any m in range will do
+    table = [1.0]
+    for p2 in P2[1:]:
+        try:
+            table.append(float(differential_pressure_meter_C_epsilon(
+                D=D, D2=D2, m=1.0, P1=P1, P2=p2, rho=10.0, mu=1e-5, k=k, meter_type=meter_type, taps=taps,
+                tap_position=tap_position)[1]))
+        except Exception:
+            table.append(float('nan'))
+    return tuple(table)
+
+
+def curve_preview(curve, DP, M):
+    """
+    Preview surrogate of the curve solved from the mass_flow_curve
+    arguments `curve`, DP [inWC] and M [kg/s], as a dict of floats and lists
+    of floats.  None when the curve has fewer than two finite points.
+    """
+
+    DP = np.asarray(DP, dtype=np.float64)
+    M = np.asarray(M, dtype=np.float64)
+
+    flowing = np.isfinite(M) & (M > 0.0) & (DP > 0.0)
+    if np.count_nonzero(flowing) < 2:
+        return None
+
+    P1, rho = curve['P1'], curve['rho']
+    dp = DP[flowing]*INWC
+    m = M[flowing]
+
+    epsilon = np.array(_epsilon_table(curve['meter_type'], float(curve['D']), float(curve['D2']), float(curve['k']),
+                                      curve['taps'], curve['tap_position']))
+    valid = np.isfinite(epsilon)
+    if not valid.all():
+        # The table ends before the first point the correlation fails at
+        stop = int(np.argmin(valid))
+        epsilon_axis, epsilon = EPSILON_AXIS[:stop], epsilon[:stop]
+    else:
+        epsilon_axis = EPSILON_AXIS
+    if epsilon.size < 2:
+        return None
+
+    with np.errstate(invalid='ignore'):
+        K = m/(np.interp(dp/P1, epsilon_axis, epsilon, right=np.nan)*np.sqrt(rho*dp))
+
+    re_factor = 4.0/(np.pi*curve['D']*curve['mu'])
+    log_Re = np.log10(m*re_factor)
+
+    keep = np.isfinite(K)
+    if np.count_nonzero(keep) < 2:
+        return None
+    log_Re, K = log_Re[keep], K[keep]
+
+    order = np.argsort(log_Re)
+    log_Re, K = log_Re[order], K[order]
+    if log_Re.size > RE_POINTS:
+        index = np.unique(np.linspace(0, log_Re.size - 1, RE_POINTS).round().astype(int))
+        log_Re, K = log_Re[index], K[index]
+
+    return dict(log_re=log_Re.tolist(), K=K.tolist(), x=epsilon_axis.tolist(), epsilon=epsilon.tolist(),
+                re_factor=float(re_factor), psi=psi, inwc=INWC)
@@ -0,0 +1,170 @@
+'''
+Batched meter sizing: the inverse directions of solve_mass_flow.
+
+solve_bore finds the bore that passes a mass flow at a given dP, solve_dp the
+dP a bore produces at a given mass flow.  Both work element wise over
+broadcast arrays, so a whole design grid (e.g. 100 x 100 bores and dPs) is
+one call.  sizing_grid is the whole design grid of the sizing view, for
+the compute pool.
+'''
+
+import numpy as np
+
+from openet.engine.batch import (solve_mass_flow, discharge_coefficient, expansibility,
+                                 METER_ALIASES, BATCH_METER_TYPES)
+from openet.engine.units import INWC
+
+
+BETA_MIN = 0.05
+BETA_MAX = 0.95
+
+MAXITER = 60
+RTOL = 1e-10
+
+
+def solve_bore(D, m, P1, P2, rho, mu, k, meter_type='ISO 5167 orifice', taps=None, tap_position=None,
+               beta_min=BETA_MIN, beta_max=BETA_MAX):
+    """
+    Bore D2 [m] passing mass flow m [kg/s] at P1, P2 [Pa], for every element
+    of the broadcast inputs. NaN where the flow cannot be reached with a
+    beta ratio between beta_min and beta_max.
+
+    Vectorized Illinois (modified false position) iteration on D2, each
+    step is one batched solve_mass_flow over the points still open.
+    """
+
+    arrays = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (D, m, P1, P2, rho, mu, k)])
+    shape = arrays[0].shape
+    D, m, P1, P2, rho, mu, k = [a.ravel() for a in arrays]
+
+    def error(idx, D2):
+        return solve_mass_flow(D[idx], D2, P1[idx], P2[idx], rho[idx], mu[idx], k[idx],
+                               meter_type=meter_type, taps=taps, tap_position=tap_position) - m[idx]
+
+    every = np.arange(m.size)
+    lo, hi = beta_min*D, beta_max*D
+    f_lo, f_hi = error(every, lo), error(every, hi)
+
+    # Cone meters pass less flow the larger D2 (the cone) is, solve on the
+    # error with its sign flipped so flow always increases with D2
+    sign = np.where(f_hi >= f_lo, 1.0, -1.0)
+    f_lo, f_hi = sign*f_lo, sign*f_hi
+
+    D2 = np.full(m.size, np.nan)
+
+    # Only points bracketed by the beta range have a solution
+    idx = np.flatnonzero((f_lo <= 0.0) & (f_hi >= 0.0))
+    lo, hi, f_lo, f_hi, sign = lo[idx], hi[idx], f_lo[idx], f_hi[idx], sign[idx]
+    side = np.zeros(idx.size, dtype=int)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(MAXITER):
+            if not idx.size:
+                break
+
+            x = np.where(f_hi != f_lo, hi - f_hi*(hi - lo)/(f_hi - f_lo), 0.5*(lo + hi))
+            f_x = sign*error(idx, x)
+
+            done = (np.abs(f_x) <= RTOL*m[idx]) | (hi - lo <= RTOL*D[idx])
+            D2[idx[done]] = x[done]
+
+            # Keep the bracket, halving the stale end when the same side moves twice
+            upper = f_x > 0.0
+            f_lo = np.where(upper & (side == 1), 0.5*f_lo, f_lo)
+            f_hi = np.where(~upper & (side == -1), 0.5*f_hi, f_hi)
+            hi, f_hi = np.where(upper, x, hi), np.where(upper, f_x, f_hi)
+            lo, f_lo = np.where(upper, lo, x), np.where(upper, f_lo, f_x)
+            side = np.where(upper, 1, -1)
+
+            keep = ~done
+            idx, lo, hi, f_lo, f_hi, side, sign = idx[keep], lo[keep], hi[keep], f_lo[keep], f_hi[keep], side[keep], sign[keep]
+
+    # Whatever is still open ends at the bracket midpoint
+    D2[idx] = 0.5*(lo + hi)
+
+    return D2.reshape(shape)
+
+
+def _scalar_dp(D, D2, m, P1, rho, mu, k, meter_type, taps, tap_position):
+    """Point by point fallback through the fluids solver"""
+
+    from fluids import differential_pressure_meter_solver
+
+    P2 = np.empty(m.shape)
+    for i in range(m.size):
+        try:
+            P2[i] = differential_pressure_meter_solver(D=D[i], D2=D2[i], m=m[i], P1=P1[i], rho=rho[i], mu=mu[i],
+                                                       k=k[i], meter_type=meter_type, taps=taps,
+                                                       tap_position=tap_position)
+        except Exception:
+            P2[i] = np.nan
+    return P1 - P2
+
+
+def solve_dp(D, D2, m, P1, rho, mu, k, meter_type='ISO 5167 orifice', taps=None, tap_position=None):
+    """
+    Differential pressure P1 - P2 [Pa] produced by mass flow m [kg/s] through
+    bore D2, for every element of the broadcast inputs. NaN where no
+    solution below P1 exists.
+
+    For the batched meter types the discharge coefficient only depends on
+    the (known) flow, which leaves a short fixed-point iteration on the
+    expansibility.
+    """
+
+    arrays = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (D, D2, m, P1, rho, mu, k)])
+    shape = arrays[0].shape
+    D, D2, m, P1, rho, mu, k = [a.ravel() for a in arrays]
+
+    correlation = METER_ALIASES.get(meter_type, meter_type)
+    if correlation not in BATCH_METER_TYPES:
+        return _scalar_dp(D, D2, m, P1, rho, mu, k, meter_type, taps, tap_position).reshape(shape)
+
+    beta = D2/D
+    C = discharge_coefficient(correlation, D, beta, 4.0*m/(np.pi*D*mu), taps)
+
+    # dP with no expansion, divided by epsilon**2 below
+    dP_incompressible = (m/(C*0.25*np.pi*D2*D2))**2*(1.0 - beta**4)/(2.0*rho)
+
+    dP = dP_incompressible
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(MAXITER):
+            epsilon = expansibility(correlation, beta, P1, P1 - np.minimum(dP, P1), k)
+            dP_new = dP_incompressible/(epsilon*epsilon)
+
+            converged = np.abs(dP_new - dP) <= RTOL*dP_new
+            dP = dP_new
+            if np.all(converged | ~np.isfinite(dP)):
+                break
+
+    dP = np.where(np.isfinite(dP) & (dP < P1), dP, np.nan)
+    return dP.reshape(shape)
+
+
+def sizing_grid(D, m, P1, rho, mu, k, dp_min, dp_max, meter_type='ISO 5167 orifice', taps=None,
+                tap_position=None, n=100, beta_min=0.1, beta_max=0.75, flows=False):
+    """
+    Design grid of n bores from beta_min to beta_max times D against n dPs
+    [inWC] from dp_min to dp_max, or with flows against n mass flows from
+    0.05 to 2 times m [kg/s].  Returns dict(bores, axis, image, bore_line,
+    bore): image is the mass flow (dP grid) or the dP [inWC] (flow grid)
+    with a row per bore, bore_line the bore passing m along the dP axis
+    (dP grid only) and bore the one passing m at dp_max, NaN out of range.
+    """
+
+    solver = dict(P1=P1, rho=rho, mu=mu, k=k, meter_type=meter_type, taps=taps, tap_position=tap_position)
+
+    bores = np.linspace(beta_min, beta_max, n)*D
+
+    if flows:
+        axis = np.linspace(0.05, 2.0, n)*m
+        image = solve_dp(D=D, D2=bores[:, None], m=axis[None, :], **solver)/INWC
+        bore_line = None
+    else:
+        axis = np.linspace(dp_min, dp_max, n)
+        image = solve_mass_flow(D=D, D2=bores[:, None], P2=P1 - axis[None, :]*INWC, **solver)
+        bore_line = solve_bore(D=D, m=m, P2=P1 - axis*INWC, **solver)
+
+    bore = float(solve_bore(D=D, m=m, P2=P1 - dp_max*INWC, **solver))
+
+    return dict(bores=bores, axis=axis, image=image, bore_line=bore_line, bore=bore)
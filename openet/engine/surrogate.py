@@ -0,0 +1,282 @@
+'''
+Interpolation surrogate for the discharge coefficient and expansibility.
+
+For one meter type, tap arrangement and pipe diameter the discharge
+coefficient only depends on the Reynolds number and D2/D, and the
+expansibility on dP/P1, D2/D and k.  Both are tabulated once from
+fluids.differential_pressure_meter_C_epsilon, stored as .npz files under
+OPENET_SURROGATE_DIR (default ~/.cache/openet/surrogate) and reused by every
+later solve, in this or any other process.  A curve is then solved with the
+same secant iteration as openet.engine.batch, with C and epsilon read from
+the tables by (multi)linear interpolation.
+
+The meter types in BATCH_METER_TYPES are already solved in closed form over
+the whole curve, as fast as the interpolation, so they always use the exact
+solver.  The surrogate pays off for the meters fluids solves point by point
+(Miller, Hollingshead, cone and wedge meters).
+
+Error: every table records the largest relative error of the interpolation
+against the exact correlation at the midpoints of its cells, and
+Surrogate.max_error (C error + epsilon error) bounds the relative mass flow
+error.  With the default grids the bound is below 5e-3 for every Meter_Type
+except wedge meters (0.36, at D2/D near 0.9 with dP/P1 near 0.5, where the
+correlation itself is out of range).  Over typical curves (1 - 250 inWC,
+P1 2 - 35 bar) the measured error against the exact result is below 1.5e-4.
+
+Points outside the tables (Re < 1e3, dP/P1 > 0.5, D2/D or k out of range)
+and meter types fluids cannot tabulate (unspecified meter) go through the
+exact solver.
+
+Reference:
+https://fluids.readthedocs.io/fluids.flow_meter.html
+'''
+
+import os
+import hashlib
+import itertools
+import threading
+
+import numpy as np
+
+from openet.engine.batch import METER_ALIASES, BATCH_METER_TYPES, secant, solve_mass_flow
+
+
+# Bump when the grids or the table layout change, old files are then ignored
+VERSION = 1
+
+LOG_RE_AXIS = np.linspace(3.0, 8.0, 201)
+RATIO_AXIS = np.linspace(0.1, 0.9, 81)      # D2/D
+DP_RATIO_AXIS = np.linspace(0.0, 0.5, 51)   # (P1 - P2)/P1
+K_AXIS = np.linspace(1.0, 2.0, 11)
+
+SURROGATE_DIR = os.environ.get('OPENET_SURROGATE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'openet',
+                                                                   'surrogate'))
+
+_surrogates = {}
+_lock = threading.Lock()
+
+
+def interpolate(axes, table, *coords):
+    """Multilinear interpolation of table on a regular grid, NaN outside of it"""
+
+    index, fraction = [], []
+    inside = True
+
+    for axis, x in zip(axes, coords):
+        i = np.clip(np.searchsorted(axis, x) - 1, 0, axis.size - 2)
+        index.append(i)
+        fraction.append((x - axis[i])/(axis[i + 1] - axis[i]))
+        inside = inside & (x >= axis[0]) & (x <= axis[-1])
+
+    value = 0.0
+    for corner in itertools.product((0, 1), repeat=len(axes)):
+        weight = 1.0
+        for c, f in zip(corner, fraction):
+            weight = weight*(f if c else 1.0 - f)
+        value = value + weight*table[tuple(i + c for i, c in zip(index, corner))]
+
+    return np.where(inside, value, np.nan)
+
+
+def _midpoints(axis):
+    return 0.5*(axis[1:] + axis[:-1])
+
+
+def _C_epsilon(D, ratio, log_Re, dp_ratio, k, meter_type, taps, tap_position):
+    """Exact (C, epsilon) from fluids, NaN where the correlation fails"""
+
+    from fluids.flow_meter import differential_pressure_meter_C_epsilon
+
+    # Re = 4 m/(pi D mu) with mu = 1e-3, C does not see rho and mu otherwise
+    mu = 1e-3
+    P1 = 1e6
+    try:
+        return differential_pressure_meter_C_epsilon(
+            D=D, D2=ratio*D, m=10**log_Re*np.pi*D*mu/4.0, P1=P1, P2=P1*(1.0 - dp_ratio), rho=1000.0, mu=mu, k=k,
+            meter_type=meter_type, taps=taps, tap_position=tap_position)
+    except Exception:
+        return np.nan, np.nan
+
+
+def _relative_error(table, exact):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.abs(table/exact - 1.0)
+    return float(np.nanmax(error)) if np.isfinite(error).any() else np.inf
+
+
+def build_C_table(meter_type, taps, tap_position, D):
+    """C over (log10 Re, D2/D) and its interpolation error"""
+
+    # A small dP so that the C evaluation stays well inside every meter's range
+    def C(log_Re, ratio):
+        return _C_epsilon(D, ratio, log_Re, 0.01, 1.4, meter_type, taps, tap_position)[0]
+
+    table = np.array([[C(r, b) for b in RATIO_AXIS] for r in LOG_RE_AXIS])
+
+    mid_Re, mid_ratio = _midpoints(LOG_RE_AXIS), _midpoints(RATIO_AXIS)
+    exact = np.array([[C(r, b) for b in mid_ratio] for r in mid_Re])
+    approx = interpolate((LOG_RE_AXIS, RATIO_AXIS), table, mid_Re[:, None], mid_ratio[None, :])
+
+    return table, _relative_error(approx, exact)
+
+
+def build_epsilon_table(meter_type):
+    """epsilon over (dP/P1, D2/D, k) and its interpolation error"""
+
+    def epsilon(dp_ratio, ratio, k):
+        if dp_ratio == 0.0:
+            # No differential, no expansion (fluids' k = 1 limit is 0/0 there)
+            return 1.0
+        return _C_epsilon(0.1, ratio, 5.0, dp_ratio, k, meter_type, 'flange', '180 degree')[1]
+
+    table = np.array([[[epsilon(x, b, k) for k in K_AXIS] for b in RATIO_AXIS] for x in DP_RATIO_AXIS])
+
+    mid_x, mid_ratio, mid_k = _midpoints(DP_RATIO_AXIS), _midpoints(RATIO_AXIS), _midpoints(K_AXIS)
+    exact = np.array([[[epsilon(x, b, k) for k in mid_k] for b in mid_ratio] for x in mid_x])
+    approx = interpolate((DP_RATIO_AXIS, RATIO_AXIS, K_AXIS), table,
+                         mid_x[:, None, None], mid_ratio[None, :, None], mid_k[None, None, :])
+
+    return table, _relative_error(approx, exact)
+
+
+def _path(kind, *key):
+    digest = hashlib.sha1(repr((VERSION,) + key).encode()).hexdigest()[:16]
+    return os.path.join(SURROGATE_DIR, '%s-%s.npz' % (kind, digest))
+
+
+def _load_or_build(path, build):
+    """Read a (table, max_error) pair from path, building and saving it when missing"""
+
+    try:
+        with np.load(path) as data:
+            return data['table'], float(data['max_error'])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    table, max_error = build()
+
+    try:
+        os.makedirs(SURROGATE_DIR, exist_ok=True)
+        # Write then rename, so concurrent workers never read a partial file
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, table=table, max_error=max_error)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+    return table, max_error
+
+
+class Surrogate():
+    """C and epsilon tables for one meter type, tap arrangement and pipe diameter"""
+
+    def __init__(self, meter_type, taps, tap_position, D):
+
+        # Tabulated under the name fluids knows the correlation by
+        self.meter_type = meter_type = METER_ALIASES.get(meter_type, meter_type)
+
+        self.C, self.C_error = _load_or_build(_path('C', meter_type, taps, tap_position, '%.6g' % D),
+                                              lambda: build_C_table(meter_type, taps, tap_position, D))
+        self.epsilon, self.epsilon_error = _load_or_build(_path('epsilon', meter_type),
+                                                          lambda: build_epsilon_table(meter_type))
+
+    @property
+    def max_error(self):
+        """Bound on the relative mass flow error against the exact solve"""
+
+        return self.C_error + self.epsilon_error
+
+    def discharge_coefficient(self, ratio, Re_D):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_Re = np.log10(Re_D)
+        return interpolate((LOG_RE_AXIS, RATIO_AXIS), self.C, log_Re, ratio)
+
+    def expansibility(self, ratio, P1, P2, k):
+        return interpolate((DP_RATIO_AXIS, RATIO_AXIS, K_AXIS), self.epsilon, (P1 - P2)/P1, ratio, k)
+
+
+def meter_beta(meter_type, D, D2):
+    """Beta ratio of the flow area, fluids.differential_pressure_meter_beta for arrays"""
+
+    ratio = D2/D
+    if meter_type in ('cone meter', 'Hollingshead v cone'):
+        return np.sqrt(1.0 - ratio*ratio)
+
+    elif meter_type in ('wedge meter', 'Hollingshead wedge'):
+        t0 = 1.0 - 2.0*ratio
+        return np.sqrt((np.arccos(t0) - 2.0*t0*np.sqrt(ratio - ratio*ratio))/np.pi)
+
+    return ratio
+
+
+def get_surrogate(meter_type, taps, tap_position, D):
+    """Surrogate tables for a meter, from memory, disk, or built on first use"""
+
+    key = (meter_type, taps, tap_position, float('%.6g' % D))
+
+    with _lock:
+        surrogate = _surrogates.get(key)
+        if surrogate is None:
+            surrogate = _surrogates[key] = Surrogate(meter_type, taps, tap_position, D)
+    return surrogate
+
+
+def solve_mass_flow_surrogate(D, D2, P1, P2, rho, mu, k, meter_type='ISO 5167 orifice', taps=None,
+                              tap_position=None):
+    """
+    solve_mass_flow with C and epsilon interpolated from the surrogate
+    tables, for a single pipe diameter D. Points outside the tables, and
+    the batched meter types, are solved exactly.
+    """
+
+    if np.ndim(D):
+        raise ValueError("The surrogate solver takes a single pipe diameter")
+
+    if meter_type == 'unspecified meter' or METER_ALIASES.get(meter_type, meter_type) in BATCH_METER_TYPES:
+        return solve_mass_flow(D, D2, P1, P2, rho, mu, k, meter_type, taps, tap_position)
+
+    surrogate = get_surrogate(meter_type, taps, tap_position, D)
+
+    arrays = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (D2, P1, P2, rho, mu, k)])
+    shape = arrays[0].shape
+    D2, P1, P2, rho, mu, k = [a.ravel() for a in arrays]
+
+    m = surrogate_mass_flow(surrogate, D, D2, P1, P2, rho, mu, k)
+
+    active = ~np.isfinite(m)
+    if active.any():
+        idx = np.flatnonzero(active)
+        m[idx] = solve_mass_flow(D, D2[idx], P1[idx], P2[idx], rho[idx], mu[idx], k[idx],
+                                 meter_type=meter_type, taps=taps, tap_position=tap_position)
+
+    return m.reshape(shape)
+
+
+def surrogate_mass_flow(surrogate, D, D2, P1, P2, rho, mu, k):
+    """
+    Mass flow [kg/s] from the tables of surrogate alone, for broadcast
+    inputs. D may vary around the diameter the tables were built for, the
+    tables are indexed by D2/D.  NaN where the inputs are outside the
+    tables or the iteration did not converge.
+    """
+
+    arrays = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (D, D2, P1, P2, rho, mu, k)])
+    shape = arrays[0].shape
+    D, D2, P1, P2, rho, mu, k = [a.ravel() for a in arrays]
+
+    # The tables are indexed by D2/D, the flow area by the meter's own beta
+    ratio = D2/D
+    beta = meter_beta(surrogate.meter_type, D, D2)
+    epsilon = surrogate.expansibility(ratio, P1, P2, k)
+
+    flow_factor = 0.25*np.pi*(D*beta)**2*epsilon*np.sqrt(2.0*rho*(P1 - P2)/(1.0 - beta**4))
+    Re_factor = 4.0/(np.pi*D*mu)
+
+    def residual(m):
+        return m - surrogate.discharge_coefficient(ratio, m*Re_factor)*flow_factor
+
+    m, active = secant(residual, 0.6*flow_factor)
+    m[active] = np.nan
+
+    return m.reshape(shape)
@@ -0,0 +1,115 @@
+'''
+Monte Carlo flow uncertainty.
+
+The flow at every dP point is solved for tens of thousands of samples of
+the uncertain inputs at once: density, viscosity, bore, pipe ID, upstream
+pressure and the dP reading itself.  Input samples are drawn once and shared
+by all dP points, the transmitter error is drawn per point and sample.  The
+(points x samples) grid is solved in chunks of whole dP points, reduced to
+percentiles and dropped, so memory stays bounded by CHUNK_ELEMENTS whatever
+the number of samples.
+
+Batched meter types go through solve_mass_flow.  The others would go through
+the scalar fluids solver once per sample, so their C and epsilon come from
+the surrogate tables of the nominal pipe (see openet.engine.surrogate),
+whose error is far below any realistic input uncertainty.
+
+Spreads are relative to the nominal value, in percent: the standard
+deviation of a normal distribution, the half width of a uniform or
+triangular one.  The dP spread is a percentage of the transmitter span.
+
+Reference:
+JCGM 101:2008, Evaluation of measurement data - Propagation of
+distributions using a Monte Carlo method
+'''
+
+import numpy as np
+
+from openet.engine.batch import vector_solver
+from openet.engine.units import INWC
+
+
+DISTRIBUTIONS = ('normal', 'uniform', 'triangular')
+
+# Inputs that can be sampled, solve_mass_flow argument names plus the dP reading
+UNCERTAIN_INPUTS = ('rho', 'mu', 'D2', 'D', 'P1', 'dp')
+
+# Elements of the (points x samples) grid solved at once
+CHUNK_ELEMENTS = 2**18
+
+# Upper limit on the samples per band, a chunk holds at least one dP point of them
+MAX_SAMPLES = 200000
+
+
+def deviations(distribution, spread, size, rng):
+    """Relative deviations from the nominal value, spread in percent"""
+
+    spread = float(spread)/100.0
+
+    if distribution == 'normal':
+        return rng.standard_normal(size)*spread
+    elif distribution == 'uniform':
+        return rng.uniform(-spread, spread, size)
+    elif distribution == 'triangular':
+        return rng.triangular(-spread, 0.0, spread, size) if spread > 0.0 else np.zeros(size)
+
+    raise ValueError("Distribution must be one of %s" % (DISTRIBUTIONS,))
+
+
+def flow_percentiles(P1, rho, mu, k, D, D2, meter_type, taps, tap_position, DP, dp_span, uncertainty,
+                     samples=20000, percentiles=(5, 50, 95), seed=None, chunk_elements=CHUNK_ELEMENTS):
+    """
+    Percentiles of the mass flow [kg/s] at every dP [inWC] of DP, an array
+    of shape (len(percentiles), len(DP)), and the number of sample
+    solutions left out of them because the solver returned NaN.
+
+    uncertainty -- {input: (distribution, spread [%])} for any of
+    UNCERTAIN_INPUTS, the rest are held at their nominal value
+    dp_span -- transmitter span [inWC] the dP spread is relative to
+    seed -- for repeatable bands
+    """
+
+    unknown = set(uncertainty) - set(UNCERTAIN_INPUTS)
+    if unknown:
+        raise ValueError("Cannot sample %s" % ', '.join(sorted(unknown)))
+
+    samples = int(samples)
+    if not 0 < samples <= MAX_SAMPLES:
+        raise ValueError("Samples must be between 1 and %d" % MAX_SAMPLES)
+
+    rng = np.random.default_rng(seed)
+    DP = np.asarray(DP, dtype=np.float64)
+
+    nominal = dict(rho=rho, mu=mu, D2=D2, D=D, P1=P1)
+    inputs = {}
+    for name, value in nominal.items():
+        if name in uncertainty:
+            distribution, spread = uncertainty[name]
+            inputs[name] = value*(1.0 + deviations(distribution, spread, samples, rng))
+        else:
+            inputs[name] = np.full(samples, float(value))
+
+    dp_distribution, dp_spread = uncertainty.get('dp', ('normal', 0.0))
+
+    solve = vector_solver(D, meter_type, taps, tap_position)
+
+    result = np.empty((len(percentiles), DP.size))
+    discarded = 0
+    step = max(1, int(chunk_elements) // samples)
+    for start in range(0, DP.size, step):
+        chunk = DP[start:start + step, None]
+
+        # Transmitter error, per reading
+        dp = chunk + dp_span*deviations(dp_distribution, dp_spread, (chunk.size, samples), rng)
+
+        # A reading at or below zero is no flow, solved at a tiny dP so nothing falls back to fluids
+        with np.errstate(invalid='ignore'):
+            M = solve(D=inputs['D'], D2=inputs['D2'], P1=inputs['P1'], P2=inputs['P1'] - np.maximum(dp, 1e-6)*INWC,
+                      rho=inputs['rho'], mu=inputs['mu'], k=k)
+        M = np.where(dp > 0.0, M, 0.0)
+        discarded += int(np.count_nonzero(np.isnan(M)))
+
+        with np.errstate(invalid='ignore'):
+            result[:, start:start + step] = np.nanpercentile(M, percentiles, axis=1)
+
+    return result, discarded
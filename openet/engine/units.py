@@ -0,0 +1,11 @@
+'''
+Unit constants used by the engine and the apps, kept here so that the
+engine does not need scipy.constants (same values, SI base units).
+'''
+
+inch = 0.0254           # m
+psi = 6894.757293168361 # Pa
+atm = 101325.0          # Pa
+
+# Pa per inch of water, the dP unit of the apps
+INWC = 248.84
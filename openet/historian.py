@@ -0,0 +1,279 @@
+import os
+import time
+import tempfile
+from functools import partial
+
+import numpy as np
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+from bokeh.layouts import column
+from bokeh.models.widgets import TextInput, Button, Div, DataTable, TableColumn, NumberFormatter, DateFormatter
+from bokeh.models import Range1d, RadioButtonGroup
+from bokeh.plotting import figure, ColumnDataSource
+
+from openet.conversions import mass_to_gas, mass_to_liquid, HOUR
+from openet.engine.historian import replay, ReplaySeries, daily_totals
+
+
+# Historian files are read from here, names are relative to it.  The name is
+# typed by the browser user, so replay is off unless the server sets one
+HISTORIAN_DIR = os.environ.get('OPENET_HISTORIAN_DIR') or None
+
+
+def historian_path(name, directory=None):
+    """Absolute path of a historian file name, which has to be inside directory (HISTORIAN_DIR)"""
+
+    directory = HISTORIAN_DIR if directory is None else directory
+    if not directory:
+        raise ValueError("historian replay is not enabled on this server (OPENET_HISTORIAN_DIR)")
+
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("%s is not in the historian directory" % name)
+    if not os.path.isfile(path):
+        raise ValueError("No file %s" % name)
+    return path
+
+
+# Class Definition
+# ---------------------------------
+# Historian view for the dP meter solver, a long
+# dP record replayed through its inputs
+
+
+class dPMeterHistorian():
+    """Flow of every reading of a historian file with hourly and daily totals.
+    The solved readings stay on disk (openet.engine.historian), the plot only
+    gets an LTTB downsample of the visible window at the plot width, redone
+    when the x range changes"""
+
+    def __init__(self, dpm, zoom_delay=0.15):
+        """dpm -- the dPMeterSolver whose inputs are used
+        zoom_delay -- seconds of quiet on the x range before downsampling again
+        """
+
+        lg.info("Initializing the dPMeterHistorian")
+
+        self.dpm = dpm
+
+        self._zoom_delay = zoom_delay
+        self._zoom = None
+        self._generation = 0
+        self._closed = False
+
+        # Replay shown: solved records, result of replay, base density and molecular weight
+        self._series = None
+        self._result = None
+        self._inputs = None
+        self._shown = None
+
+        self.source = ColumnDataSource(data=dict(t=[], y=[], dp=[]))
+        self.totals = ColumnDataSource(data=dict(start=[], kg=[], volume=[], flow=[], coverage=[]))
+
+        # Built when first shown, see dPMeterSolver.add_view
+        self.plot = None
+
+        self.setupwidgets()
+
+        dpm.add_view(self, "Historian")
+
+    def plotsetup(self):
+        """Setup the replayed flow vs time plot and the totals table"""
+
+        self.plot = figure(plot_height=self.dpm._plotheight, plot_width=self.dpm._plotwidth, title="Historian Replay",
+                           x_axis_type='datetime', x_range=Range1d(0, 1),
+                           tools="crosshair,box_zoom,xpan,reset,save,xwheel_zoom")
+
+        self.plot.xaxis.axis_label = "Time"
+        self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self.dpm.display_unit()
+        self.plot.line('t', 'y', source=self.source)
+
+        self.plot.x_range.on_change('start', self.zoom)
+        self.plot.x_range.on_change('end', self.zoom)
+
+        columns = [
+            TableColumn(field='start', title="Start", formatter=DateFormatter(format='%Y-%m-%d %H:%M')),
+            TableColumn(field='kg', title="Mass [Kg]", formatter=NumberFormatter(format='0,0.0')),
+            TableColumn(field='volume', title="Standard Volume [m3]", formatter=NumberFormatter(format='0,0.00')),
+            TableColumn(field='flow', title="Mean Flow", formatter=NumberFormatter(format='0.000')),
+            TableColumn(field='coverage', title="Coverage", formatter=NumberFormatter(format='0.0%')),
+        ]
+        self.totals_column.children = [self.period_select,
+                                       DataTable(source=self.totals, columns=columns, width=600, height=300)]
+
+    def setupwidgets(self):
+
+        self.path = TextInput(title="Historian File (time,dp)", value='')
+        self.replay_button = Button(label="Replay", width=self.dpm._widgetwidth)
+        self.period_select = RadioButtonGroup(labels=["Hourly", "Daily"], active=1)
+        self.status = Div(text="")
+
+        # Gets the totals table once the plot is built
+        self.totals_column = column(self.period_select)
+
+    def update_data(self, attr, old, new):
+        """Redraw in the current display unit, the replay itself only runs from the button"""
+
+        if not self.dpm.showing(self):
+            return
+
+        self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self.dpm.display_unit()
+
+        if self._series is not None:
+            self.redraw()
+            self.update_totals(None, None, None)
+
+    def start_replay(self):
+        """Button callback, replay the file through the current inputs on the compute pool"""
+
+        try:
+            path = historian_path(self.path.value.strip())
+            curve, rhos, MW = self.dpm.read_inputs()
+        except ValueError as e:
+            self.status.text = "Cannot replay: %s" % e
+            return
+
+        self._generation += 1
+        generation = self._generation
+        start = time.perf_counter()
+
+        fd, output = tempfile.mkstemp(prefix='openet-replay-', suffix='.bin')
+        os.close(fd)
+
+        self.status.text = "Replaying %s" % os.path.basename(path)
+
+        # On the compute pool when there is one, a busy pool is retried and then reported
+        self.dpm.submit_view(self, partial(self.apply_replay, generation, start, (rhos, MW), output),
+                             partial(self._failed, generation, output), replay, path, curve, output)
+
+    def _failed(self, generation, output, message):
+        _remove(output)
+        if generation != self._generation:
+            return
+
+        # Reading errors can quote the file and the server's paths, they only go to the log
+        if message == "compute pool busy":
+            self.status.text = "Replay not started: compute pool busy, try again"
+        else:
+            self.status.text = "Replay failed, check that the file holds time,dp readings"
+
+    def apply_replay(self, generation, start, inputs, output, result):
+        """Show a finished replay, the one before it is dropped"""
+
+        if generation != self._generation or self._closed:
+            _remove(output)
+            return
+
+        self.close()
+        self._series = ReplaySeries(output)
+        self._result = result
+        self._inputs = inputs
+
+        self.status.text = "%d readings in %.1f s" % (result['rows'], time.perf_counter() - start)
+        if result['solver'] == 'surrogate':
+            self.status.text += ", surrogate tables (flow error below %.2g%%)" % (result['max_error']*100)
+        else:
+            self.status.text += ", exact correlations"
+        if result['failed']:
+            self.status.text += ", %d without a solution (left out of the totals)" % result['failed']
+
+        if not result['rows']:
+            self.source.data = dict(t=[], y=[], dp=[])
+            self.totals.data = dict(start=[], kg=[], volume=[], flow=[], coverage=[])
+            return
+
+        if self.plot is None:
+            self.plotsetup()
+
+        # Whole record, which reset goes back to
+        x_range = self.plot.x_range
+        x_range.update(start=result['start']*1000.0, end=max(result['end'], result['start'] + 1.0)*1000.0)
+        x_range.update(reset_start=x_range.start, reset_end=x_range.end)
+
+        self.redraw()
+        self.update_totals(None, None, None)
+
+    def zoom(self, attr, old, new):
+        """x range callback, downsample the new window once it stops moving"""
+
+        if self._series is None:
+            return
+
+        if self._zoom is not None:
+            self.dpm._doc.remove_timeout_callback(self._zoom)
+        self._zoom = self.dpm._doc.add_timeout_callback(self._zoomed, int(self._zoom_delay*1000))
+
+    def _zoomed(self):
+        self._zoom = None
+        self.redraw()
+
+    def redraw(self):
+        """Downsampled window of the x range, in the display unit"""
+
+        if self._series is None:
+            return
+
+        x_range = self.plot.x_range
+        shown = x_range.start, x_range.end, self.dpm.ga
+        if shown == self._shown:
+            return
+
+        rhos, MW = self._inputs
+        records = self._series.window(x_range.start/1000.0, x_range.end/1000.0, self.plot.plot_width)
+
+        self.source.data = dict(t=records['t']*1000.0, y=self.dpm.display_flow(records['kg'], rhos, MW),
+                                dp=records['dp'])
+        self._shown = shown
+
+    def update_totals(self, attr, old, new):
+        """Fill the totals table with the hourly or daily totals"""
+
+        if self._result is None:
+            return
+
+        totals = self._result['hourly']
+        period = HOUR
+        if self.period_select.active == 1:
+            totals = daily_totals(totals)
+            period = 24*HOUR
+
+        rhos, MW = self._inputs
+        start, kg, seconds = np.array(totals, dtype=np.float64).reshape(-1, 3).T
+
+        if self.dpm.ga:
+            volume = mass_to_gas(kg, MW, 'm3/h', self.dpm._standard)/HOUR
+        else:
+            volume = mass_to_liquid(kg, rhos, 'm3/h')/HOUR
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            flow = self.dpm.display_flow(np.where(seconds > 0.0, kg/seconds, np.nan), rhos, MW)
+
+        self.totals.data = dict(start=start*1000.0, kg=kg, volume=volume, flow=flow, coverage=seconds/period)
+
+        if len(self.totals_column.children) > 1:
+            self.totals_column.children[1].columns[3].title = "Mean Flow [%s]" % self.dpm.display_unit()
+
+    def close(self):
+        """Drop the replay shown and its file"""
+
+        if self._series is not None:
+            path = self._series.path
+            self._series.close()
+            self._series = None
+            _remove(path)
+
+        self._result = None
+        self._shown = None
+
+    def session_destroyed(self, session_context):
+        self._closed = True
+        self.close()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,200 @@
+import time
+from functools import partial
+
+import numpy as np
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+from bokeh.models.widgets import TextInput, Div
+from bokeh.models import Toggle
+from bokeh.plotting import figure, ColumnDataSource
+
+from openet.engine import solve_readings
+from openet.sources import open_source
+
+
+# Class Definition
+# ---------------------------------
+# Live view for the dP meter solver, flows are
+# solved with its inputs for every streamed dP
+
+
+class dPMeterLive():
+    """Live flow from a stream of dP readings, appended to the plot with
+    ColumnDataSource.stream so only new readings go to the browser.
+    Readings are solved on the compute pool when there is one, a poll at
+    a time, the next ones wait in the source meanwhile"""
+
+    def __init__(self, dpm, rollover=3000, period=0.2):
+        """dpm -- the dPMeterSolver whose inputs are used
+        rollover -- readings kept in the plot (and in memory)
+        period -- seconds between polls of the source
+        """
+
+        lg.info("Initializing the dPMeterLive")
+
+        self.dpm = dpm
+
+        self._rollover = rollover
+        self._period = period
+        self._callback = None
+        self._reader = None
+
+        # Solve inputs, None while the widgets do not give a meter to solve
+        self._inputs = None
+        self._error = None
+        self._ga = dpm.ga
+        self._generation = 0
+        self._inflight = False
+
+        self.source = ColumnDataSource(data=self._empty())
+
+        # Built when first shown, see dPMeterSolver.add_view
+        self.plot = None
+
+        self.setupwidgets()
+
+        dpm.add_view(self, "Live")
+
+    def _empty(self):
+        return dict(t=np.array([]), dp=np.array([]), kg=np.array([]), y=np.array([]))
+
+    def plotsetup(self):
+        """Setup the live flow vs time plot"""
+
+        self.plot = figure(plot_height=self.dpm._plotheight, plot_width=self.dpm._plotwidth, title="Live Flow",
+                           x_axis_type='datetime', tools="crosshair,box_zoom,pan,reset,save,wheel_zoom")
+
+        self.plot.xaxis.axis_label = "Time"
+        self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self.dpm.display_unit()
+        self.plot.line('t', 'y', source=self.source)
+
+    def setupwidgets(self):
+
+        self.source_url = TextInput(title="Live dP Source", value='sim://?rate=20&mean=100&noise=5')
+        self.live_toggle = Toggle(label="Start Live", active=False)
+        self.status = Div(text="")
+
+    def update_data(self, attr, old, new):
+        """Pick up the current inputs, applied to the readings that follow"""
+
+        if self.plot is not None:
+            self.plot.yaxis.axis_label = "Flow at Base conditions [%s]" % self.dpm.display_unit()
+
+        # The history is in the old unit, start over rather than resend it converted
+        if self.dpm.ga != self._ga:
+            self._ga = self.dpm.ga
+            self.source.data = self._empty()
+
+        try:
+            curve, rhos, MW = self.dpm.read_inputs()
+        except ValueError as e:
+            self._inputs = None
+            self._error = str(e)
+        else:
+            self._inputs = curve, rhos, MW
+            self._error = None
+
+        if self._callback is not None:
+            self.show_status()
+
+    def show_status(self):
+        if self._error is None:
+            self.status.text = "Streaming %s" % self.source_url.value
+        else:
+            self.status.text = "Streaming %s, readings not solved: %s" % (self.source_url.value, self._error)
+
+    def update_live(self, attr, old, new):
+        """Start or stop polling the source"""
+
+        if self.live_toggle.active:
+            try:
+                self._reader = open_source(self.source_url.value)
+            except (OSError, ValueError) as e:
+                self.status.text = "Cannot open %s: %s" % (self.source_url.value, e)
+                self.live_toggle.active = False
+                return
+
+            self._callback = self.dpm._doc.add_periodic_callback(self.poll, int(self._period*1000))
+            self.update_data(None, None, None)
+            self.live_toggle.label = "Stop Live"
+
+        else:
+            self.stop()
+
+    def stop(self):
+        # Readings still being solved are not streamed
+        self._generation += 1
+
+        if self._callback is not None:
+            self.dpm._doc.remove_periodic_callback(self._callback)
+            self._callback = None
+
+        self.close()
+        self.live_toggle.label = "Start Live"
+
+    def close(self):
+        """Release the source"""
+
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def session_destroyed(self, session_context):
+        self.close()
+
+    def poll(self):
+        """Solve the readings that arrived since the last poll and stream them"""
+
+        if self._inflight:
+            # Streamed in order, these wait for the solve before them
+            return
+
+        try:
+            readings = self._reader.read(self._rollover)
+        except OSError as e:
+            self.status.text = "Source failed: %s" % e
+            self.live_toggle.active = False
+            return
+
+        if not readings or self._inputs is None:
+            return
+
+        t, DP = np.array(readings).T
+        curve, rhos, MW = self._inputs
+
+        # Every new reading in one batched solve
+        args = dict(P1=curve['P1'], rho=curve['rho'], mu=curve['mu'], k=curve['k'], D=curve['D'], D2=curve['D2'],
+                    meter_type=curve['meter_type'], taps=curve['taps'], tap_position=curve['tap_position'],
+                    surrogate=curve['surrogate'])
+
+        self._inflight = True
+        self.dpm.submit_view(self, partial(self.apply_flows, self._generation, t, DP, rhos, MW, time.perf_counter()),
+                             partial(self._failed, self._generation), solve_readings, DP, **args)
+
+    def _failed(self, generation, message):
+        self._inflight = False
+        if generation != self._generation:
+            return
+
+        if message != "compute pool busy":
+            # These inputs do not solve, readings are dropped until they change
+            self._inputs = None
+        self._error = message
+        self.show_status()
+
+    def apply_flows(self, generation, t, DP, rhos, MW, start, M):
+        """Stream solved readings"""
+
+        self._inflight = False
+        if generation != self._generation:
+            return
+
+        if self._error is not None:
+            self._error = None
+            self.show_status()
+
+        self.source.stream(dict(t=t*1000.0, dp=DP, kg=M, y=self.dpm.display_flow(M, rhos, MW)),
+                           rollover=self._rollover)
+
+        lg.debug("Streamed %d readings in %.2f ms", len(DP), (time.perf_counter() - start)*1000)
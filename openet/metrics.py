@@ -0,0 +1,289 @@
+'''
+Process wide metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python objects updated in place, an
+observation costs a lock and a bisect, so the instrumentation stays on in
+production.  The text format is rendered on demand by a small Tornado
+handler that start_server() runs on the Bokeh server's own event loop, on a
+separate port (OPENET_METRICS_PORT, default 9464, 0 disables it):
+
+    curl http://localhost:9464/metrics
+
+Reference:
+https://prometheus.io/docs/instrumenting/exposition_formats/
+'''
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+DEFAULT_PORT = 9464
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POINT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for n, v in zip(names, values))
+
+
+class Metric():
+    """A metric family, one child per label combination"""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._child()
+            return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """(suffix, label names, label values, value) tuples"""
+
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            for suffix, names, extra, value in child.samples():
+                yield suffix, self.labelnames + names, values + extra, value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, names, values, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, _labels(names, values), repr(float(value))))
+        return '\n'.join(lines)
+
+
+class _Value():
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield '', (), (), self.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """Gauge, optionally read from a function at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self._function = function
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1.0):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def samples(self):
+        if self._function is not None:
+            yield '', (), (), self._function()
+        else:
+            yield from super().samples()
+
+
+class _Buckets():
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', ('le',), ('+Inf' if bound == float('inf') else repr(float(bound)),), cumulative
+        yield '_sum', (), (), total
+        yield '_count', (), (), cumulative
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class Registry():
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def timed(child):
+    """Observe the seconds spent in the with block on a histogram (child)"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        child.observe(time.perf_counter() - start)
+
+
+# Metrics of the DP meter server
+# ---------------------------------
+
+CALLBACK_SECONDS = REGISTRY.register(Histogram(
+    'openet_callback_seconds', "Time spent in Bokeh callbacks on the event loop", ['callback']))
+
+SOLVE_SECONDS = REGISTRY.register(Histogram(
+    'openet_solve_seconds', "Curve solve time, inline or on the compute pool (queueing included)",
+    ['meter_type', 'path']))
+
+SOLVER_CALLS = REGISTRY.register(Counter(
+    'openet_solver_calls_total', "Curve solves, cache misses only", ['meter_type']))
+
+SOLVER_FAILURES = REGISTRY.register(Counter(
+    'openet_solver_failures_total', "Curve updates that failed, invalid inputs or no convergence", ['stage']))
+
+CURVE_POINTS = REGISTRY.register(Histogram(
+    'openet_curve_points', "Points per solved curve", buckets=POINT_BUCKETS))
+
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    'openet_active_sessions', "Open Bokeh sessions", ['app']))
+
+def resident_memory():
+    """Resident set size of this process [bytes], the peak where the current one cannot be read"""
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale
+
+
+RESIDENT_MEMORY = REGISTRY.register(Gauge(
+    'openet_process_resident_memory_bytes', "Resident memory of the server process", function=resident_memory))
+
+PAYLOAD_BYTES = REGISTRY.register(Counter(
+    'openet_payload_bytes_total', "Websocket bytes of curve updates, when payload measuring is on"))
+
+
+def _cache_stat(name):
+    def read():
+        from openet.engine import curve_cache
+        return curve_cache.stats()[name]
+    return read
+
+
+for _name in ('hits', 'misses', 'evictions', 'size'):
+    REGISTRY.register(Gauge('openet_curve_cache_%s' % _name, "Shared curve cache %s" % _name,
+                            function=_cache_stat(_name)))
+
+
+# Serving
+# ---------------------------------
+
+_server = None
+
+
+def make_handler(registry=REGISTRY):
+    """Tornado RequestHandler class serving registry"""
+
+    from tornado.web import RequestHandler
+
+    class MetricsHandler(RequestHandler):
+
+        def get(self):
+            self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.write(registry.render())
+
+    return MetricsHandler
+
+
+def start_server(port=None, address=''):
+    """Serve /metrics on the current event loop, once per process. Returns the port or None"""
+
+    global _server
+
+    if port is None:
+        port = int(os.environ.get('OPENET_METRICS_PORT', DEFAULT_PORT))
+
+    if _server is not None or not port:
+        return None
+
+    from tornado.web import Application
+
+    _server = Application([(r'/metrics', make_handler())]).listen(port, address=address)
+    return port
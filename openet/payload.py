@@ -0,0 +1,58 @@
+'''
+Websocket payload accounting for a Bokeh document.
+
+Every change to a document is sent to the browser as a PATCH-DOC message.
+PayloadMeter listens to the same change events and sizes the message each one
+turns into (JSON frames plus binary array buffers), so updates can be
+compared by the bytes they put on the wire.  Sizing means serializing every
+event a second time, so the meter is only attached on request, see
+OPENET_MEASURE_PAYLOAD.
+'''
+
+import os
+
+from bokeh.protocol import Protocol
+
+
+def measure_payload_default():
+    return os.environ.get('OPENET_MEASURE_PAYLOAD', '').lower() in ('1', 'true', 'yes')
+
+
+def message_bytes(message):
+    """Bytes a protocol message takes on the websocket, JSON frames and buffers"""
+
+    size = len(message.header_json) + len(message.metadata_json) + len(message.content_json)
+    for header, payload in message.buffers:
+        size += len(str(header)) + len(payload)
+    return size
+
+
+class PayloadMeter():
+    """Running total of the PATCH-DOC bytes produced by changes to a document"""
+
+    def __init__(self, doc):
+
+        self.total = 0
+        self.messages = 0
+        self._pending = 0
+
+        self._protocol = Protocol()
+
+        doc.on_change(self._on_change)
+
+    def _on_change(self, event):
+        try:
+            size = message_bytes(self._protocol.create('PATCH-DOC', [event]))
+        except Exception:
+            # Events that never go to the browser (e.g. callbacks) cannot be serialized
+            return
+
+        self.total += size
+        self.messages += 1
+        self._pending += size
+
+    def take(self):
+        """Bytes sent since the previous take"""
+
+        size, self._pending = self._pending, 0
+        return size
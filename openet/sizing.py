@@ -0,0 +1,157 @@
+from functools import partial
+
+import numpy as np
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+from bokeh.models.widgets import TextInput, Select, Div
+from bokeh.models import LinearColorMapper, ColorBar
+from bokeh.palettes import Viridis256
+from bokeh.plotting import figure, ColumnDataSource
+
+from openet.engine.units import inch
+from openet.engine import sizing_grid, BATCH_METER_TYPES
+from openet.engine.batch import METER_ALIASES
+from openet.engine.sizing import BETA_MIN, BETA_MAX
+
+
+# Class Definition
+# ---------------------------------
+# Sizing view for the dP meter solver, shares
+# its input widgets and is updated with them
+
+
+class dPMeterSizing():
+    """Meter sizing view: a bore x dP (or flow x bore) design grid
+    rendered as a heatmap, plus the bore required for a target flow.
+    The grid is solved on the compute pool when there is one"""
+
+    FLOW_GRID = "Flow over bore and dP"
+    DP_GRID = "dP over flow and bore"
+
+    def __init__(self, dpm):
+        """dpm -- the dPMeterSolver whose inputs are sized"""
+
+        lg.info("Initializing the dPMeterSizing")
+
+        self.dpm = dpm
+
+        self._gridpoints = 100
+        # Meter types without a batched correlation go through the scalar solver
+        self._scalargridpoints = 20
+        self._betamin = 0.1
+        self._betamax = 0.75
+        self._generation = 0
+
+        self.source = ColumnDataSource(data=dict(image=[], x=[], y=[], dw=[], dh=[]))
+        self.bore_source = ColumnDataSource(data=dict(x=[], y=[]))
+
+        # Built when first shown, see dPMeterSolver.add_view
+        self.plot = None
+        self.color_mapper = None
+
+        self.setupwidgets()
+
+        dpm.add_view(self, "Sizing")
+
+    def plotsetup(self):
+        """Setup the sizing heatmap"""
+
+        self.color_mapper = LinearColorMapper(palette=Viridis256)
+
+        self.plot = figure(plot_height=self.dpm._plotheight, plot_width=self.dpm._plotwidth, title="Meter Sizing",
+                           tools="crosshair,box_zoom,pan,reset,save,wheel_zoom")
+
+        self.plot.image(image='image', x='x', y='y', dw='dw', dh='dh', color_mapper=self.color_mapper, source=self.source)
+        self.plot.line('x', 'y', source=self.bore_source, line_color='red')
+
+        self.plot.add_layout(ColorBar(color_mapper=self.color_mapper, location=(0, 0)), 'right')
+
+    def setupwidgets(self):
+
+        self.grid_select = Select(title="Sizing Grid:", value=self.FLOW_GRID, options=[self.FLOW_GRID, self.DP_GRID])
+        self.target = TextInput(title="Target Flow", value='1000', width=self.dpm._widgetwidth)
+        self.result = Div(text="")
+
+    def update_data(self, attr, old, new):
+
+        unit = self.dpm.display_unit()
+        self.target.title = "Target Flow [%s]" % unit
+
+        if not self.dpm.showing(self):
+            return
+
+        self._generation += 1
+
+        try:
+            curve, rhos, MW = self.dpm.read_inputs()
+            target = float(self.target.value)
+            if not target > 0.0 or not np.isfinite(target):
+                raise ValueError("the target flow must be a positive number")
+        except ValueError as e:
+            self.result.text = "Cannot size: %s" % e
+            return
+
+        batched = METER_ALIASES.get(curve['meter_type'], curve['meter_type']) in BATCH_METER_TYPES
+
+        # Display flow per kg/s, to go back from the target to a mass flow
+        per_kg = self.dpm.display_flow(1.0, rhos, MW)
+
+        args = dict(D=curve['D'], m=target/per_kg, P1=curve['P1'], rho=curve['rho'], mu=curve['mu'], k=curve['k'],
+                    dp_min=curve['dp_min'], dp_max=curve['dp_max'], meter_type=curve['meter_type'],
+                    taps=curve['taps'], tap_position=curve['tap_position'],
+                    n=self._gridpoints if batched else self._scalargridpoints, beta_min=self._betamin,
+                    beta_max=self._betamax, flows=self.grid_select.value == self.DP_GRID)
+
+        generation = self._generation
+        self.dpm.submit_view(self, partial(self.apply_grid, generation, target, unit, per_kg, args),
+                             partial(self._failed, generation), sizing_grid, **args)
+
+    def _failed(self, generation, message):
+        if generation == self._generation:
+            self.source.data = dict(image=[], x=[], y=[], dw=[], dh=[])
+            self.bore_source.data = dict(x=[], y=[])
+            self.result.text = "Cannot size: %s" % message
+
+    def apply_grid(self, generation, target, unit, per_kg, args, grid):
+        """Show a sizing_grid result in the display unit"""
+
+        if generation != self._generation:
+            return
+
+        bores, axis, image = grid['bores'], grid['axis'], grid['image']
+        D, dp_max = args['D'], args['dp_max']
+
+        if not args['flows']:
+            # Rows are bores, columns are dPs
+            image = image*per_kg
+            self.plot.xaxis.axis_label = "Differential Pressure [inWC]"
+            self.plot.title.text = "Flow [%s] over bore and dP" % unit
+
+            # Bore needed for the target flow along the dP axis
+            self.bore_source.data = dict(x=axis, y=grid['bore_line']/inch)
+
+        else:
+            # Rows are bores, columns are flows
+            axis = axis*per_kg
+            self.plot.xaxis.axis_label = "Flow [%s]" % unit
+            self.plot.title.text = "dP [inWC] over flow and bore"
+            self.bore_source.data = dict(x=[], y=[])
+
+        self.plot.yaxis.axis_label = "Bore [Inch]"
+        self.source.data = dict(image=[image], x=[axis[0]], y=[bores[0]/inch], dw=[axis[-1] - axis[0]],
+                                dh=[(bores[-1] - bores[0])/inch])
+
+        finite = image[np.isfinite(image)]
+        if finite.size:
+            self.color_mapper.low = float(finite.min())
+            self.color_mapper.high = float(finite.max())
+
+        # Required bore at full scale dP, read straight off the sizing solve
+        bore = grid['bore']
+        if np.isfinite(bore):
+            self.result.text = ("Required bore for %g %s at %g inWC: <b>%.4f Inch</b> (beta %.3f)"
+                                % (target, unit, dp_max, bore/inch, bore/D))
+        else:
+            self.result.text = ("%g %s at %g inWC is out of range for beta %.2f to %.2f"
+                                % (target, unit, dp_max, BETA_MIN, BETA_MAX))
@@ -0,0 +1,210 @@
+'''
+Live dP reading sources for the streaming view.
+
+A source is polled from the Bokeh event loop, so read() never blocks: it
+returns the (time [s since epoch], dP [inWC]) readings that arrived since the
+last call, at most `limit` of them (older ones are dropped, the view only
+keeps a bounded history anyway).  Text based sources take one reading per
+line, either "dp" or "time,dp".
+
+    sim://?rate=20&mean=100&noise=5     simulated transmitter
+    file:///var/log/dp.csv              tail of a growing file
+    udp://0.0.0.0:5007                  datagrams of lines
+    tcp://historian:5008                line stream from a server
+
+Sources are plain classes, anything with read(limit) and close() can be
+passed to dPMeterLive directly (e.g. an OPC UA subscription).
+
+The url is typed by the browser user, so only sim:// is open by default.
+The other schemes need a server side allow-list:
+
+    OPENET_LIVE_DIRS=/var/log/dp:/data/dp       file:// paths inside these
+    OPENET_LIVE_HOSTS=0.0.0.0:5007,historian:*  udp:// binds and tcp://
+                                                connections to these host:port
+                                                pairs, * for any port
+'''
+
+import math
+import os
+import random
+import socket
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qsl
+
+
+def parse_line(line, now):
+    """(time, dp) from a 'dp' or 'time,dp' line, None for anything else"""
+
+    fields = line.strip().split(',')
+    try:
+        if len(fields) == 1:
+            return now, float(fields[0])
+        return float(fields[0]), float(fields[1])
+    except ValueError:
+        return None
+
+
+class LineBuffer():
+    """Split incoming bytes into lines, keeping the last `limit` complete readings"""
+
+    def __init__(self, limit):
+        self._partial = b''
+        self.readings = deque(maxlen=limit)
+
+    def feed(self, data, now):
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+
+        for line in lines:
+            reading = parse_line(line.decode(errors='ignore'), now)
+            if reading is not None:
+                self.readings.append(reading)
+
+    def drain(self, limit):
+        readings = list(self.readings)[-limit:]
+        self.readings.clear()
+        return readings
+
+
+class SimulatedSource():
+    """Noisy sine wave around a mean dP, standing in for a transmitter"""
+
+    def __init__(self, rate=20.0, mean=100.0, noise=5.0, amplitude=20.0, period=60.0):
+        self.rate = float(rate)
+        self.mean = float(mean)
+        self.noise = float(noise)
+        self.amplitude = float(amplitude)
+        self.period = float(period)
+        self._last = time.time()
+
+    def read(self, limit=1000):
+        now = time.time()
+        count = int((now - self._last)*self.rate)
+        if count <= 0:
+            return []
+
+        times = [self._last + (i + 1)/self.rate for i in range(count)][-limit:]
+        self._last += count/self.rate
+
+        return [(t, max(self.mean + self.amplitude*math.sin(2*math.pi*t/self.period) + random.gauss(0.0, self.noise),
+                        0.0))
+                for t in times]
+
+    def close(self):
+        pass
+
+
+class FileTailSource():
+    """New lines appended to a file, like tail -f"""
+
+    def __init__(self, path, limit=1000):
+        self._file = open(path, 'rb')
+        self._file.seek(0, 2)
+        self._buffer = LineBuffer(limit)
+
+    def read(self, limit=1000):
+        data = self._file.read()
+        if data:
+            self._buffer.feed(data, time.time())
+        return self._buffer.drain(limit)
+
+    def close(self):
+        self._file.close()
+
+
+class UDPSource():
+    """Readings sent as UDP datagrams, one or more lines each"""
+
+    def __init__(self, host='0.0.0.0', port=5007, limit=1000):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.setblocking(False)
+        self._buffer = LineBuffer(limit)
+
+    def read(self, limit=1000):
+        now = time.time()
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except BlockingIOError:
+                break
+            # A datagram is complete even without a trailing newline
+            self._buffer.feed(data.rstrip(b'\n') + b'\n', now)
+        return self._buffer.drain(limit)
+
+    def close(self):
+        self._socket.close()
+
+
+class TCPSource():
+    """Line stream read from a TCP server"""
+
+    def __init__(self, host, port, limit=1000, timeout=5.0):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.setblocking(False)
+        self._buffer = LineBuffer(limit)
+
+    def read(self, limit=1000):
+        now = time.time()
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except BlockingIOError:
+                break
+            if not data:
+                raise ConnectionError("dP source closed the connection")
+            self._buffer.feed(data, now)
+        return self._buffer.drain(limit)
+
+    def close(self):
+        self._socket.close()
+
+
+# Allow-lists of the file, udp and tcp sources, see the module docstring
+LIVE_DIRS = [path for path in os.environ.get('OPENET_LIVE_DIRS', '').split(os.pathsep) if path]
+LIVE_HOSTS = [host.strip() for host in os.environ.get('OPENET_LIVE_HOSTS', '').split(',') if host.strip()]
+
+
+def allowed_path(path, dirs=None):
+    """Real path of path, which has to be inside one of dirs (LIVE_DIRS)"""
+
+    path = os.path.realpath(path)
+    for directory in LIVE_DIRS if dirs is None else dirs:
+        root = os.path.realpath(directory)
+        if os.path.commonpath([root, path]) == root:
+            return path
+    raise ValueError("%s is not in an allowed directory (OPENET_LIVE_DIRS)" % path)
+
+
+def allowed_host(host, port, hosts=None):
+    """Raise ValueError unless host:port is in hosts (LIVE_HOSTS)"""
+
+    for entry in LIVE_HOSTS if hosts is None else hosts:
+        name, _, allowed = entry.rpartition(':')
+        if name.lower() == (host or '').lower() and allowed in ('*', str(port)):
+            return
+    raise ValueError("%s:%s is not an allowed host (OPENET_LIVE_HOSTS)" % (host, port))
+
+
+def open_source(url, dirs=None, hosts=None):
+    """Source for a sim://, file://, udp:// or tcp:// url, the last three
+    only inside dirs and hosts (default LIVE_DIRS and LIVE_HOSTS)"""
+
+    parts = urlsplit(url)
+    options = dict(parse_qsl(parts.query))
+
+    if parts.scheme == 'sim':
+        return SimulatedSource(**{name: float(value) for name, value in options.items()})
+    elif parts.scheme == 'file':
+        return FileTailSource(allowed_path(parts.netloc + parts.path, dirs))
+    elif parts.scheme == 'udp':
+        host, port = parts.hostname or '0.0.0.0', parts.port or 5007
+        allowed_host(host, port, hosts)
+        return UDPSource(host, port)
+    elif parts.scheme == 'tcp':
+        allowed_host(parts.hostname, parts.port, hosts)
+        return TCPSource(parts.hostname, parts.port)
+
+    raise ValueError("Unsupported dP source %s" % url)
@@ -0,0 +1,215 @@
+'''
+Persistent per-tag store of meter inputs and solved curves.
+
+One SQLite database (OPENET_DATA_DIR/tags.sqlite3, default ~/.openet) shared
+by every session and process of the server.  The tag name is the primary
+key, so loading a tag is an index lookup however many thousands are saved;
+listing tags by prefix is a range scan of the same index.  Each row holds
+the input widget values as JSON, the curve cache key they solve to, and the
+solved dP and mass flow arrays as float64 blobs.
+
+    python -m openet.store list [prefix]
+    python -m openet.store export tags.csv             # inputs, openet CLI format
+    python -m openet.store export curves.csv --curves  # tag, dp, mass_flow rows
+
+The inputs export can be fed straight back into the batch CLI (openet.cli).
+'''
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+DATA_DIR = os.environ.get('OPENET_DATA_DIR', os.path.join(os.path.expanduser('~'), '.openet'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT PRIMARY KEY,
+    inputs TEXT NOT NULL,
+    curve_key TEXT,
+    dp BLOB,
+    mass_flow BLOB,
+    updated REAL NOT NULL
+)
+'''
+
+# Stored widget values to the column names of openet.cli
+EXPORT_COLUMNS = [('density', 'density'), ('pressure', 'Pi'), ('viscosity', 'viscosity'), ('orifice', 'orifice'),
+                  ('pipe', 'pipe'), ('isentropic', 'isentropic'), ('molecular', 'molecular'),
+                  ('densitybase', 'densitybase'), ('meter_type', 'meter_select'), ('taps', 'tap_select'),
+                  ('tap_position', 'tap_position')]
+
+
+def _blob(values):
+    return None if values is None else np.ascontiguousarray(values, dtype=np.float64).tobytes()
+
+
+def _array(blob):
+    # Read only view of the row's bytes, like the curve cache's arrays
+    return None if blob is None else np.frombuffer(blob, dtype=np.float64)
+
+
+class TagStore():
+    """Thread safe store of tag rows, see the module docstring"""
+
+    def __init__(self, path):
+
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Readers do not block the writer, for several server processes on one file
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+        self._db.commit()
+
+    def save(self, tag, inputs, curve_key=None, DP=None, M=None):
+        """Insert or replace the inputs (a JSON-able dict) and curve of tag"""
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?, ?)',
+                             (tag, json.dumps(inputs), None if curve_key is None else repr(curve_key),
+                              _blob(DP), _blob(M), time.time()))
+            self._db.commit()
+
+    def load(self, tag):
+        """dict(inputs, curve_key, DP, M, updated) of tag, or None"""
+
+        with self._lock:
+            row = self._db.execute('SELECT inputs, curve_key, dp, mass_flow, updated FROM tags WHERE tag = ?',
+                                   (tag,)).fetchone()
+        if row is None:
+            return None
+
+        inputs, curve_key, dp, mass_flow, updated = row
+        return dict(inputs=json.loads(inputs), curve_key=curve_key, DP=_array(dp), M=_array(mass_flow),
+                    updated=updated)
+
+    def delete(self, tag):
+        with self._lock:
+            self._db.execute('DELETE FROM tags WHERE tag = ?', (tag,))
+            self._db.commit()
+
+    def tags(self, prefix='', limit=None):
+        """Tag names starting with prefix, in order, from the primary key index"""
+
+        query = 'SELECT tag FROM tags WHERE tag >= ?'
+        args = [prefix]
+        if prefix:
+            # Every string with the prefix sorts below prefix + U+10FFFF
+            query += ' AND tag < ?'
+            args.append(prefix + '\U0010ffff')
+        query += ' ORDER BY tag'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(int(limit))
+
+        with self._lock:
+            return [tag for tag, in self._db.execute(query, args)]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+
+    def rows(self, prefix='', batch=1000):
+        """Yield (tag, inputs, DP, M) of every tag in order, a batch of rows at a time"""
+
+        last = None
+        while True:
+            with self._lock:
+                if last is None:
+                    query, args = 'SELECT tag, inputs, dp, mass_flow FROM tags WHERE tag >= ?', [prefix]
+                else:
+                    query, args = 'SELECT tag, inputs, dp, mass_flow FROM tags WHERE tag > ?', [last]
+                rows = self._db.execute(query + ' ORDER BY tag LIMIT ?', args + [batch]).fetchall()
+
+            for tag, inputs, dp, mass_flow in rows:
+                if prefix and not tag.startswith(prefix):
+                    return
+                yield tag, json.loads(inputs), _array(dp), _array(mass_flow)
+
+            if len(rows) < batch:
+                return
+            last = rows[-1][0]
+
+    def export(self, path, prefix='', curves=False):
+        """Write the tags to a CSV file, their inputs in the openet CLI format,
+        or with curves one tag, dp, mass_flow row per curve point. Returns the tag count"""
+
+        count = 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            if curves:
+                writer.writerow(['tag', 'dp', 'mass_flow'])
+            else:
+                writer.writerow(['tag'] + [column for column, _ in EXPORT_COLUMNS])
+
+            for tag, inputs, DP, M in self.rows(prefix):
+                if curves:
+                    if DP is not None:
+                        writer.writerows((tag, repr(float(dp)), repr(float(m))) for dp, m in zip(DP, M))
+                else:
+                    writer.writerow([tag] + [inputs.get(name, '') for _, name in EXPORT_COLUMNS])
+                count += 1
+
+        return count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process wide store under OPENET_DATA_DIR, opened on first use"""
+
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = TagStore(os.path.join(DATA_DIR, 'tags.sqlite3'))
+        return _store
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python -m openet.store', description="Saved meter tags")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    tags = commands.add_parser('list', help="tag names")
+    tags.add_argument('prefix', nargs='?', default='')
+
+    export = commands.add_parser('export', help="write tags to CSV")
+    export.add_argument('output')
+    export.add_argument('--prefix', default='', help="only tags starting with this")
+    export.add_argument('--curves', action='store_true', help="curve points instead of inputs")
+
+    args = parser.parse_args(argv)
+    store = get_store()
+
+    if args.command == 'list':
+        for tag in store.tags(args.prefix):
+            print(tag)
+    else:
+        count = store.export(args.output, args.prefix, args.curves)
+        print("Exported %d tags to %s" % (count, args.output), file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
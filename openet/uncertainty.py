@@ -0,0 +1,182 @@
+import time
+from functools import partial
+
+import numpy as np
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+from bokeh.models.widgets import TextInput, Select, Div
+from bokeh.models import Toggle, Legend, LegendItem
+from bokeh.plotting import ColumnDataSource
+
+from openet.engine import flow_percentiles
+from openet.engine.uncertainty import DISTRIBUTIONS, MAX_SAMPLES
+
+
+# Class Definition
+# ---------------------------------
+# Monte Carlo uncertainty bands drawn on the
+# dP meter solver's own flow curve plot
+
+
+class dPMeterUncertainty():
+    """P5/P50/P95 flow bands from sampled input uncertainty, shaded on dpm.plot"""
+
+    # (input, widget title, default distribution, default spread [%])
+    INPUTS = [
+        ('rho', "Density", 'normal', '0.5'),
+        ('mu', "Viscosity", 'uniform', '10'),
+        ('D2', "Bore", 'normal', '0.05'),
+        ('D', "Pipe ID", 'normal', '0.25'),
+        ('P1', "Pressure", 'normal', '0.5'),
+        ('dp', "dP (% of span)", 'normal', '0.1'),
+    ]
+
+    def __init__(self, dpm, points=25, percentiles=(5, 50, 95)):
+        """dpm -- the dPMeterSolver whose curve gets the bands
+        points -- log spaced dP points the bands are computed at
+        """
+
+        lg.info("Initializing the dPMeterUncertainty")
+
+        self.dpm = dpm
+
+        self._points = points
+        self._percentiles = percentiles
+        self._generation = 0
+
+        # Inputs and mass flow percentiles of the bands shown, see update_data
+        self._bands = None
+        self._samples = None
+
+        # Band renderers, their legend is added with the first bands drawn
+        self._renderers = None
+        self.legend = None
+
+        self.source = ColumnDataSource(data=dict(x=[], low=[], median=[], high=[]))
+
+        self.plotsetup()
+
+        self.setupwidgets()
+
+        dpm.add_view(self)
+
+    def plotsetup(self):
+        """Band and median on the flow curve plot"""
+
+        plot = self.dpm.plot
+        self._renderers = (plot.varea(x='x', y1='low', y2='high', source=self.source, fill_alpha=0.25),
+                           plot.line('x', 'median', source=self.source, line_dash='dashed'))
+
+    def show_legend(self, visible):
+        """Legend of the bands, added to the plot the first time they are drawn"""
+
+        if self.legend is None:
+            if not visible:
+                return
+            band, median = self._renderers
+            self.legend = Legend(items=[
+                LegendItem(label="P%g-P%g" % (self._percentiles[0], self._percentiles[-1]), renderers=[band]),
+                LegendItem(label="P%g" % self._percentiles[1], renderers=[median]),
+            ], location='top_left')
+            self.dpm.plot.add_layout(self.legend)
+
+        self.legend.visible = visible
+
+    def setupwidgets(self):
+
+        self.toggle = Toggle(label="Uncertainty Bands", active=False)
+        self.samples = TextInput(title="Samples (max %d)" % MAX_SAMPLES, value='20000', width=self.dpm._widgetwidth)
+        self.status = Div(text="")
+
+        self.distributions = {}
+        self.spreads = {}
+        for name, title, distribution, spread in self.INPUTS:
+            self.distributions[name] = Select(title="%s ±%%" % title, value=distribution, options=list(DISTRIBUTIONS),
+                                              width=self.dpm._widgetwidth)
+            self.spreads[name] = TextInput(title="", value=spread, width=self.dpm._widgetwidth)
+
+    def read_uncertainty(self):
+        """{input: (distribution, spread)} of the widgets, see openet.engine.uncertainty"""
+
+        return {name: (self.distributions[name].value, float(self.spreads[name].value))
+                for name, _, _, _ in self.INPUTS}
+
+    def read_samples(self):
+        """(samples, requested) of the widget, samples limited to MAX_SAMPLES"""
+
+        try:
+            requested = int(self.samples.value)
+        except ValueError:
+            raise ValueError("samples must be a whole number")
+        if requested < 1:
+            raise ValueError("samples must be at least 1")
+        return min(requested, MAX_SAMPLES), requested
+
+    def clear(self, status=""):
+        self.source.data = dict(x=[], low=[], median=[], high=[])
+        self.status.text = status
+        self._bands = None
+        self.show_legend(False)
+
+    def update_data(self, attr, old, new):
+
+        self._generation += 1
+        generation = self._generation
+
+        if not self.toggle.active:
+            self.clear()
+            return
+
+        try:
+            curve, rhos, MW = self.dpm.read_inputs()
+            uncertainty = self.read_uncertainty()
+            samples, requested = self.read_samples()
+        except ValueError as e:
+            self.clear("No uncertainty bands: %s" % e)
+            return
+
+        DP = np.logspace(np.log10(curve['dp_min']), np.log10(curve['dp_max']), self._points)
+        args = dict(P1=curve['P1'], rho=curve['rho'], mu=curve['mu'], k=curve['k'], D=curve['D'], D2=curve['D2'],
+                    meter_type=curve['meter_type'], taps=curve['taps'], tap_position=curve['tap_position'],
+                    DP=DP, dp_span=curve['dp_max'], uncertainty=uncertainty,
+                    samples=samples, percentiles=self._percentiles, seed=0)
+
+        start = time.perf_counter()
+        self._samples = samples, requested
+
+        # Other views update with the curve too, only new inputs are sampled again
+        key = repr(sorted((name, value) for name, value in args.items() if name != 'DP'))
+        if self._bands is not None and self._bands[0] == key:
+            self.apply_bands(generation, start, key, DP, rhos, MW, self._bands[1])
+            return
+
+        # On the compute pool when there is one, a busy pool is retried and then reported
+        self.dpm.submit_view(self, partial(self.apply_bands, generation, start, key, DP, rhos, MW),
+                             partial(self._failed, generation), flow_percentiles, **args)
+
+    def _failed(self, generation, message):
+        if generation == self._generation:
+            self.clear("No uncertainty bands: %s" % message)
+
+    def apply_bands(self, generation, start, key, DP, rhos, MW, bands):
+        """Show mass flow percentiles in the display unit"""
+
+        if generation != self._generation:
+            return
+
+        self._bands = key, bands
+        percentiles, discarded = bands
+        samples, requested = self._samples
+
+        low, median, high = (self.dpm.display_flow(band, rhos, MW) for band in percentiles)
+        self.source.data = dict(x=DP, low=low, median=median, high=high)
+        self.show_legend(True)
+
+        self.status.text = "%d samples x %d points in %.0f ms" % (samples, DP.size,
+                                                                 (time.perf_counter() - start)*1000)
+        if samples < requested:
+            self.status.text += ", limited to %d samples" % MAX_SAMPLES
+        if discarded:
+            self.status.text += ", %d of %d sample solutions without a result left out" % (discarded,
+                                                                                          samples*DP.size)
@@ -0,0 +1,114 @@
+'''
+Work done once per server process instead of once per session.
+
+    load_theme()    the parsed theme.yaml, shared by every document
+    warm_up()       imports the fluids/scipy code paths, loads the compiled
+                    solver kernels when numba is installed, solves the curves
+                    of the default inputs into the shared curve cache (every
+                    meter type, for the comparison view) and starts the
+                    compute pool workers
+
+Called from DP_METER_SOLVER/app_hooks.py on_server_loaded, so the
+first session does not pay for it either.  A new session's
+dpm.update_data then only reads the default curve from the cache; the cached
+arrays are read only and shared, not copied, between sessions.
+
+Session construction time, cold and warmed up:
+
+    python benchmarks/session.py
+'''
+
+import os
+import time
+
+from bokeh.util.logconfig import bokeh_logger as lg
+
+
+THEME_FILE = '/app/openet/theme.yaml'
+
+_theme = None
+
+
+def load_theme(filename=None):
+    """Theme of the apps, parsed on first use. Falls back to the copy next to
+    this module when the Docker path does not exist"""
+
+    global _theme
+
+    if _theme is None:
+        from bokeh.themes import Theme
+
+        filename = filename or THEME_FILE
+        if not os.path.exists(filename):
+            filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'theme.yaml')
+        _theme = Theme(filename=filename)
+
+    return _theme
+
+
+def default_curve():
+    """mass_flow_curve arguments of a new dPMeterSolver, read off a throwaway document"""
+
+    from bokeh.document import Document
+    from bokeh.io.doc import set_curdoc, curdoc
+
+    from openet.dpmeter import dPMeterSolver
+
+    previous = curdoc()
+    set_curdoc(Document())
+    try:
+        curve, _, _ = dPMeterSolver(debounce=0).read_inputs()
+    finally:
+        set_curdoc(previous)
+
+    return curve
+
+
+def warm_worker(curve):
+    """Run in each pool worker, kernels and solver code paths of a fresh process"""
+
+    from openet.engine import solve_curves
+    from openet.engine.kernels import warm_up as warm_up_kernels
+
+    warm_up_kernels()
+    return solve_curves([curve])
+
+
+def warm_up(pool=None):
+    """Pre-solve the default curves into the shared cache and start the pool workers"""
+
+    from openet.constants import Meter_Type, Tap_Position
+    from openet.engine import curve_key, cache_curve, solve_curves, PoolBusy
+    from openet.engine.kernels import warm_up as warm_up_kernels
+    from openet.compare import ECCENTRIC_METERS
+
+    start = time.perf_counter()
+
+    load_theme()
+    kernels = warm_up_kernels()
+    curve = default_curve()
+
+    # Exact and surrogate curve of the default meter, the default curve
+    # of every other meter type as the comparison view asks for it
+    curves = [curve, dict(curve, surrogate=True)]
+    curves += [dict(curve, meter_type=meter_type,
+                    tap_position=Tap_Position[0] if meter_type in ECCENTRIC_METERS else None)
+               for meter_type in Meter_Type if meter_type not in (curve['meter_type'], 'unspecified meter')]
+
+    solved = 0
+    for args, result in zip(curves, solve_curves(curves)):
+        if not isinstance(result, str):
+            cache_curve(curve_key(**args), *result)
+            solved += 1
+
+    if pool is not None and pool.enabled:
+        # Spawns the workers, each imports and runs the solver once
+        for _ in range(pool.workers):
+            try:
+                pool.submit(warm_worker, curve)
+            except PoolBusy:
+                break
+
+    lg.info("Warmed up %d curves in %.0f ms (kernels %.0f ms)", solved, (time.perf_counter() - start)*1000,
+            kernels*1000)
+    return solved
@@ -7,4 +7,5 @@
 
 from setuptools import setup, find_packages
 
-setup(name='openet', version='0.1', packages=find_packages())
\ No newline at end of file
+setup(name='openet', version='0.1', packages=find_packages(),
+      entry_points={'console_scripts': ['openet = openet.cli:main']})
\ No newline at end of file
@@ -0,0 +1,62 @@
+import asyncio
+import inspect
+
+import pytest
+
+from openet.engine import pool
+
+
+@pytest.fixture(autouse=True)
+def headless_pool(monkeypatch):
+    """Every test starts without a compute pool, whatever ran before it or OPENET_POOL says"""
+
+    monkeypatch.setattr(pool, '_pool', pool.ComputePool(kind='none'))
+    return pool._pool
+
+
+class FakeDocument():
+    """Callback scheduling of a Bokeh document, run by hand with run_next_ticks and run_timeouts"""
+
+    def __init__(self):
+        self.next_ticks = []
+        self.timeouts = {}
+        self._handles = 0
+
+    def add_next_tick_callback(self, callback):
+        self._handles += 1
+        self.next_ticks.append((self._handles, callback))
+        return self._handles
+
+    def add_timeout_callback(self, callback, timeout_milliseconds):
+        self._handles += 1
+        self.timeouts[self._handles] = (timeout_milliseconds, callback)
+        return self._handles
+
+    def remove_timeout_callback(self, handle):
+        del self.timeouts[handle]
+
+    def run_next_ticks(self):
+        """Run the queued next tick callbacks, and the ones they queue, returns how many ran.
+        Coroutines (without_document_lock callbacks) run to completion on a new loop"""
+
+        ran = 0
+        while self.next_ticks:
+            _, callback = self.next_ticks.pop(0)
+            result = callback()
+            if inspect.iscoroutine(result):
+                asyncio.run(result)
+            ran += 1
+        return ran
+
+    def run_timeouts(self):
+        """Run the timeout callbacks due so far, returns how many ran"""
+
+        due, self.timeouts = self.timeouts, {}
+        for _, callback in due.values():
+            callback()
+        return len(due)
+
+
+@pytest.fixture
+def doc():
+    return FakeDocument()
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from openet.api import parse_request, solve_batch, flow_result, make_handler, MicroBatcher, RequestError
+from openet.engine.pool import ComputePool
+
+
+GOOD = dict(tag='FT-1', density=10, pressure=100, viscosity=0.01, orifice=2, pipe=4, dp=[10, 50])
+
+
+def test_bad_conversion_inputs_are_per_meter_errors():
+    meters, units = parse_request([GOOD, dict(GOOD, tag='FT-2', molecular='x'),
+                                   dict(GOOD, tag='FT-3', densitybase=0), dict(GOOD, tag='FT-4', molecular=float('nan'))])
+
+    assert len(meters[0]) == 4
+    assert [m[0] for m in meters[1:]] == ['FT-2', 'FT-3', 'FT-4']
+    assert all(len(m) == 2 for m in meters[1:])
+    assert 'molecular' in meters[1][1] and 'densitybase' in meters[2][1]
+
+    tag, base, inputs, DP = meters[0]
+    M, = solve_batch([(inputs, DP)])
+    result = flow_result(tag, base, inputs, DP, M, units)
+    assert result['error'] is None and all(m > 0 for m in result['mass_flow'])
+
+
+@pytest.mark.parametrize('units', [[1, 2], 'MSCFH', dict(gas_unit=['MSCFH'])])
+def test_units_must_be_an_object_of_names(units):
+    with pytest.raises(RequestError) as error:
+        parse_request(dict(meters=[GOOD], units=units))
+    assert error.value.status == 400
+
+
+def test_oversized_request_is_413():
+    with pytest.raises(RequestError) as error:
+        parse_request(dict(GOOD, dp=None, dp_min=1, dp_max=2, points=10**6))
+    assert error.value.status == 413
+
+
+class TestFlowHandler(AsyncHTTPTestCase):
+
+    def get_app(self):
+        batcher = MicroBatcher(window=0.001, pool=ComputePool(kind='none'))
+        return Application([(r'/api/flow', make_handler(batcher))])
+
+    def test_good_meters_next_to_bad_ones(self):
+        body = dict(meters=[GOOD, dict(GOOD, tag='FT-2', densitybase=0), dict(GOOD, tag='FT-3', molecular='x')])
+        response = self.fetch('/api/flow', method='POST', body=json.dumps(body))
+        assert response.code == 200
+
+        results = json.loads(response.body)['results']
+        assert results[0]['error'] is None and np.all(np.array(results[0]['mass_flow']) > 0)
+        assert results[1]['error'] and results[2]['error']
+
+    def test_units_not_an_object(self):
+        response = self.fetch('/api/flow', method='POST', body=json.dumps(dict(meters=[GOOD], units=[1])))
+        assert response.code == 400 and b'units must be an object' in response.body
+
+
+class BusyPool():
+    enabled = True
+
+    def submit(self, fn, *args, **kwargs):
+        from openet.engine import PoolBusy
+        raise PoolBusy("full")
+
+
+class TestBusyPool(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r'/api/flow', make_handler(MicroBatcher(window=0.001, pool=BusyPool())))])
+
+    def test_busy_pool_is_a_503_not_an_inline_solve(self):
+        from openet import api
+
+        def on_event_loop(items):
+            raise AssertionError("solved on the event loop")
+
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(api, 'solve_batch', on_event_loop)
+            response = self.fetch('/api/flow', method='POST', body=json.dumps([GOOD, dict(GOOD, tag='FT-2')]))
+
+        assert response.code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert b'compute pool busy' in response.body
+
+
+def test_default_port_is_not_the_udp_source_port():
+    from openet import api, sources
+    import inspect
+
+    assert api.DEFAULT_PORT not in (5006, inspect.signature(sources.UDPSource).parameters['port'].default)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from fluids.flow_meter import differential_pressure_meter_solver
+
+from openet.engine.batch import solve_mass_flow, BATCH_METER_TYPES, METER_ALIASES
+from openet.engine.units import psi, inch, INWC
+
+
+METERS = sorted(BATCH_METER_TYPES | set(METER_ALIASES))
+
+
+def reference(D, D2, P1, P2, rho, mu, k, meter_type, taps):
+    return np.array([differential_pressure_meter_solver(D=D, D2=D2, P1=P1, P2=p2, rho=rho, mu=mu, k=k,
+                                                        meter_type=meter_type, taps=taps)
+                     for p2 in P2])
+
+
+@pytest.mark.parametrize('meter_type', METERS)
+def test_batch_solver_matches_fluids(meter_type):
+    D, D2, P1, rho, mu, k = 4*inch, 2*inch, (100 + 14.7)*psi, 10.0, 1e-5, 1.3
+    P2 = P1 - np.logspace(0, np.log10(250), 12)*INWC
+
+    m = solve_mass_flow(D, D2, P1, P2, rho, mu, k, meter_type=meter_type, taps='flange')
+
+    assert m.shape == P2.shape
+    # The aliases are names fluids gives the same correlation, or misspells
+    expected = reference(D, D2, P1, P2, rho, mu, k, METER_ALIASES.get(meter_type, meter_type), 'flange')
+    assert np.allclose(m, expected, rtol=1e-9, atol=0.0)
+
+
+@pytest.mark.parametrize('taps', ['corner', 'flange', 'D and D/2'])
+def test_orifice_taps_and_broadcasting(taps):
+    D = np.array([2*inch, 4*inch, 8*inch])[:, None]
+    D2 = 0.5*D
+    P1 = 8e5
+    P2 = P1 - np.array([10.0, 100.0])[None, :]*INWC
+
+    m = solve_mass_flow(D, D2, P1, P2, 800.0, 1e-3, 1.3, meter_type='ISO 5167 orifice', taps=taps)
+
+    assert m.shape == (3, 2)
+    for i in range(3):
+        expected = reference(D[i, 0], D2[i, 0], P1, P2[0], 800.0, 1e-3, 1.3, 'ISO 5167 orifice', taps)
+        assert np.allclose(m[i], expected, rtol=1e-9, atol=0.0)
+
+
+def test_other_meter_types_fall_back_to_fluids():
+    D, D2, P1 = 4*inch, 2*inch, 8e5
+    P2 = P1 - np.array([10.0, 100.0])*INWC
+
+    m = solve_mass_flow(D, D2, P1, P2, 10.0, 1e-5, 1.3, meter_type='cone meter')
+
+    assert np.allclose(m, reference(D, D2, P1, P2, 10.0, 1e-5, 1.3, 'cone meter', None), rtol=1e-12)
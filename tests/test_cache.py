@@ -0,0 +1,37 @@
+import numpy as np
+
+from openet.engine.cache import CurveCache, curve_key, cache_curve, curve_cache, mass_flow_curve
+
+
+CURVE = dict(P1=8e5, rho=10.0, mu=1e-5, k=1.3, D=0.1, D2=0.05, meter_type='ISO 5167 orifice', taps='flange',
+             tap_position=None, dp_min=1.0, dp_max=250.0, points=25)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CurveCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats() == dict(hits=3, misses=1, evictions=1, size=2, maxsize=2)
+
+
+def test_keys_ignore_text_noise():
+    assert curve_key(**CURVE) == curve_key(**dict(CURVE, P1=8e5 + 1e-9, dp_max=250))
+    assert curve_key(**CURVE) != curve_key(**dict(CURVE, tolerance=1e-3))
+
+
+def test_cached_curves_are_read_only_and_shared():
+    curve_cache.clear()
+    DP, M = mass_flow_curve(**CURVE)
+
+    assert not DP.flags.writeable and not M.flags.writeable
+    assert mass_flow_curve(**CURVE)[1] is M
+
+    DP, M = cache_curve(('test',), np.ones(3), np.zeros(3))
+    cached = curve_cache.get(('test',))
+    assert cached[0] is DP and cached[1] is M
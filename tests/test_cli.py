@@ -0,0 +1,44 @@
+import csv
+import argparse
+
+from openet.cli import evaluate_chunk, run
+
+
+GOOD = dict(tag='FT-1', density='10', pressure='100', viscosity='0.01', orifice='2', pipe='4')
+
+
+def test_bad_row_is_reported_in_its_error_column():
+    rows = [GOOD, dict(GOOD, tag='FT-2', molecular='abc'), dict(GOOD, tag='FT-3', densitybase='0')]
+
+    out = evaluate_chunk(rows, 'curve', 1.0, 250.0, 4)
+
+    good = [r for r in out if r['tag'] == 'FT-1']
+    assert len(good) == 5 and all(r['error'] is None and r['mass_flow'] > 0 for r in good)
+
+    errors = {r['tag']: r['error'] for r in out if r['tag'] != 'FT-1'}
+    assert 'molecular' in errors['FT-2']
+    assert 'densitybase' in errors['FT-3']
+
+
+def test_run_writes_good_rows_around_a_bad_one(tmp_path):
+    source = tmp_path / 'tags.csv'
+    with open(source, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(GOOD) + ['molecular', 'dp'])
+        writer.writeheader()
+        writer.writerow(dict(GOOD, dp='50'))
+        writer.writerow(dict(GOOD, tag='FT-2', molecular='abc', dp='50'))
+        writer.writerow(dict(GOOD, tag='FT-3', dp='50'))
+
+    output = tmp_path / 'results.csv'
+    args = argparse.Namespace(input=str(source), output=str(output), mode='point', dp_min=1.0, dp_max=250.0,
+                              points=25, gas_unit='MSCFH', liquid_unit='MBPD', standard='15C', chunk_size=2,
+                              workers=1)
+    tags, _ = run(args, log=open('/dev/null', 'w'))
+
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    assert tags == 3
+    assert [r['tag'] for r in rows] == ['FT-1', 'FT-2', 'FT-3']
+    assert rows[1]['error'] and not rows[1]['mass_flow']
+    assert float(rows[0]['mass_flow']) > 0 and float(rows[2]['mass_flow']) > 0
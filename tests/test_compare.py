@@ -0,0 +1,43 @@
+import asyncio
+
+from openet.engine import PoolBusy
+
+
+class BusyPool():
+    """Compute pool whose queue is always full"""
+
+    enabled = True
+    workers = 2
+
+    def __init__(self):
+        self.submits = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submits += 1
+        raise PoolBusy("full")
+
+
+def test_busy_pool_is_retried_not_solved_on_the_event_loop(monkeypatch):
+    from openet import compare
+    from openet.dpmeter import dPMeterSolver
+
+    def on_event_loop(curves):
+        raise AssertionError("solved on the event loop")
+
+    monkeypatch.setattr(compare, 'solve_curves', on_event_loop)
+    monkeypatch.setattr(compare, 'BUSY_RETRIES', (0.0, 0.0))
+
+    dpm = dPMeterSolver(debounce=0)
+    view = compare.dPMeterCompare(dpm)
+    dpm._pool = BusyPool()
+
+    applied = []
+    monkeypatch.setattr(view, 'apply_curves', lambda *args: applied.append(args))
+    monkeypatch.setattr(dpm._doc, 'add_next_tick_callback', lambda callback: callback())
+
+    chunks = [[('ISO 5167 orifice', ('key',), {})]]
+    asyncio.run(view._await_curves(view._generation, 0.0, 1000.0, 2.0, {}, chunks, [None]))
+
+    assert dpm._pool.submits == 2
+    todo, results = applied[0][-2:]
+    assert results == ["compute pool busy"]
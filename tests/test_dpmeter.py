@@ -0,0 +1,243 @@
+import numpy as np
+import pytest
+
+from openet.engine import cache_curve
+
+
+@pytest.fixture
+def dpm():
+    from openet.dpmeter import dPMeterSolver
+    return dPMeterSolver(debounce=0)
+
+
+def test_push_columns_patches_copies_of_cached_arrays(dpm):
+    DP, M = cache_curve(('test', 1), np.linspace(1.0, 10.0, 10), np.linspace(0.1, 1.0, 10))
+    dpm.push_columns(dict(x=DP, kg=M))
+
+    # One changed row is sent as a patch
+    DP2, M2 = cache_curve(('test', 2), DP.copy(), M.copy())
+    M2.setflags(write=True)
+    M2[3] = 5.0
+    M2.setflags(write=False)
+    dpm.push_columns(dict(x=DP2, kg=M2))
+
+    assert dpm.source.data['kg'][3] == 5.0
+    assert M[3] == pytest.approx(0.4)
+    assert not M.flags.writeable
+
+
+def test_push_columns_with_store_buffers(dpm):
+    DP = np.frombuffer(np.linspace(1.0, 10.0, 10).tobytes())
+    M = np.frombuffer(np.linspace(0.1, 1.0, 10).tobytes())
+    dpm.push_columns(dict(x=DP, kg=M))
+    dpm.push_columns(dict(x=DP, kg=np.where(np.arange(10) == 0, 2.0, M)))
+
+    assert dpm.source.data['kg'][0] == 2.0 and M[0] == pytest.approx(0.1)
+
+
+def test_default_curve_is_the_fixed_log_grid(dpm):
+    dpm.update_data(None, None, None)
+
+    x = dpm.source.data['x']
+    assert len(x) == dpm._plotpoint + 1
+    assert np.allclose(np.diff(np.log(x)), np.log(250.0)/dpm._plotpoint)
+
+
+def test_adaptive_sampling_is_opt_in(dpm):
+    dpm._tolerance = 1e-3
+    dpm.update_data(None, None, None)
+
+    assert len(dpm.source.data['x']) != dpm._plotpoint + 1
+
+
+def test_a_burst_of_changes_is_one_debounced_update(doc, monkeypatch):
+    from openet.dpmeter import dPMeterSolver
+
+    flushes = []
+    monkeypatch.setattr(dPMeterSolver, 'update_data', lambda self, attr, old, new: flushes.append(self._generation))
+
+    dpm = dPMeterSolver(debounce=0.25)
+    dpm._doc = doc
+
+    for value in ('10', '11', '12'):
+        dpm.density.value = value
+        dpm.request_update('value', None, value)
+
+    assert dpm._generation == 3
+    assert len(doc.timeouts) == 1 and list(doc.timeouts.values())[0][0] == 250
+
+    doc.run_timeouts()
+    assert flushes == [3]
+    assert dpm._pending is None and not doc.timeouts
+
+
+def test_changes_within_a_tick_are_one_update(doc, monkeypatch):
+    from openet.dpmeter import dPMeterSolver
+
+    flushes = []
+    monkeypatch.setattr(dPMeterSolver, 'update_data', lambda self, attr, old, new: flushes.append(self._generation))
+
+    dpm = dPMeterSolver(debounce=0)
+    dpm._doc = doc
+
+    dpm.request_update(None, None, None)
+    dpm.request_update(None, None, None)
+
+    assert doc.run_next_ticks() == 1
+    assert flushes == [2]
+
+    dpm.request_update(None, None, None)
+    doc.run_next_ticks()
+    assert flushes == [2, 3]
+
+
+class InlinePool():
+    """Compute pool running every submit straight away, busy for the first `busy` submits"""
+
+    enabled = True
+    workers = 1
+
+    def __init__(self, busy=0):
+        self.busy = busy
+        self.solved = []
+
+    def submit(self, fn, *args, **kwargs):
+        from concurrent.futures import Future
+        from openet.engine import PoolBusy
+
+        if self.busy:
+            self.busy -= 1
+            raise PoolBusy("full")
+
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        self.solved.append(kwargs.get('rho'))
+        return future
+
+
+@pytest.fixture
+def pooled(doc, monkeypatch):
+    """dPMeterSolver on an InlinePool and the fake document, with the densities of the curves pushed"""
+
+    from openet.engine import curve_cache
+    from openet.dpmeter import dPMeterSolver
+
+    curve_cache.clear()
+
+    pushed = []
+    apply_curve = dPMeterSolver.apply_curve
+
+    def record(self, generation, curve, *args):
+        if generation == self._generation:
+            pushed.append(curve['rho'])
+        return apply_curve(self, generation, curve, *args)
+
+    monkeypatch.setattr(dPMeterSolver, 'apply_curve', record)
+
+    dpm = dPMeterSolver(debounce=0)
+    dpm._doc = doc
+    dpm._pool = InlinePool()
+    return dpm, pushed
+
+
+class BrokenView():
+    plot = None
+
+    def __init__(self, dpm):
+        self.dpm = dpm
+        self.solved_before = None
+
+    def update_data(self, attr, old, new):
+        self.solved_before = list(self.dpm._pool.solved)
+        raise RuntimeError("view failed")
+
+
+def test_a_failing_view_does_not_stop_the_curve(pooled, doc):
+    dpm, pushed = pooled
+    view = BrokenView(dpm)
+    dpm.add_view(view)
+    dpm.add_view(BrokenView(dpm))
+
+    dpm.density.value = '20'
+    dpm.request_update(None, None, None)
+    doc.run_next_ticks()
+
+    assert view.solved_before == [20.0]
+    assert pushed == [20.0]
+    assert len(dpm.source.data['x']) == dpm._plotpoint + 1
+
+
+def test_bad_inputs_still_update_the_views(pooled, doc):
+    dpm, pushed = pooled
+    view = BrokenView(dpm)
+    dpm.add_view(view)
+
+    dpm.density.value = 'dense'
+    dpm.request_update(None, None, None)
+    doc.run_next_ticks()
+
+    assert view.solved_before == [] and pushed == []
+
+
+def test_changes_during_a_solve_rerun_and_the_stale_curve_is_dropped(pooled, doc):
+    dpm, pushed = pooled
+
+    dpm.density.value = '20'
+    dpm.request_update(None, None, None)
+    doc.next_ticks.pop(0)[1]()
+    assert dpm._inflight
+
+    # Arrives while the first solve is out, queued behind its result
+    dpm.density.value = '30'
+    dpm.request_update(None, None, None)
+    doc.run_next_ticks()
+
+    assert dpm._pool.solved == [20.0, 30.0]
+    assert pushed == [30.0]
+    assert not dpm._inflight and not dpm._rerun
+
+
+def test_busy_pool_is_retried(pooled, doc):
+    dpm, pushed = pooled
+    dpm._pool.busy = 1
+
+    dpm.request_update(None, None, None)
+    doc.run_next_ticks()
+    assert pushed == [] and dpm._pending in doc.timeouts
+
+    # Folded into the retry already queued
+    dpm.request_update(None, None, None)
+    assert not doc.next_ticks
+
+    doc.run_timeouts()
+    doc.run_next_ticks()
+    assert pushed == [775.0] and dpm._pending is None
+
+
+def test_rerun_keeps_a_queued_debounce(pooled, doc):
+    dpm, pushed = pooled
+    dpm._debounce = 0.25
+
+    dpm.density.value = '20'
+    dpm.request_update(None, None, None)
+    doc.run_timeouts()
+    assert dpm._inflight
+
+    # Flushed while the solve is out, then one more change still in its debounce window
+    dpm.density.value = '30'
+    dpm.request_update(None, None, None)
+    doc.run_timeouts()
+    assert dpm._rerun
+
+    dpm.density.value = '40'
+    dpm.request_update(None, None, None)
+    queued = dpm._pending
+
+    doc.run_next_ticks()
+    assert dpm._pool.solved == [20.0]
+    assert dpm._pending == queued and queued in doc.timeouts
+
+    doc.run_timeouts()
+    doc.run_next_ticks()
+    assert dpm._pool.solved == [20.0, 40.0] and pushed == [40.0]
+    assert not doc.timeouts
@@ -0,0 +1,207 @@
+import numpy as np
+import pytest
+
+from openet.engine.historian import lttb, replay, daily_totals, ReplaySeries, HOUR
+
+
+CURVE = dict(P1=8e5, rho=10.0, mu=1e-5, k=1.3, D=0.1, D2=0.05, meter_type='ISO 5167 orifice', taps='flange',
+             tap_position=None)
+
+
+def test_lttb_keeps_ends_and_one_point_per_bucket():
+
+    t = np.arange(1000.0)
+    y = np.sin(t/50.0)
+    index = lttb(t, y, 50)
+
+    assert index.size == 50
+    assert index[0] == 0 and index[-1] == 999
+    assert (np.diff(index) > 0).all()
+
+
+def test_lttb_keeps_a_spike():
+
+    t = np.arange(10000.0)
+    y = np.zeros(t.size)
+    y[4321] = 100.0
+
+    assert 4321 in lttb(t, y, 20)
+
+
+def test_lttb_survives_nan():
+
+    t = np.arange(100.0)
+    y = np.ones(t.size)
+    y[10:20] = np.nan
+
+    index = lttb(t, y, 10)
+    assert index.size == 10 and (np.diff(index) > 0).all()
+
+
+@pytest.mark.parametrize('points, expected', [(5, [0, 1, 2, 3, 4]), (10, [0, 1, 2, 3, 4]),
+                                              (2, [0, 4]), (1, [0]), (0, [])])
+def test_lttb_short_series(points, expected):
+
+    t = np.arange(5.0)
+    assert lttb(t, t, points).tolist() == expected
+
+
+def _record(path, t, dp):
+
+    with open(path, 'w') as f:
+        f.write('time,dp\n')
+        for ti, dpi in zip(t, dp):
+            f.write('%r,%r\n' % (ti, dpi))
+
+
+def test_replay_totals_do_not_depend_on_chunking(tmp_path):
+
+    t = np.arange(0.0, 2*86400.0, 600.0)
+    dp = 50.0 + 20.0*np.sin(t/7200.0)
+    dp[::17] = 0.0
+    _record(tmp_path/'record.csv', t, dp)
+
+    whole = replay(str(tmp_path/'record.csv'), CURVE, str(tmp_path/'whole.bin'))
+    chunked = replay(str(tmp_path/'record.csv'), CURVE, str(tmp_path/'chunked.bin'), chunk_rows=7)
+
+    assert whole['rows'] == chunked['rows'] == t.size
+    assert whole['failed'] == chunked['failed'] == 0
+    assert [h[0] for h in whole['hourly']] == [h[0] for h in chunked['hourly']]
+    np.testing.assert_allclose([h[1] for h in whole['hourly']], [h[1] for h in chunked['hourly']], rtol=1e-12)
+
+    # Every reading holds for its 600 s interval, the last has none
+    series = ReplaySeries(str(tmp_path/'whole.bin'))
+    kg = np.asarray(series._data['kg'])
+    assert sum(h[1] for h in whole['hourly']) == pytest.approx(600.0*kg[:-1].sum())
+    assert all(h[2] == HOUR for h in whole['hourly'][:-1])
+
+    days = daily_totals(whole['hourly'])
+    assert [d[0] for d in days] == [0.0, 86400.0]
+    assert sum(d[1] for d in days) == pytest.approx(sum(h[1] for h in whole['hourly']))
+    series.close()
+
+
+def test_replay_series_window(tmp_path):
+
+    t = np.arange(0.0, 10000.0)
+    _record(tmp_path/'record.csv', t, np.full(t.size, 40.0))
+    replay(str(tmp_path/'record.csv'), CURVE, str(tmp_path/'out.bin'))
+
+    series = ReplaySeries(str(tmp_path/'out.bin'))
+    assert len(series) == t.size
+
+    window = series.window(2000.0, 3000.0, 100)
+    assert window.size == 100
+    assert window['t'][0] <= 2000.0 and window['t'][-1] >= 3000.0
+    assert series.window(20000.0, 30000.0, 100).size <= 1
+    series.close()
+
+
+def test_replay_is_exact_unless_the_surrogate_is_asked_for(tmp_path):
+    from fluids import differential_pressure_meter_solver
+    from openet.engine.units import INWC
+
+    wedge = dict(CURVE, meter_type='wedge meter', D2=0.04)
+    t = np.arange(0.0, 3600.0, 600.0)
+    dp = np.array([0.0, 5.0, 50.0, 100.0, 150.0, 250.0])
+    _record(tmp_path/'record.csv', t, dp)
+
+    exact = replay(str(tmp_path/'record.csv'), wedge, str(tmp_path/'exact.bin'))
+    assert exact['solver'] == 'exact' and exact['max_error'] == 0.0
+
+    series = ReplaySeries(str(tmp_path/'exact.bin'))
+    expected = [differential_pressure_meter_solver(D=0.1, D2=0.04, P1=8e5, P2=8e5 - d*INWC, rho=10.0, mu=1e-5, k=1.3,
+                                                   meter_type='wedge meter', taps='flange') for d in dp[1:]]
+    np.testing.assert_allclose(series._data['kg'][1:], expected, rtol=1e-9)
+    series.close()
+
+    surrogate = replay(str(tmp_path/'record.csv'), dict(wedge, surrogate=True), str(tmp_path/'surrogate.bin'))
+    assert surrogate['solver'] == 'surrogate' and surrogate['max_error'] > 0.0
+
+    # Batched meter types have no table to interpolate
+    orifice = replay(str(tmp_path/'record.csv'), dict(CURVE, surrogate=True), str(tmp_path/'orifice.bin'))
+    assert orifice['solver'] == 'exact'
+
+
+def test_historian_files_are_denied_by_default(tmp_path):
+    from openet.historian import historian_path
+
+    (tmp_path/'record.csv').write_text('0,1\n')
+
+    with pytest.raises(ValueError, match='not enabled'):
+        historian_path('record.csv', directory='')
+    with pytest.raises(ValueError, match='not in the historian directory'):
+        historian_path('../' + tmp_path.name + '/record.csv', directory=str(tmp_path/'sub'))
+    assert historian_path('record.csv', directory=str(tmp_path)) == str((tmp_path/'record.csv').resolve())
+
+
+class BusyPool():
+    enabled = True
+    workers = 1
+
+    def __init__(self):
+        self.submits = 0
+
+    def submit(self, fn, *args, **kwargs):
+        from openet.engine import PoolBusy
+
+        self.submits += 1
+        raise PoolBusy("full")
+
+
+@pytest.fixture
+def view(tmp_path, monkeypatch):
+    from openet import historian
+    from openet.dpmeter import dPMeterSolver
+
+    monkeypatch.setattr(historian, 'HISTORIAN_DIR', str(tmp_path))
+    dpm = dPMeterSolver(debounce=0)
+    return historian.dPMeterHistorian(dpm)
+
+
+def test_view_replays_a_file(view, tmp_path):
+    _record(tmp_path/'record.csv', np.arange(0.0, 7200.0, 60.0), np.full(120, 40.0))
+    view.path.value = 'record.csv'
+    view.start_replay()
+
+    assert view.status.text.startswith("120 readings") and 'exact correlations' in view.status.text
+    assert len(view.totals.data['kg']) == 1
+
+
+def test_view_without_a_historian_directory(view, monkeypatch):
+    from openet import historian
+
+    monkeypatch.setattr(historian, 'HISTORIAN_DIR', None)
+    view.path.value = '/etc/passwd'
+    view.start_replay()
+
+    assert view.status.text == "Cannot replay: historian replay is not enabled on this server (OPENET_HISTORIAN_DIR)"
+
+
+def test_view_does_not_echo_reading_errors(view, tmp_path):
+    (tmp_path/'record.csv').write_text('secret\n')
+    view.path.value = 'record.csv'
+    view.start_replay()
+
+    assert view.status.text.startswith("Replay failed") and 'secret' not in view.status.text
+    assert str(tmp_path) not in view.status.text
+
+
+def test_view_busy_pool_is_not_replayed_inline(view, tmp_path, doc, monkeypatch):
+    from openet import dpmeter, historian
+
+    def on_event_loop(*args):
+        raise AssertionError("replayed on the event loop")
+
+    monkeypatch.setattr(historian, 'replay', on_event_loop)
+    monkeypatch.setattr(dpmeter, 'BUSY_RETRIES', (0.1,))
+    view.dpm._doc = doc
+    view.dpm._pool = BusyPool()
+
+    _record(tmp_path/'record.csv', [0.0], [1.0])
+    view.path.value = 'record.csv'
+    view.start_replay()
+    doc.run_timeouts()
+
+    assert view.dpm._pool.submits == 2
+    assert 'compute pool busy' in view.status.text
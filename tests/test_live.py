@@ -0,0 +1,133 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from openet.engine import PoolBusy, solve_readings
+
+
+class Readings():
+    """Live source handing out two readings a poll"""
+
+    def __init__(self):
+        self.polls = 0
+
+    def read(self, limit=1000):
+        self.polls += 1
+        return [(1000.0 + self.polls, 0.0), (1000.5 + self.polls, 50.0)]
+
+    def close(self):
+        pass
+
+
+class Pool():
+    enabled = True
+    workers = 1
+
+    def __init__(self, busy=0):
+        self.busy = busy
+        self.submits = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submits += 1
+        if self.busy:
+            raise PoolBusy("full")
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+@pytest.fixture
+def live(doc, monkeypatch):
+    """A dPMeterLive streaming from Readings, as update_live leaves it"""
+
+    from openet import live
+    from openet.dpmeter import dPMeterSolver
+
+    dpm = dPMeterSolver(debounce=0)
+    view = live.dPMeterLive(dpm)
+    dpm._doc = doc
+
+    view._reader = Readings()
+    view._callback = 'poll'
+    view.update_data(None, None, None)
+    return view
+
+
+def test_readings_are_streamed(live):
+    live.poll()
+
+    assert list(live.source.data['dp']) == [0.0, 50.0]
+    assert live.source.data['kg'][0] == 0.0 and live.source.data['kg'][1] > 0.0
+    assert live.status.text.startswith("Streaming") and 'not solved' not in live.status.text
+
+
+def test_bad_inputs_are_reported_not_raised(live):
+    live.dpm.density.value = 'dense'
+    live.update_data(None, None, None)
+    live.poll()
+
+    assert 'readings not solved' in live.status.text
+    assert len(live.source.data['t']) == 0
+
+
+def test_a_meter_that_does_not_solve_stops_solving(live, monkeypatch):
+    from openet import live as module
+
+    calls = []
+
+    def solve(*args, **kwargs):
+        calls.append(1)
+        return solve_readings(*args, **kwargs)
+
+    monkeypatch.setattr(module, 'solve_readings', solve)
+
+    live.dpm.meter_select.value = 'unspecified meter'
+    live.update_data(None, None, None)
+    live.poll()
+    live.poll()
+
+    assert calls == [1]
+    assert 'C_specified' in live.status.text
+
+    # New inputs are solved again
+    live.dpm.meter_select.value = 'ISO 5167 orifice'
+    live.update_data(None, None, None)
+    live.poll()
+    assert len(live.source.data['t']) == 2 and 'not solved' not in live.status.text
+
+
+def test_readings_are_solved_on_the_pool(live, doc):
+    live.dpm._pool = Pool()
+    live.poll()
+
+    # Waits for the first solve, the source keeps the new readings
+    live.poll()
+    assert live._reader.polls == 1
+
+    doc.run_next_ticks()
+    assert live.dpm._pool.submits == 1 and len(live.source.data['t']) == 2
+
+
+def test_busy_pool_is_not_solved_on_the_event_loop(live, doc, monkeypatch):
+    from openet import dpmeter, live as module
+
+    def on_event_loop(*args, **kwargs):
+        raise AssertionError("solved on the event loop")
+
+    monkeypatch.setattr(module, 'solve_readings', on_event_loop)
+    monkeypatch.setattr(dpmeter, 'BUSY_RETRIES', (0.1,))
+    live.dpm._pool = Pool(busy=1)
+
+    live.poll()
+    doc.run_timeouts()
+
+    assert live.dpm._pool.submits == 2
+    assert live.status.text.endswith("compute pool busy")
+    assert not live._inflight and live._inputs is not None
+
+
+def test_solve_readings_has_no_flow_at_zero():
+    M = solve_readings(np.array([-1.0, 0.0, 10.0]), P1=8e5, rho=10.0, mu=1e-5, k=1.3, D=0.1, D2=0.05,
+                       meter_type='ISO 5167 orifice', taps='flange')
+    assert M[0] == M[1] == 0.0 and M[2] > 0.0
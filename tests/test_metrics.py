@@ -0,0 +1,116 @@
+import re
+
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from openet.metrics import Registry, Counter, Gauge, Histogram, make_handler, timed, REGISTRY
+
+
+# name{labels} value, as in the Prometheus text exposition format 0.0.4
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """{name: (help, type)} and [(name, labels, value)] of an exposition, checking its layout"""
+
+    assert text.endswith('\n')
+
+    families, samples = {}, []
+    family = None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name, help = line[7:].split(' ', 1)
+            assert name not in families
+            families[name] = [help, None]
+            family = name
+        elif line.startswith('# TYPE '):
+            name, kind = line[7:].split(' ')
+            assert name == family and kind in ('counter', 'gauge', 'histogram')
+            families[name][1] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            assert name == family or name.startswith(family + '_')
+            labels = tuple(LABEL.findall(labels or ''))
+            samples.append((name, labels, float(value)))
+
+    return {name: tuple(value) for name, value in families.items()}, samples
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+
+    calls = registry.register(Counter('test_calls_total', "Calls", ['meter_type']))
+    calls.labels('ISO 5167 orifice').inc()
+    calls.labels('ISO 5167 orifice').inc(2)
+    calls.labels('cone "meter"').inc()
+
+    registry.register(Gauge('test_sessions', "Sessions")).set(3)
+    registry.register(Gauge('test_memory_bytes', "Memory", function=lambda: 1024))
+
+    seconds = registry.register(Histogram('test_seconds', "Time", ['path'], buckets=(0.1, 1.0)))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        seconds.labels('pool').observe(value)
+
+    return registry
+
+
+def test_exposition_format(registry):
+    families, samples = parse(registry.render())
+
+    assert families == {'test_calls_total': ("Calls", 'counter'), 'test_sessions': ("Sessions", 'gauge'),
+                        'test_memory_bytes': ("Memory", 'gauge'), 'test_seconds': ("Time", 'histogram')}
+
+    values = {(name, labels): value for name, labels, value in samples}
+    assert values[('test_calls_total', (('meter_type', 'ISO 5167 orifice'),))] == 3.0
+    assert values[('test_calls_total', (('meter_type', 'cone \\"meter\\"'),))] == 1.0
+    assert values[('test_sessions', ())] == 3.0
+    assert values[('test_memory_bytes', ())] == 1024.0
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    _, samples = parse(registry.render())
+
+    buckets = [(labels, value) for name, labels, value in samples if name == 'test_seconds_bucket']
+    assert buckets == [((('path', 'pool'), ('le', '0.1')), 2.0),
+                       ((('path', 'pool'), ('le', '1.0')), 3.0),
+                       ((('path', 'pool'), ('le', '+Inf')), 4.0)]
+
+    values = {name: value for name, labels, value in samples if name in ('test_seconds_sum', 'test_seconds_count')}
+    assert values == {'test_seconds_sum': pytest.approx(5.65), 'test_seconds_count': 4.0}
+
+
+def test_timed_observes_the_block():
+    histogram = Histogram('test_block_seconds', "Block")
+    with timed(histogram.labels()):
+        pass
+
+    _, samples = parse(histogram.render() + '\n')
+    assert dict((name, value) for name, _, value in samples)['test_block_seconds_count'] == 1.0
+
+
+def test_server_registry_parses():
+    families, samples = parse(REGISTRY.render())
+
+    assert families['openet_callback_seconds'][1] == 'histogram'
+    assert families['openet_solver_calls_total'][1] == 'counter'
+    assert 'openet_curve_cache_hits' in families
+
+
+class TestMetricsHandler(AsyncHTTPTestCase):
+
+    def get_app(self):
+        registry = Registry()
+        registry.register(Counter('test_scrapes_total', "Scrapes")).inc()
+        return Application([(r'/metrics', make_handler(registry))])
+
+    def test_scrape(self):
+        response = self.fetch('/metrics')
+
+        assert response.code == 200
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert parse(response.body.decode())[1] == [('test_scrapes_total', (), 1.0)]
@@ -0,0 +1,112 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from openet.engine import PoolBusy
+from openet.engine.units import inch, INWC
+from openet.engine.sizing import sizing_grid, solve_bore
+from openet.engine.batch import solve_mass_flow
+
+
+class Pool():
+    """Compute pool running submits straight away, busy for the first `busy` of them"""
+
+    enabled = True
+    workers = 1
+
+    def __init__(self, busy=0):
+        self.busy = busy
+        self.submits = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submits += 1
+        if self.busy:
+            self.busy -= 1
+            raise PoolBusy("full")
+
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+@pytest.fixture
+def view():
+    from openet.dpmeter import dPMeterSolver
+    from openet.sizing import dPMeterSizing
+
+    dpm = dPMeterSolver(debounce=0)
+    view = dPMeterSizing(dpm)
+    view.plotsetup()
+    dpm.plot_column.children = [view.plot]
+    return view
+
+
+def test_grid_bore_passes_the_target_flow():
+    args = dict(D=4*inch, P1=8e5, rho=10.0, mu=1e-5, k=1.3, meter_type='ISO 5167 orifice', taps='flange')
+    grid = sizing_grid(m=1.0, dp_min=10.0, dp_max=200.0, n=10, **args)
+
+    assert grid['image'].shape == (10, 10)
+    assert solve_mass_flow(D2=grid['bore'], P2=8e5 - 200.0*INWC, **args) == pytest.approx(1.0, rel=1e-6)
+    assert np.allclose(grid['bore_line'], solve_bore(m=1.0, P2=8e5 - grid['axis']*INWC, **args))
+
+
+def test_sizing_reports_the_required_bore(view):
+    view.update_data(None, None, None)
+    assert 'Required bore' in view.result.text
+    assert len(view.source.data['image']) == 1
+
+
+@pytest.mark.parametrize('widget, value, message', [
+    ('target', 'lots', 'could not convert'),
+    ('target', '-5', 'positive'),
+    ('meter_select', 'unspecified meter', 'C_specified'),
+    ('meter_select', 'Hollingshead v cone', 'Convergence failed'),
+])
+def test_sizing_failures_are_reported(view, widget, value, message):
+    owner = view if widget == 'target' else view.dpm
+    getattr(owner, widget).value = value
+
+    view.update_data(None, None, None)
+
+    assert view.result.text.startswith("Cannot size") and message in view.result.text
+    assert view.source.data['image'] == []
+
+
+def test_sizing_failure_does_not_stop_the_curve(view):
+    view.dpm.meter_select.value = 'unspecified meter'
+    view.dpm.update_data(None, None, None)
+
+    assert 'C_specified' in view.result.text
+
+
+def test_sizing_runs_on_the_pool_and_gives_up_when_busy(view, doc, monkeypatch):
+    from openet import dpmeter, sizing
+
+    def on_event_loop(**args):
+        raise AssertionError("solved on the event loop")
+
+    monkeypatch.setattr(sizing, 'sizing_grid', on_event_loop)
+    monkeypatch.setattr(dpmeter, 'BUSY_RETRIES', (0.1, 0.2))
+    view.dpm._doc = doc
+    view.dpm._pool = Pool(busy=10)
+
+    view.update_data(None, None, None)
+    assert [timeout for timeout, _ in doc.timeouts.values()] == [100]
+    doc.run_timeouts()
+    doc.run_timeouts()
+
+    assert view.dpm._pool.submits == 3
+    assert view.result.text == "Cannot size: compute pool busy"
+
+
+def test_sizing_retries_a_busy_pool(view, doc):
+    view.dpm._doc = doc
+    view.dpm._pool = Pool(busy=1)
+
+    view.update_data(None, None, None)
+    doc.run_timeouts()
+    doc.run_next_ticks()
+
+    assert view.dpm._pool.submits == 2
+    assert 'Required bore' in view.result.text
@@ -0,0 +1,32 @@
+import pytest
+
+from openet.sources import open_source, SimulatedSource, FileTailSource
+
+
+def test_only_sim_is_open_by_default(tmp_path):
+    path = tmp_path / 'dp.csv'
+    path.write_text('')
+
+    assert isinstance(open_source('sim://?rate=5'), SimulatedSource)
+    for url in ['file://%s' % path, 'udp://0.0.0.0:5999', 'tcp://localhost:5998']:
+        with pytest.raises(ValueError, match='allowed'):
+            open_source(url, dirs=[], hosts=[])
+
+
+def test_file_source_stays_inside_the_allowed_directories(tmp_path):
+    allowed = tmp_path / 'live'
+    allowed.mkdir()
+    (allowed / 'dp.csv').write_text('')
+    (tmp_path / 'secret').write_text('')
+
+    source = open_source('file://%s' % (allowed / 'dp.csv'), dirs=[str(allowed)])
+    assert isinstance(source, FileTailSource)
+    source.close()
+
+    with pytest.raises(ValueError):
+        open_source('file://%s/../secret' % allowed, dirs=[str(allowed)])
+
+
+def test_hosts_match_name_and_port():
+    with pytest.raises(ValueError, match='allowed'):
+        open_source('tcp://internal:22', hosts=['historian:*', 'internal:5008'])
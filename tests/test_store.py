@@ -0,0 +1,91 @@
+import csv
+
+import numpy as np
+import pytest
+
+from openet.engine import curve_cache
+from openet.store import TagStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TagStore(str(tmp_path / 'tags.sqlite3'))
+    yield store
+    store.close()
+
+
+INPUTS = dict(density='10', Pi='100', viscosity='0.01', orifice='2', pipe='4', meter_select='ISO 5167 orifice',
+              tap_select='flange', tap_position='180 degree', DP_range=[1, 250])
+
+
+def test_save_load_round_trip(store):
+    DP, M = np.linspace(1.0, 250.0, 26), np.linspace(0.0, 1.0, 26)
+    store.save('FT-1', INPUTS, ('key', 1.0), DP, M)
+
+    saved = store.load('FT-1')
+    assert saved['inputs'] == INPUTS
+    assert saved['curve_key'] == repr(('key', 1.0))
+    assert np.array_equal(saved['DP'], DP) and np.array_equal(saved['M'], M)
+    assert store.load('FT-2') is None
+
+    store.save('FT-1', dict(INPUTS, density='20'))
+    saved = store.load('FT-1')
+    assert saved['inputs']['density'] == '20' and saved['DP'] is None and len(store) == 1
+
+
+def test_tags_by_prefix_and_rows_in_batches(store):
+    for tag in ['A-2', 'B-1', 'A-1', 'A-10']:
+        store.save(tag, INPUTS)
+
+    assert store.tags('A-') == ['A-1', 'A-10', 'A-2']
+    assert store.tags(limit=2) == ['A-1', 'A-10']
+    assert [row[0] for row in store.rows(batch=1)] == ['A-1', 'A-10', 'A-2', 'B-1']
+    store.delete('B-1')
+    assert store.tags() == ['A-1', 'A-10', 'A-2']
+
+
+def test_export_inputs_and_curves(store, tmp_path):
+    store.save('FT-1', INPUTS, None, np.array([1.0, 2.0]), np.array([0.1, 0.2]))
+    store.save('FT-2', INPUTS)
+
+    assert store.export(str(tmp_path / 'tags.csv')) == 2
+    with open(tmp_path / 'tags.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [r['tag'] for r in rows] == ['FT-1', 'FT-2']
+    assert rows[0]['pressure'] == '100' and rows[0]['meter_type'] == 'ISO 5167 orifice'
+
+    # The inputs export is the batch CLI's input format
+    from openet.cli import evaluate_chunk
+    assert all(r['error'] is None for r in evaluate_chunk(rows, 'curve', 1.0, 250.0, 4))
+
+    store.export(str(tmp_path / 'curves.csv'), curves=True)
+    with open(tmp_path / 'curves.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(r['tag'], float(r['dp']), float(r['mass_flow'])) for r in rows] == [('FT-1', 1.0, 0.1),
+                                                                                ('FT-1', 2.0, 0.2)]
+
+
+def test_save_tag_does_not_solve_in_the_callback(store, monkeypatch):
+    from openet import dpmeter
+
+    monkeypatch.setattr(dpmeter, 'get_store', lambda: store)
+    dpm = dpmeter.dPMeterSolver(debounce=0)
+
+    def solve(self, curve):
+        raise AssertionError("solved in the button callback")
+
+    curve_cache.clear()
+    dpm.text.value = 'FT-9'
+    with monkeypatch.context() as patch:
+        patch.setattr(dpmeter.dPMeterSolver, '_solve', solve)
+        dpm.save_tag()
+
+    saved = store.load('FT-9')
+    assert saved['inputs']['density'] == dpm.density.value and saved['DP'] is None
+
+    # The curve is stored when the update applies it
+    dpm.update_data(None, None, None)
+
+    saved = store.load('FT-9')
+    assert saved['DP'] is not None and np.array_equal(saved['M'], dpm.source.data['kg'])
+    assert dpm.tag_status.text == "Saved FT-9"
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+from openet.constants import Meter_Type
+from openet.engine import surrogate
+from openet.engine.batch import BATCH_METER_TYPES, METER_ALIASES
+from openet.engine.units import INWC, inch
+
+
+# Meter types the surrogate tabulates, the batched ones are always solved exactly
+TABULATED = [meter for meter in Meter_Type
+             if meter != 'unspecified meter' and METER_ALIASES.get(meter, meter) not in BATCH_METER_TYPES]
+
+WEDGES = ('wedge meter', 'Hollingshead wedge')
+
+D = 4*inch
+
+
+@pytest.fixture(scope='module')
+def tables(tmp_path_factory):
+    """Tables built once for the module, in a directory of their own"""
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(surrogate, 'SURROGATE_DIR', str(tmp_path_factory.mktemp('surrogate')))
+        patch.setattr(surrogate, '_surrogates', {})
+        yield surrogate.SURROGATE_DIR
+
+
+def _tap_position(meter_type):
+    return '180 degree' if 'eccentric' in meter_type else None
+
+
+@pytest.mark.parametrize('meter_type', TABULATED)
+def test_error_bound_against_fluids(tables, meter_type):
+    from fluids import differential_pressure_meter_solver
+
+    tap_position = _tap_position(meter_type)
+    tables = surrogate.get_surrogate(meter_type, 'flange', tap_position, D)
+
+    # Documented bounds of the default grids
+    assert tables.max_error < (0.36 if meter_type in WEDGES else 5e-3)
+
+    DP = np.logspace(0.0, np.log10(250.0), 12)*INWC
+    for P1 in (2e5, 35e5):
+        for D2 in (0.4*D, 0.65*D):
+            m = surrogate.solve_mass_flow_surrogate(D, D2, P1, P1 - DP, 10.0, 1e-5, 1.3, meter_type, 'flange',
+                                                    tap_position)
+            exact = [differential_pressure_meter_solver(D=D, D2=D2, P1=P1, P2=P1 - dp, rho=10.0, mu=1e-5, k=1.3,
+                                                        meter_type=meter_type, taps='flange',
+                                                        tap_position=tap_position) for dp in DP]
+
+            error = np.abs(m/exact - 1.0)
+            assert error.max() <= min(tables.max_error, 1.5e-4)
+
+
+def test_tables_are_saved_and_loaded_from_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(surrogate, 'SURROGATE_DIR', str(tmp_path))
+    monkeypatch.setattr(surrogate, '_surrogates', {})
+
+    built = surrogate.get_surrogate('Miller orifice', 'flange', None, D)
+    assert sorted(name.split('-')[0] for name in os.listdir(tmp_path)) == ['C', 'epsilon']
+
+    def build(*args):
+        raise AssertionError("table built again")
+
+    monkeypatch.setattr(surrogate, 'build_C_table', build)
+    monkeypatch.setattr(surrogate, 'build_epsilon_table', build)
+    monkeypatch.setattr(surrogate, '_surrogates', {})
+
+    loaded = surrogate.get_surrogate('Miller orifice', 'flange', None, D)
+    assert loaded is not built
+    assert np.array_equal(loaded.C, built.C, equal_nan=True)
+    assert np.array_equal(loaded.epsilon, built.epsilon, equal_nan=True)
+    assert loaded.max_error == built.max_error
+
+    # Same process, served from memory
+    assert surrogate.get_surrogate('Miller orifice', 'flange', None, D) is loaded
+
+
+def test_damaged_and_old_tables_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(surrogate, 'SURROGATE_DIR', str(tmp_path))
+
+    built = surrogate.Surrogate('cone meter', 'flange', None, D)
+    C_path = surrogate._path('C', 'cone meter', 'flange', None, '%.6g' % D)
+    with open(C_path, 'wb') as f:
+        f.write(b'not a table')
+
+    rebuilt = surrogate.Surrogate('cone meter', 'flange', None, D)
+    assert np.array_equal(rebuilt.C, built.C, equal_nan=True)
+    with np.load(C_path) as data:
+        assert np.array_equal(data['table'], built.C, equal_nan=True)
+
+    # A new table layout never reads the files of the old one
+    monkeypatch.setattr(surrogate, 'VERSION', surrogate.VERSION + 1)
+    surrogate.Surrogate('cone meter', 'flange', None, D)
+    assert len(os.listdir(tmp_path)) == 4
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from openet.engine.units import psi, inch
+from openet.engine.uncertainty import flow_percentiles, MAX_SAMPLES
+
+
+NOMINAL = dict(P1=(100 + 14.7)*psi, rho=10.0, mu=1e-5, k=1.3, D=4*inch, D2=2*inch, meter_type='ISO 5167 orifice',
+               taps='flange', tap_position=None, DP=np.array([10.0, 100.0]), dp_span=250.0,
+               uncertainty=dict(rho=('normal', 1.0)))
+
+
+def test_percentiles_and_discarded_count():
+    bands, discarded = flow_percentiles(samples=2000, seed=0, **NOMINAL)
+
+    assert bands.shape == (3, 2) and discarded == 0
+    assert np.all(bands[0] < bands[1]) and np.all(bands[1] < bands[2])
+
+
+def test_samples_are_limited():
+    with pytest.raises(ValueError):
+        flow_percentiles(samples=MAX_SAMPLES + 1, **NOMINAL)
+
+
+@pytest.fixture
+def view():
+    from openet.dpmeter import dPMeterSolver
+    from openet.uncertainty import dPMeterUncertainty
+
+    dpm = dPMeterSolver(debounce=0)
+    view = dPMeterUncertainty(dpm)
+    view.toggle.active = True
+    return view
+
+
+def test_bad_sample_count_is_reported(view):
+    view.samples.value = 'lots'
+    view.update_data(None, None, None)
+
+    assert 'whole number' in view.status.text
+    assert len(view.source.data['x']) == 0
+    assert view.legend is None
+
+
+def test_sample_count_is_clamped_and_legend_follows_the_band(view):
+    view.samples.value = str(10**9)
+    view.update_data(None, None, None)
+
+    assert 'limited to %d' % MAX_SAMPLES in view.status.text
+    assert view.legend is not None and view.legend.visible
+
+    view.toggle.active = False
+    view.update_data(None, None, None)
+    assert not view.legend.visible
+
+
+class BusyPool():
+    enabled = True
+    workers = 1
+
+    def __init__(self):
+        self.submits = 0
+
+    def submit(self, fn, *args, **kwargs):
+        from openet.engine import PoolBusy
+
+        self.submits += 1
+        raise PoolBusy("full")
+
+
+def test_busy_pool_is_retried_never_solved_inline(view, doc, monkeypatch):
+    from openet import dpmeter, uncertainty
+
+    def on_event_loop(**args):
+        raise AssertionError("solved on the event loop")
+
+    monkeypatch.setattr(uncertainty, 'flow_percentiles', on_event_loop)
+    monkeypatch.setattr(dpmeter, 'BUSY_RETRIES', (0.1, 0.25))
+    view.dpm._doc = doc
+    view.dpm._pool = BusyPool()
+
+    view.update_data(None, None, None)
+    assert [timeout for timeout, _ in doc.timeouts.values()] == [100]
+
+    doc.run_timeouts()
+    assert [timeout for timeout, _ in doc.timeouts.values()] == [250]
+
+    doc.run_timeouts()
+    assert view.dpm._pool.submits == 3 and not doc.timeouts
+    assert view.status.text == "No uncertainty bands: compute pool busy"
+
+
+def test_busy_retry_stops_when_the_inputs_change(view, doc, monkeypatch):
+    view.dpm._doc = doc
+    view.dpm._pool = BusyPool()
+
+    view.update_data(None, None, None)
+    view.toggle.active = False
+    view.update_data(None, None, None)
+    doc.run_timeouts()
+
+    assert view.dpm._pool.submits == 1
+    assert view.status.text == ""